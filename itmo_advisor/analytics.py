@@ -0,0 +1,290 @@
+# analytics.py
+import re, threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from domain import Course, detect_elective
+from registry import ProgramRegistry
+from repository import Repository
+from metrics import METRICS
+
+# подписи тегов курсов (curriculum_parser.TAG_KEYWORDS) и производной темы "ml"
+TAG_LABELS = {
+    "ml": "ML", "mlops": "MLOps", "production": "продакшн", "data": "данные", "cv": "компьютерное зрение",
+    "nlp": "NLP", "genai": "генеративный ИИ", "product": "продукт", "pm": "менеджмент",
+    "arch": "архитектура", "bigdata": "big data", "cloud": "облака",
+}
+# "ml" — не тег парсера: курс по машинному обучению узнаём по названию или ML-тегам
+_ML_TAGS = {"mlops", "cv", "nlp", "genai"}
+_ML_NAME_RE = re.compile(r"машинн|machine learning|\bml\b|нейросет|нейронн|глубок|deep learning")
+# слова вопроса -> тема; порядок — приоритет (первое совпадение)
+_TOPIC_WORDS = [
+    ("mlops", ("mlops",)),
+    ("cv", ("компьютерн", "зрени", "vision", "cv")),
+    ("nlp", ("nlp", "язык")),
+    ("genai", ("генератив", "llm")),
+    ("bigdata", ("big data", "больших данн", "большие данн")),
+    ("cloud", ("облач", "облак")),
+    ("arch", ("архитектур",)),
+    ("production", ("продакшн", "production")),
+    ("product", ("продукт",)),
+    ("pm", ("менеджм", "управлен")),
+    ("data", ("данн", "data")),
+    ("ml", ("ml", "машинн", "нейро")),
+]
+SEMESTER_UNKNOWN = "?"
+
+_COMPARE_RE = re.compile(r"разниц|различ|отлича|отличи|сравн|\bvs\b")
+# явная просьба сравнить: «сравни ai и ai_product», «разница между X и Y»
+_EXPLICIT_COMPARE_RE = re.compile(r"\bсравни(?:те)?\b|\bразниц\w*\s+между\s+\w.*\s+и\s+\w")
+# иначе сравнивают программы или планы целиком («чем отличаются программы», «ai vs ai_product»),
+# а не что-то внутри них («чем отличается экзамен от зачета»)
+_PROGRAMS_RE = re.compile(r"\bпрограмм(?:ы|ами|ах)\b|\bплан(?:ы|ами|ах|ов)\b")
+_COUNT_RE = re.compile(r"сколько")
+# «сколько» про курсы плана, а не про стоимость, сроки или места
+_COURSES_RE = re.compile(r"\bкурсов\b|\bдисциплин\b|\bэлектив(?:ов)?\b|\bз\.е\b|\bзачетных\b|\bects\b")
+_SEMESTER_RE = re.compile(r"(\d)\s*(?:-?[а-я]{1,3}\s+)?семестр|семестр\w*\s*(?:№\s*)?(\d)"
+                          r"|(перв|втор|трет|четв)\w*\s+семестр")
+_ORDINALS = {"перв": 1, "втор": 2, "трет": 3, "четв": 4}
+_WORD_RE = re.compile(r"\w+")
+
+@dataclass
+class Intent:
+    kind: str                       # compare | count | semester
+    topic: Optional[str] = None     # тема из TAG_LABELS, для count
+    semester: Optional[int] = None
+    programs: Tuple[str, ...] = ()  # две программы, названные в вопросе, для compare
+
+def match_intent(question: str, programs: Optional[ProgramRegistry] = None) -> Optional[Intent]:
+    """
+    Вопрос про агрегаты по планам («в чём разница между программами», «сравни ai и ai_product»,
+    «сколько ML-курсов», «что во 2 семестре»). Сравнение узнаём по явному «сравни»/«разница
+    между X и Y» или если вопрос со словом сравнения называет программы (словом «программы»
+    или двумя кодами/алиасами из programs), подсчёт — если вопрос про курсы: «сколько стоит
+    обучение» и «чем отличается экзамен от зачета» — для FAQ.
+    """
+    q = question.lower().replace("ё", "е")
+    m = _SEMESTER_RE.search(q)
+    if m:
+        return Intent("semester", semester=int(m.group(1) or m.group(2) or _ORDINALS[m.group(3)]))
+    explicit = _EXPLICIT_COMPARE_RE.search(q)
+    if explicit or _COMPARE_RE.search(q):
+        named = programs.mentions(q) if programs is not None else []
+        pair = tuple(named[:2]) if len(named) >= 2 else ()
+        if explicit or pair or _PROGRAMS_RE.search(q):
+            return Intent("compare", programs=pair)
+    if _COUNT_RE.search(q) and _COURSES_RE.search(q):
+        return Intent("count", topic=match_topic(q))
+    return None
+
+def match_topic(question: str) -> Optional[str]:
+    words = _WORD_RE.findall(question.lower())
+    for topic, stems in _TOPIC_WORDS:
+        # короткие слова (ml, cv, nlp) — только целиком, иначе «mlops» давал бы ml
+        if any(w.startswith(s) if len(s) > 3 else w == s for s in stems for w in words):
+            return topic
+        if any(" " in s and s in question.lower() for s in stems):
+            return topic
+    return None
+
+def course_topics(c: Course) -> List[str]:
+    topics = list(dict.fromkeys(c.tags or []))
+    if _ML_TAGS.intersection(topics) or _ML_NAME_RE.search(c.name.lower()):
+        topics.append("ml")
+    return topics
+
+def program_stats(courses: Iterable[Course]) -> dict:
+    """
+    Агрегаты плана: курсы, з.е., часы, обязательные/по выбору — всего и по семестрам,
+    распределение тем (тегов) курсов и названия курсов по семестрам.
+    """
+    def empty():
+        return {"courses": 0, "credits": 0.0, "hours": 0, "core": 0, "elective": 0, "tags": Counter()}
+
+    total, semesters, names = empty(), {}, {}
+    for c in courses:
+        key = str(c.semester) if c.semester else SEMESTER_UNKNOWN
+        sem = semesters.setdefault(key, empty())
+        kind = "elective" if detect_elective(c) else "core"
+        topics = course_topics(c)
+        for agg in (total, sem):
+            agg["courses"] += 1
+            agg["credits"] += c.credits or 0.0
+            agg["hours"] += c.hours or 0
+            agg[kind] += 1
+            agg["tags"].update(topics)
+        names.setdefault(key, []).append(c.name if kind == "core" else f"{c.name} (по выбору)")
+    for agg in (total, *semesters.values()):
+        agg["credits"] = round(agg["credits"], 1)
+        agg["tags"] = dict(agg["tags"].most_common())
+    total["semesters"] = {k: {**semesters[k], "names": names[k]} for k in sorted(semesters, key=_semester_order)}
+    return total
+
+def pair_stats(a: dict, b: dict) -> dict:
+    """Сравнение двух планов по темам: общие, только в первом/втором и мера сходства (Жаккар)."""
+    ta, tb = set(a["tags"]), set(b["tags"])
+    union = ta | tb
+    return {"common": sorted(ta & tb), "only_a": sorted(ta - tb), "only_b": sorted(tb - ta),
+            "jaccard": round(len(ta & tb) / len(union), 3) if union else 0.0}
+
+@dataclass
+class _Snapshot:
+    version: Optional[int] = None
+    stats: Dict[str, dict] = field(default_factory=dict)
+    pairs: Dict[Tuple[str, str], dict] = field(default_factory=dict)
+    names: Dict[str, str] = field(default_factory=dict)
+    codes: List[str] = field(default_factory=list)  # программы с агрегатами, в порядке программ
+
+    def __post_init__(self):
+        self.codes = [c for c in self.names if c in self.stats]
+
+    def name(self, code: str) -> str:
+        return self.names.get(code, code)
+
+    def pair(self, a: str, b: str) -> Optional[dict]:
+        if a <= b:
+            return self.pairs.get((a, b))
+        p = self.pairs.get((b, a))
+        return p and {**p, "only_a": p["only_b"], "only_b": p["only_a"]}
+
+class CurriculumAnalytics:
+    """
+    Материализованные агрегаты по учебным планам. refresh() (этап sync) считает их из
+    Repository.list_courses и сохраняет в program_stats/program_pairs; replace_courses
+    удаляет строки своей программы, так что пересчитывается только изменившийся план
+    и его пары. Запросы обслуживаются из снимка таблиц в памяти, который перечитывается
+    только при изменении курсов (Repository.courses_version).
+    """
+    def __init__(self, repo: Repository):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._snap = _Snapshot()
+
+    def stale(self) -> List[str]:
+        return self.repo.stale_stats_programs()
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """Пересчитывает агрегаты устаревших программ (force — всех) и их пары; возвращает коды."""
+        with METRICS.span("analytics.refresh"):
+            version = self.repo.courses_version()
+            codes = sorted({c.program_code for c in self.repo.list_courses()}) if force else self.stale()
+            if not codes:
+                return []
+            stats = {code: program_stats(self.repo.list_courses(code)) for code in codes}
+            known = {**({} if force else self.repo.list_program_stats()), **stats}
+            pairs = {}
+            for code in codes:
+                for other in known:
+                    if other != code:
+                        a, b = sorted((code, other))
+                        pairs[(a, b)] = pair_stats(known[a], known[b])
+            # план поменялся, пока считали, — не сохраняем: следующий refresh посчитает заново
+            if self.repo.courses_version() != version:
+                return []
+            self.repo.save_analytics(stats, pairs, replace_all=force)
+            return codes
+
+    def snapshot(self) -> _Snapshot:
+        """Снимок агрегатов; перечитывается из БД, только если курсы менялись."""
+        version = self.repo.courses_version()
+        snap = self._snap
+        if version == snap.version:
+            return snap
+        with self._lock:
+            if self._snap.version != version:
+                # бот мог опередить sync: досчитываем устаревшее здесь, один раз на изменение
+                self.refresh()
+                self._snap = _Snapshot(version, self.repo.list_program_stats(), self.repo.list_pair_stats(),
+                                       {p.code: p.name for p in self.repo.list_programs()})
+            return self._snap
+
+    def answer(self, intent: Intent, program_code: Optional[str] = None) -> Optional[str]:
+        """Ответ на вопрос-агрегат; None — данных нет (пусть отвечает поиск)."""
+        snap = self.snapshot()
+        codes = snap.codes
+        if not codes:
+            return None
+        if intent.kind == "semester":
+            return _semester_text(snap, [program_code] if program_code in snap.stats else codes, intent.semester)
+        if intent.kind == "count":
+            return _counts_text(snap, codes, intent.topic)
+        if len(intent.programs) == 2 and all(c in snap.stats for c in intent.programs):
+            return _compare_text(snap, *intent.programs)
+        others = [c for c in codes if c != program_code]
+        if program_code in snap.stats and len(others) == 1:
+            return _compare_text(snap, program_code, others[0])
+        if program_code not in snap.stats and len(codes) == 2:
+            return _compare_text(snap, *codes)
+        return _counts_text(snap, codes, None)
+
+    def compare(self, a: str, b: str) -> Optional[str]:
+        """Сравнение планов двух программ; None — у одной из них нет курсов."""
+        return _compare_text(self.snapshot(), a, b)
+
+def _compare_text(snap: _Snapshot, a: str, b: str) -> Optional[str]:
+    sa, sb, pair = snap.stats.get(a), snap.stats.get(b), snap.pair(a, b)
+    if sa is None or sb is None or pair is None:
+        return None
+    na, nb = snap.name(a), snap.name(b)
+    lines = [f"Сравнение планов: «{na}» и «{nb}»", ""]
+    for label, key in (("Курсов", "courses"), ("Зачётных единиц", "credits"), ("Часов", "hours"),
+                       ("Обязательных", "core"), ("По выбору", "elective")):
+        lines.append(f"{label}: {_num(sa[key])} и {_num(sb[key])}")
+    sems = sorted(set(sa["semesters"]) | set(sb["semesters"]), key=_semester_order)
+    if sems:
+        lines.append("По семестрам (курсов, з.е.):")
+        for s in sems:
+            lines.append(f"  {_semester_label(s)}: {_sem_brief(sa, s)} и {_sem_brief(sb, s)}")
+    if pair["common"]:
+        lines.append("Общие направления: " + _tag_list(pair["common"], sa, sb))
+    if pair["only_a"]:
+        lines.append(f"Только в «{na}»: " + _tag_list(pair["only_a"], sa))
+    if pair["only_b"]:
+        lines.append(f"Только в «{nb}»: " + _tag_list(pair["only_b"], sb))
+    lines.append(f"Сходство направлений: {round(pair['jaccard'] * 100)}%")
+    return "\n".join(lines)
+
+def _counts_text(snap: _Snapshot, codes: List[str], topic: Optional[str]) -> str:
+    lines = [f"Курсы по теме «{TAG_LABELS[topic]}»:" if topic else "Учебные планы:"]
+    for code in codes:
+        st = snap.stats[code]
+        if topic:
+            lines.append(f"• «{snap.name(code)}»: {st['tags'].get(topic, 0)} из {st['courses']} курсов")
+        else:
+            lines.append(f"• «{snap.name(code)}»: {st['courses']} курсов ({st['core']} обязательных, "
+                         f"{st['elective']} по выбору), {_num(st['credits'])} з.е., {st['hours']} ч.")
+    return "\n".join(lines)
+
+def _semester_text(snap: _Snapshot, codes: List[str], semester: int) -> str:
+    lines = []
+    for code in codes:
+        sem = snap.stats[code]["semesters"].get(str(semester))
+        if sem is None:
+            lines.append(f"«{snap.name(code)}», {semester} семестр: курсов в плане нет.")
+            continue
+        lines.append(f"«{snap.name(code)}», {semester} семестр: {sem['courses']} курсов ({sem['core']} обязательных, "
+                     f"{sem['elective']} по выбору), {_num(sem['credits'])} з.е., {sem['hours']} ч.")
+        shown = sem["names"][:15]
+        lines.extend(f"• {n}" for n in shown)
+        if len(sem["names"]) > len(shown):
+            lines.append(f"…и ещё {len(sem['names']) - len(shown)}")
+    return "\n".join(lines)
+
+def _semester_order(key: str):
+    return (key == SEMESTER_UNKNOWN, int(key) if key.isdigit() else 0)
+
+def _semester_label(key: str) -> str:
+    return "без семестра" if key == SEMESTER_UNKNOWN else f"{key} семестр"
+
+def _sem_brief(stats: dict, key: str) -> str:
+    sem = stats["semesters"].get(key)
+    return f"{sem['courses']} ({_num(sem['credits'])})" if sem else "—"
+
+def _tag_list(tags: List[str], *stats: dict) -> str:
+    # сначала самые частые направления
+    tags = sorted(tags, key=lambda t: -sum(s["tags"].get(t, 0) for s in stats))
+    return ", ".join(f"{TAG_LABELS.get(t, t)} ({' и '.join(str(s['tags'].get(t, 0)) for s in stats)})"
+                     for t in tags)
+
+def _num(x) -> str:
+    return f"{x:g}" if isinstance(x, float) else str(x)
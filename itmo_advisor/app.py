@@ -1,71 +1,110 @@
 import argparse, os, sys
+from startup import StartupProfiler
 from utils import load_env, build_repo
-from scraper import ItmoProgramScraper
-from curriculum_parser import CurriculumParser
-from retriever import Retriever
-from bot_telegram import TelegramBot
+# остальное импортируется внутри режимов: --cli и --sync не тянут python-telegram-bot,
+# --bot и --cli — requests/bs4 скрапера; sklearn нужен только при переобучении индекса
 
 def main():
     load_env()
     parser = argparse.ArgumentParser()
     parser.add_argument("--sync", action="store_true", help="Скачать страницы/планы и распарсить")
+    parser.add_argument("--force", action="store_true", help="Вместе с --sync: игнорировать хэши и пересобрать всё")
     parser.add_argument("--bot", action="store_true", help="Запуск Telegram бота")
+    parser.add_argument("--webhook", action="store_true",
+                        help="Вместе с --bot: принимать апдейты через webhook (WEBHOOK_URL, WEBHOOK_PORT, ...)")
     parser.add_argument("--cli", action="store_true", help="Консольный режим (без Telegram)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Показать время импортов и инициализации (как python -X importtime)")
     args = parser.parse_args()
+    if args.bot and args.webhook and not os.environ.get("WEBHOOK_URL"):
+        # проверяем до загрузки БД и индекса: без публичного адреса setWebhook всё равно не пройдёт
+        print("WEBHOOK_URL не задан: для --webhook нужен публичный https-адрес бота")
+        sys.exit(1)
+    prof = StartupProfiler(enabled=args.profile_startup).install()
 
-    repo = build_repo()
+    with prof.stage("БД"):
+        repo = build_repo()
+    # при METRICS_ENABLED=1: HTTP-эндпоинт Prometheus (METRICS_PORT) и/или JSON-лог
+    from metrics import METRICS
+    METRICS.start_exporters()
 
+    ret = None
     if args.sync:
-        scraper = ItmoProgramScraper(repo)
-        scraper.full_sync()
-        cp = CurriculumParser(repo)
-        for p in repo.list_programs():
-            courses = cp.parse_for_program(p.code)
-            repo.replace_courses(p.code, courses)
+        from sync import SyncPipeline
+        res = SyncPipeline(repo).run(progress=print, force=args.force)
+        print(res.format())
         print("Синхронизация завершена.")
+        ret = res.retriever
 
-    # общий ретривер
-    ret = Retriever(repo)
-    ret.build()
+    if ret is None:
+        # общий ретривер: готовый индекс с диска, переобучение — только если БД изменилась
+        with prof.stage("индекс"):
+            from retriever import Retriever
+            ret = Retriever(repo)
+            loaded = ret.load_or_build()
+        if args.profile_startup and not loaded:
+            print("индекс переобучен: сохранённый отсутствовал или устарел", file=sys.stderr)
 
     if args.bot:
         token = os.environ.get("TELEGRAM_TOKEN")
         if not token:
             print("TELEGRAM_TOKEN не задан")
             sys.exit(1)
-        bot = TelegramBot(token, repo, ret)
-        bot.run()
+        with prof.stage("бот"):
+            from bot_telegram import TelegramBot
+            bot = TelegramBot(token, repo, ret)
+        prof.report()
+        if args.webhook:
+            bot.run_webhook()
+        else:
+            bot.run()
 
     if args.cli:
-        from dialog import UserState, WELCOME, map_background
-        from qa import QAService
-        from recommender import ElectiveRecommender
+        with prof.stage("cli"):
+            from dialog import UserState, map_background, program_prompt, welcome_text
+            from analytics import CurriculumAnalytics
+            from qa import QAService
+            from recommender import ElectiveRecommender
+            from registry import ProgramRegistry
 
-        qa = QAService(repo, ret)
-        reco = ElectiveRecommender()
-        st = UserState()
-        print(WELCOME)
+            analytics = CurriculumAnalytics(repo)
+            programs = ProgramRegistry().with_repo(repo)
+            qa = QAService(repo, ret, analytics, programs)
+            reco = ElectiveRecommender()
+            st = UserState()
+        prof.report()
+        print(welcome_text(programs))
         while True:
             q = input("> ").strip()
             if q in ("exit","quit"): break
             if st.program_code is None:
-                if q.lower() in ("ai","ai_product"):
-                    st.program_code = q.lower()
+                prog = programs.resolve(q)
+                if prog:
+                    st.program_code = prog.code
                     print("Ок. Кратко опишите бэкграунд (например: junior_ml, product_manager, backend, data_engineer, research).")
                 else:
-                    print("Введите ai или ai_product.")
+                    print(program_prompt(programs))
                 continue
             if st.background_key is None:
                 st.background_key = map_background(q) or q.lower()
                 print("Принято. Спросите что-нибудь по обучению или введите :reco для рекомендаций.")
                 continue
+            if q.startswith(":compare"):
+                codes = [p.code for p in map(programs.resolve, q.split()[1:3]) if p]
+                if len(codes) == 2:
+                    print(analytics.compare(*codes) or "Нет учебного плана одной из программ.")
+                else:
+                    print("Укажите две программы: :compare <код> <код>\n" + programs.menu())
+                continue
             if q == ":reco":
-                courses = repo.list_courses(st.program_code)
-                recs = reco.recommend(courses, st.background_key, limit=6)
+                recs = reco.recommend_for(repo, st.program_code, st.background_key, limit=6)
                 for c in recs:
                     print(f"- {c.name} (сем {c.semester or '—'}, теги: {', '.join(c.tags) or '—'})")
                 continue
             print(qa.answer(st.program_code, q))
 
+    if not args.bot and not args.cli:
+        prof.report()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,76 @@
+# bench/bench_analytics.py
+# Аналитика по учебным планам: полный расчёт агрегатов (этап sync), пересчёт после
+# replace_courses одной программы и латентность ответа на вопрос-агрегат из снимка
+# против прежнего пути — TF-IDF поиска по курсам (QAService без аналитики). Перед замером
+# проверяет, что вопросы для FAQ («сколько стоит обучение») не уходят в аналитику, а
+# сравнение по кодам программ («сравни ai и ai_product») — уходит.
+# Запуск из каталога itmo_advisor: python -m bench.bench_analytics [программ] [курсов на программу]
+import dataclasses, itertools, sys, time
+from analytics import CurriculumAnalytics, match_intent
+from bench.common import measure, seed, temp_repo
+from qa import QAService, normalize_question
+from registry import ProgramRegistry
+from retriever import Retriever
+
+QUESTIONS = ["В чём разница между программами?", "Сколько ML-курсов в каждой?", "Что во 2 семестре?",
+             "Сколько курсов по компьютерному зрению?", "Что изучают в первом семестре?"]
+# вопросы к FAQ программы со «сколько» и «отличается»: их отвечает поиск, а не аналитика
+FAQ_QUESTIONS = ["Сколько стоит обучение?", "Сколько бюджетных мест?", "Сколько длится обучение?",
+                 "Чем отличается экзамен от зачета?", "Сколько стоит обучение на программе по NLP?",
+                 "Сколько стоит обучение на ai и ai_product?"]
+# сравнение, названное кодами или алиасами программ, без слова «программы»
+COMPARE_QUESTIONS = ["Сравни ai и ai_product", "В чём разница между ai и ai_product?",
+                     "Чем отличается ai от ai_product?", "ai vs ai product"]
+
+def check_intents(qa: QAService, codes) -> None:
+    for q in FAQ_QUESTIONS:
+        assert match_intent(q) is None and match_intent(q, qa.programs) is None, q
+        assert qa._aggregate(None, normalize_question(q)) is None, q
+    for q in QUESTIONS:
+        assert match_intent(q) is not None, q
+    for q in COMPARE_QUESTIONS:
+        intent = match_intent(q, qa.programs)
+        assert intent is not None and intent.kind == "compare" and intent.programs == ("ai", "ai_product"), q
+        assert qa._answer(None, normalize_question(q)) != qa.OFF_TOPIC, q
+    # названная пара сравнивается сама, а не выбранная программа с «остальными»
+    ans = qa._answer(codes[2], normalize_question(f"сравни {codes[0]} и {codes[1]}"))
+    assert ans.startswith(f"Сравнение планов: «Программа {codes[0]}» и «Программа {codes[1]}»"), ans
+
+def main():
+    n_programs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_program = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    repo = temp_repo()
+    codes = seed(repo, n_programs, n_programs * per_program)
+    an = CurriculumAnalytics(repo)
+    t0 = time.perf_counter()
+    an.refresh(force=True)
+    full = time.perf_counter() - t0
+    repo.replace_courses(codes[0], [dataclasses.replace(c, program_code=codes[0])
+                                    for c in repo.list_courses(codes[1])[:per_program // 2]])
+    t0 = time.perf_counter()
+    changed = an.refresh()
+    one = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    an.snapshot()
+    load = time.perf_counter() - t0
+
+    ret = Retriever(repo)
+    ret.build()
+    old, new = QAService(repo, ret), QAService(repo, ret, an, ProgramRegistry().with_repo(repo))
+    check_intents(new, codes)
+    qs, prog = itertools.cycle(QUESTIONS), itertools.cycle(codes)
+    # _answer — мимо кэша ответов: меряем сам расчёт
+    before = measure(lambda: old._answer(next(prog), next(qs).lower()), 200)
+    after = measure(lambda: new._answer(next(prog), next(qs).lower()), 200)
+    intents = measure(lambda: match_intent(next(qs)), 200)
+
+    print(f"программ: {n_programs}, курсов: {n_programs * per_program}, пар: {n_programs * (n_programs - 1) // 2}")
+    print(f"полный расчёт агрегатов:         {full:8.2f} с")
+    print(f"пересчёт после replace_courses:  {one:8.3f} с (программ: {len(changed)})")
+    print(f"загрузка снимка в память:        {load:8.3f} с")
+    print(f"ответ поиском (прежний путь):    p50 {before['p50_ms']:7.3f} мс")
+    print(f"ответ из аналитики:              p50 {after['p50_ms']:7.3f} мс")
+    print(f"распознавание намерения:         p50 {intents['p50_ms']:7.3f} мс")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# bench/bench_batch.py
+# Пропускная способность QAService: поштучные answer() против answer_batch()
+# и асинхронного MicroBatcher при всплеске одновременных вопросов; Retriever.query_batch
+# без программы (по шардам каталога) против поштучных query с проверкой совпадения.
+# Запуск из каталога itmo_advisor: python -m bench.bench_batch [число_курсов]
+import asyncio, sys, time
+from batching import MicroBatcher
+from qa import QAService
+from retriever import Retriever
+from bench.common import QUESTIONS, measure, seed, temp_repo
+
+def throughput(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return n / (time.perf_counter() - t0)
+
+async def burst(batcher: MicroBatcher, items) -> None:
+    await asyncio.gather(*(batcher.submit(it) for it in items))
+
+def run(n_courses: int = 10_000, n_questions: int = 2_000, batch_sizes=(1, 8, 32, 128)):
+    repo = temp_repo()
+    codes = seed(repo, 2, n_courses)
+    ret = Retriever(repo)
+    ret.build()
+    qa = QAService(repo, ret)
+    # вопросы уникальны (номер в конце), а кэш ответов очищается перед каждым проходом:
+    # иначе меряются попадания в кэш QAService, а не поиск
+    items = [(codes[i % 2], f"{QUESTIONS[i % len(QUESTIONS)]} {i}") for i in range(n_questions)]
+    qa.cache.clear()
+    out = {"courses": n_courses, "questions": n_questions,
+           "sequential_qps": throughput(lambda: [qa.answer(c, q) for c, q in items], n_questions)}
+    for b in batch_sizes:
+        chunks = [items[i:i + b] for i in range(0, n_questions, b)]
+        qa.cache.clear()
+        out[f"batch{b}_qps"] = throughput(lambda: [qa.answer_batch(ch) for ch in chunks], n_questions)
+    qa.cache.clear()
+    batcher = MicroBatcher(qa.answer_batch, max_batch=32, max_delay=0.005)
+    out["microbatcher_qps"] = throughput(lambda: asyncio.run(burst(batcher, items)), n_questions)
+    out["microbatcher_avg_batch"] = batcher.items / max(1, batcher.batches)
+    out["answer_cache_hits"] = qa.cache.hits  # должно быть 0
+    return out
+
+def run_unscoped(n_programs: int = 64, n_courses: int = 32_000, n_questions: int = 32):
+    repo = temp_repo()
+    seed(repo, n_programs, n_courses)
+    ret = Retriever(repo)
+    ret.build()
+    qs = [f"{QUESTIONS[i % len(QUESTIONS)]} {i}" for i in range(n_questions)]
+    seq = [ret.query(q) for q in qs]
+    assert ret.query_batch(qs) == seq
+    return {"unscoped_sequential_ms": measure(lambda: [ret.query(q) for q in qs], 20)["p50_ms"],
+            "unscoped_batch_ms": measure(lambda: ret.query_batch(qs), 20)["p50_ms"]}
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    for k, v in {**run(n), **run_unscoped()}.items():
+        print(f"{k:>24}: {v:,.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# bench/bench_guard.py
+# Старые guard.is_in_domain / match_themes / dialog.map_background (цепочки `k in text`)
+# против текущих. Перед замером сверяет результаты на случайных фразах,
+# включая все темы и ключевые слова бэкграундов.
+# Запуск из каталога itmo_advisor: python -m bench.bench_guard
+import random
+from guard import ALLOWED_THEMES, is_in_domain, match_themes
+from dialog import BACKGROUND_KEYWORDS, map_background, match_backgrounds
+from bench.common import QUESTIONS, WORDS, measure
+
+def legacy_is_in_domain(question: str) -> bool:
+    ql = question.lower()
+    return any(k in ql for k in ALLOWED_THEMES)
+
+def legacy_match_themes(question: str):
+    ql = question.lower()
+    return {k for k in ALLOWED_THEMES if k in ql}
+
+def legacy_map_background(text: str):
+    t = text.lower()
+    if "product" in t or "продукт" in t or "pm" in t:
+        return "product_manager"
+    if "ml" in t or "data scientist" in t or "джун" in t:
+        return "junior_ml"
+    if "data eng" in t or "инженер данных" in t:
+        return "data_engineer"
+    if "backend" in t or "бэкенд" in t:
+        return "backend"
+    if "research" in t or "ресерч" in t or "наука" in t:
+        return "research"
+    return None
+
+def phrases(n: int, seed: int = 0):
+    rnd = random.Random(seed)
+    vocab = WORDS + ALLOWED_THEMES + [w for ws in BACKGROUND_KEYWORDS.values() for w in ws] + [
+        "Как", "ПОСТУПИТЬ", "в", "ИТМО?", "я", "hello", "погода", "футбол", "amlops", "z.e", "по", "выбору"]
+    out = list(QUESTIONS)
+    while len(out) < n:
+        # слова склеиваем и без пробелов — так темы оказываются внутри и на стыке слов
+        sep = rnd.choice([" ", "", "-"])
+        out.append(sep.join(rnd.choice(vocab) for _ in range(rnd.randint(1, 8))))
+    return out
+
+def check(texts) -> int:
+    for t in texts:
+        assert is_in_domain(t) == legacy_is_in_domain(t), t
+        assert match_themes(t) == legacy_match_themes(t), t
+        assert map_background(t) == legacy_map_background(t), t
+        expected = [b for b, ws in BACKGROUND_KEYWORDS.items() if any(w in t.lower() for w in ws)]
+        assert match_backgrounds(t) == expected, t
+        assert map_background(t) == (expected or [None])[0], t
+    return len(texts)
+
+def main():
+    texts = phrases(50_000)
+    print(f"совпадает со старыми функциями на {check(texts)} фразах")
+    it = iter(texts * 100)
+    rows = [
+        ("is_in_domain", measure(lambda: legacy_is_in_domain(next(it)), 20_000),
+         measure(lambda: is_in_domain(next(it)), 20_000)),
+        ("match_themes", measure(lambda: legacy_match_themes(next(it)), 20_000),
+         measure(lambda: match_themes(next(it)), 20_000)),
+        ("map_background", measure(lambda: legacy_map_background(next(it)), 20_000),
+         measure(lambda: map_background(next(it)), 20_000)),
+    ]
+    print(f"{'функция':<16} {'старая mean':>12} {'новая mean':>11}")
+    for name, old, new in rows:
+        print(f"{name:<16} {old['mean_ms'] * 1000:>10.2f}us {new['mean_ms'] * 1000:>9.2f}us")
+
+if __name__ == "__main__":
+    main()
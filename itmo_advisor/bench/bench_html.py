@@ -0,0 +1,102 @@
+# bench/bench_html.py
+# Разбор страницы программы: прежний путь (три BeautifulSoup на html.parser — ссылка
+# на план, FAQ, текст для запасного разбора) против html_doc.parse_page (один разбор).
+# Страницы — из HTTP-кэша последней синхронизации (HTTP_CACHE_DIR), а если он пуст —
+# синтетические страницы в разметке abit.itmo.ru.
+# Запуск из каталога itmo_advisor: python -m bench.bench_html [синтетических страниц]
+import json, os, random, re, sys
+from typing import List, Tuple
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from bench.bench_storage import program_html
+from bench.common import WORDS, measure
+from config import HTTP_CACHE_DIR
+from html_doc import PARSER, parse_page
+
+def legacy_plan_link(html: str, base_url: str = "https://abit.itmo.ru"):
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.find_all("a"):
+        text = (a.get_text() or "").strip().lower()
+        href = a.get("href") or ""
+        if "учебный план" in text or "план обучения" in text or re.search(r"\.(pdf|docx?)$", href):
+            if href.startswith("/"):
+                return urljoin(base_url, href)
+            if href.startswith("http"):
+                return href
+    return None
+
+def legacy_faq_pairs(html: str) -> List[Tuple[str, str]]:
+    soup = BeautifulSoup(html, "html.parser")
+    pairs = []
+    for h in soup.find_all(["h5", "h6"]):
+        txt = (h.get_text() or "").strip()
+        if not txt:
+            continue
+        if any(k in txt.lower() for k in ["вопрос", "экзамен", "как", "можно ли", "чем", "будет ли", "уровень", "сможу ли"]):
+            nxt = h.find_next_sibling()
+            body = (nxt.get_text() if nxt else "") if hasattr(nxt, "get_text") else ""
+            pairs.append((txt, body))
+    return pairs
+
+def legacy_text(html: str) -> str:
+    return BeautifulSoup(html, "html.parser").get_text(separator="\n")
+
+def legacy(url: str, html: str):
+    return legacy_plan_link(html, url), legacy_faq_pairs(html), legacy_text(html)
+
+def one_pass(url: str, html: str):
+    return parse_page(html, url)
+
+def cached_pages() -> List[Tuple[str, str]]:
+    try:
+        with open(os.path.join(HTTP_CACHE_DIR, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return []
+    pages = []
+    for url, e in index.items():
+        if os.path.exists(e["path"]) and not e["path"].lower().endswith((".pdf", ".docx")):
+            with open(e["path"], "rb") as f:
+                pages.append((url, f.read().decode(e.get("encoding") or "utf-8", errors="replace")))
+    return pages
+
+def synthetic_pages(n: int, rnd_seed: int = 0) -> List[Tuple[str, str]]:
+    rnd = random.Random(rnd_seed)
+    pages = []
+    for i in range(n):
+        url = f"https://abit.itmo.ru/program/master/prog{i:03d}"
+        nav = "".join(f'<a href="/program/master/p{j}">Программа {j}</a>' for j in range(60))
+        body = program_html(rnd, rnd.choice([150, 250, 400]))
+        plan = f'<a href="https://api.itmo.su/plans/{i}.pdf" target="_blank">Скачать учебный план</a>'
+        faq = "".join(f'<div><h5>{q} {rnd.choice(WORDS)}?</h5><div><p>Ответ: {rnd.choice(WORDS)}</p></div></div>'
+                      for q in ("Как поступить на", "Можно ли учиться", "Какой уровень", "Будет ли"))
+        pages.append((url, body.replace("<body>", f"<body><nav>{nav}</nav>", 1)
+                          .replace("</body>", f"<section>{faq}<h6>Вопросы?</h6></section>"
+                                              f"<footer>{plan}<!-- © ИТМО --></footer></body>", 1)))
+    return pages
+
+def main():
+    pages = cached_pages()
+    source = f"HTTP-кэш ({HTTP_CACHE_DIR})"
+    if not pages:
+        pages = synthetic_pages(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
+        source = "синтетические"
+    kb = sum(len(h.encode("utf-8")) for _, h in pages) / len(pages) / 1024
+    print(f"страниц: {len(pages)} ({source}), в среднем {kb:.0f} КБ; парсер: {PARSER}")
+
+    same = 0
+    for url, html in pages:
+        doc = parse_page(html, url)
+        same += (doc.plan_url, doc.faq_pairs, doc.text) == legacy(url, html)
+    print(f"совпадает с прежним разбором: {same}/{len(pages)}")
+
+    it = iter(pages * 1000)
+    old = measure(lambda: legacy(*next(it)), repeat=3 * len(pages), warmup=1)
+    it = iter(pages * 1000)
+    new = measure(lambda: one_pass(*next(it)), repeat=3 * len(pages), warmup=1)
+    print(f"прежний путь (3 разбора):   p50 {old['p50_ms']:8.1f} мс на страницу")
+    print(f"parse_page (1 разбор):      p50 {new['p50_ms']:8.1f} мс на страницу "
+          f"({old['p50_ms'] / new['p50_ms']:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/bench_outbox.py
+# Исходящие сообщения под лимитами Bot API: отправка прямо из обработчика (как раньше:
+# обработчик ждёт send_message, после 429 спит retry_after и держит слот обработки)
+# против outbox.Outbox. Bot API — FakeTelegramAPI с лимитами Telegram; время ускорено
+# в SCALE раз (лимиты x SCALE, retry_after от 1/SCALE с), латентности — в секундах бенча.
+# Нагрузка — пик: каждый чат получает replies ответов за окно в 1/SCALE с, каждый
+# десятый — длинный список /recommend (больше 4096 символов).
+# Запуск из каталога itmo_advisor: python -m bench.bench_outbox [чатов] [ответов на чат]
+import asyncio, random, sys, time
+from typing import List
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+from bench.common import WORDS
+from bench.telegram_driver import FakeTelegramAPI, _pct
+from config import BOT_CONCURRENT_UPDATES
+from outbox import Outbox, RateLimits, _seconds
+
+SCALE = 10
+
+def limits() -> RateLimits:
+    base = RateLimits()
+    return RateLimits(base.global_rate * SCALE, base.chat_rate * SCALE, base.chat_burst, base.group_rate * SCALE)
+
+def replies(chats: int, per_chat: int, rnd_seed: int = 0):
+    rnd = random.Random(rnd_seed)
+    out = []
+    for chat in range(chats):
+        for i in range(per_chat):
+            if rnd.random() < 0.1:
+                text = "Рекомендованные элективы:\n" + "\n".join(
+                    f"• {' '.join(rnd.choice(WORDS) for _ in range(8))} (семестр {rnd.randint(1, 4)})" for _ in range(120))
+            else:
+                text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(10, 60)))
+            out.append((10_000 + chat, rnd.uniform(0, 1 / SCALE), text))
+    return out
+
+async def run_mode(mode: str, load) -> dict:
+    api = FakeTelegramAPI(latency=0.002, limits=limits(), retry_floor=1 / SCALE)
+    bot = Bot("123456:bench", request=api, get_updates_request=api)
+    await bot.initialize()
+    outbox = Outbox(bot, limits())
+    slots = asyncio.Semaphore(BOT_CONCURRENT_UPDATES)  # как ChatOrderedProcessor
+    chat_locks = {chat: asyncio.Lock() for chat, _, _ in load}
+    held: List[float] = []
+    delivered: List[float] = []
+    lost = 0
+
+    async def inline(chat: int, text: str) -> bool:
+        while True:
+            try:
+                await bot.send_message(chat, text)
+                return True
+            except RetryAfter as e:
+                await asyncio.sleep(_seconds(e.retry_after))
+            except BadRequest:
+                return False
+
+    async def handler(chat: int, at: float, text: str):
+        nonlocal lost
+        await asyncio.sleep(at)
+        t0 = time.perf_counter()
+        async with chat_locks[chat], slots:
+            t1 = time.perf_counter()
+            if mode == "inline":
+                ok = await inline(chat, text)
+            else:
+                fut = outbox.send(chat, text)
+            held.append(time.perf_counter() - t1)
+        if mode != "inline":
+            ok = await fut
+        if ok:
+            delivered.append(time.perf_counter() - t0)
+        else:
+            lost += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(handler(*r) for r in load))
+    elapsed = time.perf_counter() - t0
+    await outbox.close()
+    return {"mode": mode, "elapsed_s": elapsed, "delivered": len(delivered), "lost": lost,
+            "per_s": len(delivered) / elapsed, "api_calls": api.calls - 1, "flood_429": api.flooded,
+            "coalesced": outbox.coalesced, "held_p95_ms": _pct(held)["p95_ms"],
+            **_pct(delivered)}
+
+def main():
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_chat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    load = replies(chats, per_chat)
+    print(f"чатов: {chats}, ответов: {len(load)}, лимиты x{SCALE}: {limits()}")
+    print(f"{'режим':>7} {'время':>7} {'доставл.':>8} {'потеряно':>8} {'отв./с':>7} {'вызовов':>8} {'429':>5} "
+          f"{'склеено':>8} {'слот p95':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for mode in ("inline", "outbox"):
+        r = asyncio.run(run_mode(mode, load))
+        print(f"{r['mode']:>7} {r['elapsed_s']:>6.2f}с {r['delivered']:>8} {r['lost']:>8} {r['per_s']:>7.0f} "
+              f"{r['api_calls']:>8} {r['flood_429']:>5} {r['coalesced']:>8} {r['held_p95_ms']:>7.1f}мс "
+              f"{r['p50_ms']:>6.0f}мс {r['p95_ms']:>6.0f}мс {r['p99_ms']:>6.0f}мс")
+
+if __name__ == "__main__":
+    main()
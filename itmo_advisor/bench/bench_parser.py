@@ -0,0 +1,120 @@
+# bench/bench_parser.py
+# Старый разбор плана (отдельный re.search с re.I на каждый признак строки и теги
+# при разборе программы) против classify_line с одним скомпилированным выражением.
+# Перед замером сверяет курсы на образцах планов и на случайных строках, где признаки
+# склеены, перекрываются и набраны в разном регистре.
+# Запуск из каталога itmo_advisor: python -m bench.bench_parser [строк]
+import random, re, sys
+from typing import List
+from curriculum_parser import TAG_KEYWORDS, CurriculumParser
+from domain import Course
+from bench.common import WORDS, measure
+
+SAMPLE_PLANS = [
+    """Учебный план
+Семестр 1
+Машинное обучение 6 з.е. 216 часов
+Глубокое обучение  (по выбору)  4 з.е.
+Computer Vision — 3 ECTS, 108 ч.
+Менеджмент продуктов 3 кред
+Английский язык
+Семестр: 2
+Обработка естественного языка (NLP) 5 з.е. 180 часа
+MLOps и production-системы, электив 3,5 з.е.
+Архитектура облачных систем 4 з.е.
+Генеративные модели 3 з.е. 108 часов
+Партнеры программы
+Карьера
+Семестр 3
+Big Data и облачные вычисления 4 з.е.
+Научно-исследовательская работа 12 з.е. 432 часа
+Семестр 4
+Подготовка ВКР 18 з.е.
+Вопросы и ответы
+Как поступить: вступительные испытания
+""",
+    """СЕМЕСТР 1
+Data Engineering  практикум 3 з.е
+Продуктовая аналитика  по выбору 2 з.е.
+Статистика 72 ч.
+семестр2
+Управление проектами, менеджмент 3 з.е.
+Исследовательский семинар ВОПРОСЫ этики 1 з.е.
+Элективы: рекомендательные системы 4 з.е.
+ab
+Оптимизация
+""",
+]
+
+def legacy_parse(text: str, program_code: str = "p") -> List[Course]:
+    # CurriculumParser._parse_text_lines + проставление тегов при разборе программы до замены
+    courses: List[Course] = []
+    current_sem = None
+    for line in text.splitlines():
+        s = line.strip()
+        if not s:
+            continue
+        m_sem = re.search(r"семестр[:\s]*(\d+)", s, flags=re.I)
+        if m_sem:
+            current_sem = int(m_sem.group(1))
+            continue
+        name = re.sub(r"\s{2,}", " ", re.sub(r"[\u00A0]", " ", s))
+        if len(name) < 4:
+            continue
+        m_cred = re.search(r"(\d+[.,]?\d*)\s*(з\.?е\.?|ECTS|кред)", s, flags=re.I)
+        m_hours = re.search(r"(\d+)\s*(час(ов|а)?|ч\.)", s, flags=re.I)
+        ctype = "elective" if re.search(r"(электив|по выбору)", s, flags=re.I) else "core"
+        credits = float(m_cred.group(1).replace(",", ".")) if m_cred else None
+        hours = int(m_hours.group(1)) if m_hours else None
+        if any(k in s.lower() for k in ["партнеры программы", "карьера", "вопросы", "как поступить"]):
+            continue
+        if len(s.split()) <= 2 and credits is None and hours is None:
+            continue
+        low = name.lower()
+        courses.append(Course(program_code=program_code, name=name, semester=current_sem, type=ctype,
+                              hours=hours, credits=credits, raw=s,
+                              tags=[tag for kw, tag in TAG_KEYWORDS if kw in low]))
+    return courses
+
+def fuzz_lines(n: int, seed: int = 0) -> List[str]:
+    rnd = random.Random(seed)
+    marks = ["семестр", "Семестр:", "СЕМЕСТР ", "з.е.", "зе", "з.е", "ECTS", "кред", "часов", "часа", "час",
+             "ч.", "электив", "по выбору", "ВОПРОСЫ", "карьера", "партнеры программы", "как поступить",
+             "3", "4,5", "108", "2.", "\u00a0", "  ", "Computer Vision", "big data", "MLOps"]
+    vocab = WORDS + marks
+    out = []
+    for _ in range(n):
+        # без пробелов между словами признаки оказываются внутри и на стыке слов
+        sep = rnd.choice([" ", "", "  ", "\t"])
+        out.append(sep.join(rnd.choice(vocab) for _ in range(rnd.randint(1, 7))))
+    return out
+
+def _key(c: Course):
+    return (c.program_code, c.name, c.semester, c.type, c.hours, c.credits, c.raw, c.tags)
+
+def check(texts: List[str]) -> int:
+    parser = CurriculumParser(None)
+    n = 0
+    for text in texts:
+        old = [_key(c) for c in legacy_parse(text)]
+        new = [_key(c) for c in parser.parse_text("p", text)]
+        assert new == old, (text, old, new)
+        n += len(old)
+    return n
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    print(f"образцы планов: совпадает {check(SAMPLE_PLANS)} курсов")
+    lines = fuzz_lines(n)
+    # куски по 50 строк: семестр переносится между строками одного плана
+    chunks = ["\n".join(lines[i:i + 50]) for i in range(0, len(lines), 50)]
+    print(f"случайные строки ({n}): совпадает {check(chunks)} курсов")
+    text = "\n".join(lines[:20_000])
+    parser = CurriculumParser(None)
+    old = measure(lambda: legacy_parse(text), 5, warmup=1)
+    new = measure(lambda: parser.parse_text("p", text), 5, warmup=1)
+    print(f"20000 строк: старый {old['mean_ms']:.0f} мс, новый {new['mean_ms']:.0f} мс "
+          f"(x{old['mean_ms'] / new['mean_ms']:.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# bench/bench_query.py
+# Сравнение старого пути Retriever.query (cosine_similarity + полный argsort)
+# с новым (разреженный mat-vec + argpartition, фильтр по программе до ранжирования).
+# Запуск из каталога itmo_advisor: python -m bench.bench_query
+import sys
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from config import INDEX_MAX_FEATURES
+from retriever import Retriever, VECTORIZER_PARAMS
+from bench.common import QUESTIONS, measure, seed, temp_repo
+
+SIZES = (1_000, 10_000, 100_000)
+
+def legacy_index(ret: Retriever):
+    """Один TfidfVectorizer на весь корпус — как индекс до разбиения на сегменты."""
+    segs = [ret._segments[c] for c in ret.codes]
+    docs = [d for s in segs for d in s.docs]
+    meta = [m for s in segs for m in s.meta]
+    vec = TfidfVectorizer(max_features=INDEX_MAX_FEATURES or None, **VECTORIZER_PARAMS)
+    return vec, vec.fit_transform(docs), meta, docs
+
+def legacy_query(index, q: str, topk: int = 5):
+    vec, X, meta, docs = index
+    sims = cosine_similarity(vec.transform([q]), X).ravel()
+    idx = sims.argsort()[::-1][:topk]
+    return [(float(sims[i]), meta[i], docs[i]) for i in idx]
+
+def run(sizes=SIZES, n_programs: int = 2):
+    rows = []
+    for n in sizes:
+        repo = temp_repo()
+        codes = seed(repo, n_programs, n)
+        ret = Retriever(repo)
+        ret.build()
+        q = iter(QUESTIONS * 1000)
+        index = legacy_index(ret)
+        old = measure(lambda: legacy_query(index, next(q)))
+        new = measure(lambda: ret.query(next(q)))
+        scoped = measure(lambda: ret.query(next(q), program_code=codes[0]))
+        rows.append({"docs": ret.n_docs, "legacy": old, "new": new, "new_program": scoped})
+    return rows
+
+def main():
+    sizes = tuple(int(a) for a in sys.argv[1:]) or SIZES
+    print(f"{'docs':>8} {'legacy p50':>11} {'new p50':>9} {'program p50':>12} {'speedup':>8}")
+    for r in run(sizes):
+        speedup = r["legacy"]["p50_ms"] / r["new"]["p50_ms"]
+        print(f"{r['docs']:>8} {r['legacy']['p50_ms']:>9.3f}ms {r['new']['p50_ms']:>7.3f}ms "
+              f"{r['new_program']['p50_ms']:>10.3f}ms {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# bench/bench_segments.py
+# Сегментированный индекс: полная сборка против refresh() после изменения одной
+# программы (добавление, замена, удаление), загрузка с диска и латентность запросов
+# с программой и без неё (расходится по шардам из SEARCH_SHARD_SIZE сегментов).
+# Запуск из каталога itmo_advisor: python -m bench.bench_segments [программ ...]
+import itertools, sys, tempfile, time
+from bench.common import QUESTIONS, measure, seed, temp_repo
+from domain import Course, Program
+from retriever import Retriever
+
+def timed(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t0
+
+def run(n_programs: int, per_program: int = 500) -> dict:
+    repo = temp_repo()
+    codes = seed(repo, n_programs, n_programs * per_program)
+    out = {"programs": n_programs}
+    ret = Retriever(repo)
+    _, out["build_s"] = timed(ret.build)
+    out["docs"] = ret.n_docs
+    path = tempfile.mkdtemp(prefix="itmo-index-")
+    _, out["save_s"] = timed(lambda: ret.save(path))
+    _, out["load_s"] = timed(lambda: Retriever(repo).load(path))
+
+    courses = repo.list_courses(codes[0])
+    repo.replace_courses(codes[0], courses[: len(courses) // 2])
+    live = ret.fork()
+    _, out["replace_s"] = timed(live.refresh)
+    _, out["save_changed_s"] = timed(lambda: live.save(path))
+    repo.upsert_program(Program("extra", "Новая программа", "https://example.invalid/extra"))
+    repo.replace_courses("extra", [Course("extra", f"{c.name} (новая)", c.semester, c.type, c.hours, c.credits,
+                                          c.raw, c.tags) for c in courses])
+    _, out["add_s"] = timed(live.fork().refresh)
+    repo.replace_courses("extra", [])
+    _, out["drop_s"] = timed(live.fork().refresh)
+
+    qs = itertools.cycle(QUESTIONS)
+    prog = itertools.cycle(codes)
+    for code in codes:
+        ret.query("прогрев", program_code=code)
+    # первые сотни запросов после сборки заметно медленнее (кэши, аллокатор) — прогреваем дольше
+    out["query_program"] = measure(lambda: ret.query(next(qs), program_code=next(prog)), 300, warmup=500)
+    out["query_all"] = measure(lambda: ret.query(next(qs)), 100, warmup=20)
+    repo.close()
+    return out
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [20, 200]
+    print(f"{'программ':>8} {'докум.':>7} {'сборка':>8} {'замена':>8} {'добавл.':>8} {'удал.':>8} "
+          f"{'загрузка':>9} {'все p50':>9} {'прогр. p50':>10}")
+    for n in sizes:
+        r = run(n)
+        print(f"{r['programs']:>8} {r['docs']:>7} {r['build_s']:>7.2f}с {r['replace_s']:>7.3f}с "
+              f"{r['add_s']:>7.3f}с {r['drop_s']:>7.3f}с {r['load_s']:>8.3f}с "
+              f"{r['query_all']['p50_ms']:>7.2f}мс {r['query_program']['p50_ms']:>8.3f}мс")
+
+if __name__ == "__main__":
+    main()
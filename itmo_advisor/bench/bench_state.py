@@ -0,0 +1,79 @@
+# bench/bench_state.py
+# Хранилища состояний на 100k симулированных пользователей: операции в секунду,
+# память на запись UserState и запись из нескольких процессов в одну SQLite-БД.
+# Запуск из каталога itmo_advisor: python -m bench.bench_state [пользователей]
+import multiprocessing, os, random, sys, tempfile, time, tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+from dialog import UserState
+from state_store import MemoryStateStore, SqliteStateStore
+
+@dataclass
+class _DictUserState:
+    # как UserState до перехода на __slots__ — для сравнения памяти
+    program_code: Optional[str] = None
+    background_key: Optional[str] = None
+    stage: str = "welcome"
+
+def bytes_per_state(cls, n: int = 100_000) -> float:
+    tracemalloc.start()
+    items = [cls("ai", "junior_ml") for _ in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return size / n
+
+def simulate(store, users: int, ops: int, rnd_seed: int = 0) -> float:
+    """Диалог: на каждое сообщение get(), примерно в трети случаев — put()."""
+    rnd = random.Random(rnd_seed)
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        uid = rnd.randrange(users)
+        st = store.get(uid)
+        if st.program_code is None or rnd.random() < 0.3:
+            st.program_code = rnd.choice(("ai", "ai_product"))
+            st.background_key = rnd.choice(("junior_ml", "backend", None))
+            store.put(uid, st)
+    store.flush()
+    return ops / (time.perf_counter() - t0)
+
+def _worker(path: str, offset: int, users: int) -> None:
+    store = SqliteStateStore(path, flush_interval=0.2)
+    for uid in range(offset, offset + users):
+        store.put(uid, UserState("ai", "backend"))
+    store.close()
+
+def multiprocess(path: str, procs: int = 4, users: int = 25_000) -> dict:
+    t0 = time.perf_counter()
+    ps = [multiprocessing.Process(target=_worker, args=(path, i * users, users)) for i in range(procs)]
+    for p in ps:
+        p.start()
+    for p in ps:
+        p.join()
+    elapsed = time.perf_counter() - t0
+    check = SqliteStateStore(path)
+    stored = len(check)
+    check.close()
+    return {"procs": procs, "written": procs * users, "stored": stored, "writes_per_s": procs * users / elapsed}
+
+def run(users: int = 100_000, ops: int = 300_000) -> dict:
+    tmp = tempfile.mkdtemp(prefix="itmo-bench-")
+    sqlite_store = SqliteStateStore(os.path.join(tmp, "state.db"))
+    out = {
+        "users": users,
+        "bytes_per_state_slots": bytes_per_state(UserState),
+        "bytes_per_state_dict": bytes_per_state(_DictUserState),
+        "memory_ops_per_s": simulate(MemoryStateStore(max_users=users), users, ops),
+        "sqlite_ops_per_s": simulate(sqlite_store, users, ops),
+    }
+    sqlite_store.close()
+    out["multiprocess"] = multiprocess(os.path.join(tmp, "shared.db"), users=users // 4)
+    return out
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    for k, v in run(users, ops=users * 3).items():
+        print(f"{k:>22}: {v:,.1f}" if isinstance(v, float) else f"{k:>22}: {v}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# bench/bench_storage.py
+# Хранение страниц программ: размер БД и латентность list_programs до и после
+# сжатия about_html/faq_text и сводок без HTML. «До» — БД в схеме версии 2
+# (текст как есть, list_programs читает все колонки); «после» — та же БД,
+# открытая Repository (миграция сжимает её на месте).
+# Запуск из каталога itmo_advisor: python -m bench.bench_storage [программ] [КБ HTML на программу]
+import os, random, sqlite3, sys, tempfile, time
+from bench.common import WORDS, measure
+from repository import SCHEMA, Repository
+
+def program_html(rnd: random.Random, size_kb: int) -> str:
+    """Страница, похожая на abit.itmo.ru: вложенная разметка с классами и русским текстом."""
+    parts, n = ['<!DOCTYPE html><html lang="ru"><head><meta charset="utf-8"></head><body>'], 0
+    while n < size_kb * 1024:
+        text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(8, 40)))
+        block = (f'<div class="Accordion_accordion__item__{rnd.randint(100, 999)}">'
+                 f'<h5 class="Accordion_accordion__title">{rnd.choice(WORDS).capitalize()}?</h5>'
+                 f'<div class="Accordion_accordion__content"><p>{text}</p></div></div>')
+        parts.append(block)
+        n += len(block.encode("utf-8"))
+    parts.append("</body></html>")
+    return "".join(parts)
+
+def legacy_db(path: str, n_programs: int, size_kb: int, rnd_seed: int = 0) -> None:
+    rnd = random.Random(rnd_seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute("PRAGMA user_version=2")
+    for i in range(n_programs):
+        faq = "\n\n".join(f"Какие {rnd.choice(WORDS)}?\nОтвет про {rnd.choice(WORDS)}" for _ in range(20))
+        conn.execute("INSERT INTO programs(code,name,url,plan_url,about_html,faq_text) VALUES(?,?,?,?,?,?)",
+                     (f"prog{i:03d}", f"Программа {i}", f"https://example.invalid/{i}", None,
+                      program_html(rnd, size_kb), faq))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+def legacy_list(conn: sqlite3.Connection):
+    # list_programs до изменения: все колонки, включая страницы целиком
+    return conn.execute("SELECT code,name,url,plan_url,about_html,faq_text FROM programs").fetchall()
+
+def main():
+    n_programs = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    path = os.path.join(tempfile.mkdtemp(prefix="itmo-bench-"), "storage.db")
+    legacy_db(path, n_programs, size_kb)
+    before_size = os.path.getsize(path)
+    conn = sqlite3.connect(path)
+    before = measure(lambda: legacy_list(conn), repeat=20)
+    conn.close()
+
+    t0 = time.perf_counter()
+    repo = Repository(path)
+    migration = time.perf_counter() - t0
+    after_size = os.path.getsize(path)
+    summary = measure(lambda: repo.list_programs(), repeat=20)
+    full = measure(lambda: repo.list_programs(full=True), repeat=20)
+    one_html = measure(lambda: repo.get_program_html("prog000"), repeat=20)
+
+    mb = 1024 * 1024
+    print(f"программ: {n_programs}, HTML: ~{size_kb} КБ на программу")
+    print(f"размер БД: {before_size / mb:.1f} МБ -> {after_size / mb:.1f} МБ "
+          f"({before_size / after_size:.1f}x), миграция {migration:.2f} с")
+    print(f"list_programs (раньше, все колонки):   p50 {before['p50_ms']:8.2f} мс")
+    print(f"list_programs() — сводки:              p50 {summary['p50_ms']:8.2f} мс")
+    print(f"list_programs(full=True) — с HTML:     p50 {full['p50_ms']:8.2f} мс")
+    print(f"get_program_html — одна страница:      p50 {one_html['p50_ms']:8.2f} мс")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# bench/common.py
+import os, random, statistics, tempfile, time
+from typing import Callable, Dict, List
+from domain import Course, Program
+from repository import Repository
+
+WORDS = (
+    "машинное обучение нейронные сети компьютерное зрение обработка естественного языка "
+    "генеративные модели продукт менеджмент данные облачные вычисления архитектура систем "
+    "mlops big data nlp vision production аналитика статистика оптимизация проект практикум "
+    "глубокое обучение рекомендательные системы этика исследования исследовательский семинар"
+).split()
+TAGS = ["mlops", "data", "cv", "nlp", "genai", "product", "pm", "arch", "bigdata", "cloud"]
+QUESTIONS = [
+    "какие курсы по компьютерному зрению есть",
+    "сколько кредитов за машинное обучение",
+    "какие экзамены при поступлении",
+    "есть ли элективы по nlp",
+    "что изучают во втором семестре",
+    "курсы по продукту и менеджменту",
+]
+
+def temp_repo() -> Repository:
+    return Repository(os.path.join(tempfile.mkdtemp(prefix="itmo-bench-"), "bench.db"))
+
+def seed(repo: Repository, n_programs: int, n_courses: int, rnd_seed: int = 0) -> List[str]:
+    """Синтетический каталог: n_programs программ и n_courses курсов, поровну между ними."""
+    rnd = random.Random(rnd_seed)
+    codes = [f"prog{i:03d}" for i in range(n_programs)]
+    per = max(1, n_courses // n_programs)
+    for code in codes:
+        faqs = [(f"Какие {rnd.choice(WORDS)} {rnd.choice(WORDS)}?", f"Ответ про {rnd.choice(WORDS)}") for _ in range(5)]
+        faq = "\n\n".join(f"{q}\n{a}" for q, a in faqs)
+        repo.upsert_program(Program(code, f"Программа {code}", f"https://example.invalid/{code}", faq_text=faq))
+        repo.replace_faqs(code, faqs)
+        courses = []
+        for j in range(per):
+            name = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))) + f" {j}"
+            elective = rnd.random() < 0.4
+            courses.append(Course(
+                program_code=code, name=name, semester=rnd.randint(1, 4),
+                type="elective" if elective else "core", hours=rnd.choice([72, 108, 144, 180]),
+                credits=rnd.choice([2.0, 3.0, 4.0, 5.0, 6.0]),
+                raw=f"{name} {'(по выбору) ' if elective else ''}{rnd.randint(2, 6)} з.е.",
+                tags=rnd.sample(TAGS, rnd.randint(0, 3)),
+            ))
+        repo.replace_courses(code, courses)
+    return codes
+
+def measure(fn: Callable[[], object], repeat: int = 50, warmup: int = 3) -> Dict[str, float]:
+    """Латентность вызова в миллисекундах: среднее, p50, p95."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.fmean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+    }
+
+def plan_text(n_courses: int, rnd_seed: int = 0) -> str:
+    """Текст учебного плана в духе извлечённого из PDF: семестры, курсы, шум."""
+    rnd = random.Random(rnd_seed)
+    lines = []
+    for j in range(n_courses):
+        if j % 40 == 0:
+            lines.append(f"{j // 40 % 4 + 1} семестр")
+            lines.append("Наименование дисциплины Трудоемкость, з.е. Часы")
+        name = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))).capitalize()
+        extra = " (по выбору)" if rnd.random() < 0.3 else ""
+        lines.append(f"{name}{extra} {rnd.choice([2, 3, 4, 6])} з.е. {rnd.choice([72, 108, 144])} ч")
+        if rnd.random() < 0.2:
+            lines.append(rnd.choice(["Блок 1", "Итого", "стр. 3", ""]))
+    return "\n".join(lines)
@@ -0,0 +1,143 @@
+# bench/suite.py
+# Сводный бенчмарк конвейера: синтетическая БД через Repository (от 2 программ до сотен
+# программ и 100k курсов), затем Retriever.build/query, QAService.answer,
+# ElectiveRecommender, CurriculumParser._parse_text_lines и нагрузка на бота через
+# bench/telegram_driver. Результат пишется в JSON (bench/results/), --compare печатает
+# отношение к предыдущему прогону.
+# Запуск из каталога itmo_advisor:
+#   python -m bench.suite --scale small
+#   python -m bench.suite --programs 200 --courses 100000 --compare bench/results/<прошлый>.json
+import argparse, json, os, platform, subprocess, sys, time
+from datetime import datetime, timezone
+from bench.common import QUESTIONS, measure, plan_text, seed, temp_repo
+
+SCALES = {
+    "small": {"programs": 2, "courses": 2_000},
+    "medium": {"programs": 20, "courses": 20_000},
+    "large": {"programs": 200, "courses": 100_000},
+}
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(__file__), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def timed(fn):
+    t0 = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t0
+
+def with_qps(m: dict) -> dict:
+    return {**m, "qps": 1000.0 / m["mean_ms"] if m["mean_ms"] else 0.0}
+
+def run(programs: int, courses: int, repeat: int = 200, bot_users: int = 100) -> dict:
+    from retriever import Retriever
+    from qa import QAService
+    from recommender import ElectiveRecommender
+    from curriculum_parser import CurriculumParser
+    from bench import telegram_driver
+
+    out = {"params": {"programs": programs, "courses": courses, "repeat": repeat, "bot_users": bot_users}}
+    repo = temp_repo()
+    codes, out["seed_s"] = timed(lambda: seed(repo, programs, courses))
+
+    ret = Retriever(repo)
+    _, out["build_s"] = timed(ret.build)
+    out["docs"] = ret.n_docs
+    qs = iter(QUESTIONS * repeat * 4)
+    prog = iter(codes * repeat * 4)
+    out["query"] = with_qps(measure(lambda: ret.query(next(qs)), repeat))
+    out["query_program"] = with_qps(measure(lambda: ret.query(next(qs), program_code=next(prog)), repeat))
+
+    qa = QAService(repo, ret)
+
+    def cold():
+        qa.cache.clear()
+        return qa.answer(next(prog), next(qs))
+    out["answer_cold"] = with_qps(measure(cold, repeat))
+    out["answer_warm"] = with_qps(measure(lambda: qa.answer(codes[0], QUESTIONS[0]), repeat))
+
+    reco = ElectiveRecommender()
+    bgs = iter(list(reco.background_map) * repeat * 4)
+    out["recommend_list"] = with_qps(measure(
+        lambda: reco.recommend(repo.list_courses(codes[0]), next(bgs), limit=6), repeat))
+    out["recommend_for"] = with_qps(measure(
+        lambda: reco.recommend_for(repo, codes[0], next(bgs), limit=6), repeat))
+
+    def recommend_cold():
+        reco._compiled.clear()
+        return reco.recommend_for(repo, next(prog), next(bgs), limit=6)
+    out["recommend_for_cold"] = with_qps(measure(recommend_cold, repeat))
+
+    parser = CurriculumParser(repo)
+    per_program = max(1, courses // programs)
+    text = plan_text(per_program)
+    lines = text.count("\n") + 1
+    parsed = parser._parse_text_lines(text)
+    m = measure(lambda: parser._parse_text_lines(text), max(5, repeat // 20))
+    out["parse"] = {**m, "lines": lines, "courses": len(parsed), "lines_per_s": lines / (m["mean_ms"] / 1000)}
+
+    if bot_users:
+        out["bot"] = telegram_driver.run(users=bot_users, questions=5, repo=repo, retriever=ret)
+    repo.close()
+    return out
+
+def flatten(d: dict, prefix: str = "") -> dict:
+    flat = {}
+    for k, v in d.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            flat.update(flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = v
+    return flat
+
+def compare(new: dict, old: dict) -> str:
+    """Метрики обоих прогонов и отношение new/old (для *_ms и *_s меньше — лучше)."""
+    a, b = flatten(new["results"]), flatten(old["results"])
+    lines = [f"{'метрика':<32} {'было':>12} {'стало':>12} {'new/old':>8}"]
+    for k in a:
+        if k in b and not k.startswith("params."):
+            ratio = a[k] / b[k] if b[k] else float("inf")
+            lines.append(f"{k:<32} {b[k]:>12.3f} {a[k]:>12.3f} {ratio:>8.2f}")
+    return "\n".join(lines)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", choices=sorted(SCALES), default="small")
+    ap.add_argument("--programs", type=int)
+    ap.add_argument("--courses", type=int)
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--bot-users", type=int, default=100, help="0 — без прогона бота")
+    ap.add_argument("--out", help="Путь к JSON (по умолчанию bench/results/<время>-<коммит>.json)")
+    ap.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = ap.parse_args()
+    scale = SCALES[args.scale]
+    programs = args.programs or scale["programs"]
+    courses = args.courses or scale["courses"]
+
+    commit = git_commit()
+    doc = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": run(programs, courses, args.repeat, args.bot_users),
+    }
+    path = args.out or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit or 'nogit'}-{programs}x{courses}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    print(json.dumps(doc["results"], ensure_ascii=False, indent=2))
+    print(f"результат: {path}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print(compare(doc, json.load(f)))
+
+if __name__ == "__main__":
+    main()
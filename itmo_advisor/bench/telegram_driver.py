@@ -0,0 +1,333 @@
+# bench/telegram_driver.py
+# Нагрузка на TelegramBot без сети: настоящий Application и обработчики, но Bot API
+# подменён FakeTelegramAPI (транспорт python-telegram-bot), а апдейты собираются локально
+# и кладутся в Application.update_queue (как при polling). Пользователи идут параллельно, сообщения
+# одного пользователя — по порядку, как в живом чате.
+# --webhook: те же диалоги, но апдейты идут POST-запросами в локальный webhook-сервер
+# бота, а следующий вопрос пользователь шлёт, только получив ответ. --burst: пользователь
+# шлёт все сообщения сразу, не дожидаясь ответов (проверка порядка и ответа «занят»).
+# --http: FakeTelegramAPI поднимается HTTP-сервером, бот ходит к нему обычным HTTP-клиентом.
+# --flood: фейковый Bot API держит лимиты Telegram (429 с retry_after), а outbox бота —
+# свои; без --flood лимиты выключены с обеих сторон и меряется пропускная способность бота.
+# --stop: все сообщения кладутся в очередь разом, и бот сразу останавливается, пока ответы ещё
+# стоят в outbox; проверяется, что они доставлены до закрытия HTTP-клиента бота.
+# Запуск из каталога itmo_advisor:
+#   python -m bench.telegram_driver [пользователей] [вопросов] [--webhook] [--burst] [--http] [--flood] [--stop]
+import asyncio, itertools, json, math, socket, sys, time
+from typing import Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+from bench.common import QUESTIONS, seed, temp_repo
+from outbox import MAX_MESSAGE_LEN, RateLimits, TokenBucket, tg_len
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+class FakeTelegramAPI(BaseRequest):
+    """
+    Отвечает на вызовы Bot API из памяти и запоминает отправленные сообщения. С limits
+    ведёт себя как Telegram под нагрузкой: сообщение сверх лимита (общего или чата)
+    получает 429 с retry_after (не меньше retry_floor секунд), длиннее 4096 символов — 400.
+    """
+    def __init__(self, latency: float = 0.0, limits: Optional[RateLimits] = None, retry_floor: float = 1.0):
+        self.latency = latency  # имитация RTT до api.telegram.org
+        self.limits = limits
+        self.retry_floor = retry_floor
+        self.sent: Dict[int, List[str]] = {}
+        self.calls = 0
+        self.flooded = 0   # ответов 429
+        self.rejected = 0  # ответов 400
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._replied: Dict[int, asyncio.Event] = {}
+        self._global = TokenBucket(limits.global_rate, max(1.0, limits.global_rate)) if limits else None
+        self._chats: Dict[int, TokenBucket] = {}
+
+    def replied(self, chat_id: int) -> asyncio.Event:
+        return self._replied.setdefault(chat_id, asyncio.Event())
+
+    async def initialize(self) -> None:
+        self.closed = False
+
+    async def shutdown(self) -> None:
+        # как HTTPXRequest: после bot.shutdown запросы не уходят
+        self.closed = True
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        return await self.handle(url.rsplit("/", 1)[-1], request_data.parameters if request_data else {})
+
+    async def handle(self, endpoint: str, params: dict) -> Tuple[int, bytes]:
+        if self.closed:
+            raise RuntimeError("FakeTelegramAPI закрыт: запрос после bot.shutdown")
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "sendMessage":
+            chat_id = int(params["chat_id"])
+            error = self._check(chat_id, params["text"])
+            if error:
+                return error
+            self.sent.setdefault(chat_id, []).append(params["text"])
+            self.replied(chat_id).set()
+            result = {"message_id": next(self._ids), "date": int(time.time()), "text": params["text"],
+                      "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    def _check(self, chat_id: int, text: str) -> Optional[Tuple[int, bytes]]:
+        if tg_len(text) > MAX_MESSAGE_LEN:
+            self.rejected += 1
+            return 400, json.dumps({"ok": False, "error_code": 400,
+                                    "description": "Bad Request: message is too long"}).encode("utf-8")
+        if self.limits is None:
+            return None
+        chat = self._chats.get(chat_id)
+        if chat is None and (self.limits.chat_rate > 0 or chat_id < 0):
+            chat = self._chats[chat_id] = (TokenBucket(self.limits.group_rate, 1) if chat_id < 0 else
+                                           TokenBucket(self.limits.chat_rate, self.limits.chat_burst))
+        wait = max(self._global.delay() if self.limits.global_rate > 0 else 0.0, chat.delay() if chat else 0.0)
+        if wait > 0:
+            self.flooded += 1
+            retry = max(self.retry_floor, wait)
+            # Telegram отдаёт целые секунды; при ускоренном времени (retry_floor < 1) — дробные
+            retry = math.ceil(retry) if self.retry_floor >= 1 else round(retry, 3)
+            return 429, json.dumps({"ok": False, "error_code": 429, "parameters": {"retry_after": retry},
+                                    "description": f"Too Many Requests: retry after {retry}"}).encode("utf-8")
+        if self.limits.global_rate > 0:
+            self._global.reserve()
+        if chat:
+            chat.reserve()
+        return None
+
+def serve_http(api: FakeTelegramAPI, port: int):
+    """FakeTelegramAPI как HTTP-сервер: бот с base_url http://127.0.0.1:port/bot ходит к нему по сети."""
+    from tornado.web import Application, RequestHandler
+
+    class Handler(RequestHandler):
+        async def post(self, endpoint: str):
+            params = {k: self.get_body_argument(k) for k in self.request.body_arguments}
+            code, payload = await api.handle(endpoint, params)
+            self.set_status(code)
+            self.set_header("Content-Type", "application/json")
+            self.finish(payload)
+
+    return Application([(r"/bot[^/]+/(\w+)", Handler)]).listen(port, "127.0.0.1")
+
+_update_ids = itertools.count(1)
+
+def update_json(user_id: int, text: str) -> dict:
+    uid = next(_update_ids)
+    message = {"message_id": uid, "date": int(time.time()), "text": text,
+               "chat": {"id": user_id, "type": "private"},
+               "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": uid, "message": message}
+
+def make_update(bot, user_id: int, text: str) -> Update:
+    return Update.de_json(update_json(user_id, text), bot)
+
+def script(n_questions: int, user_id: int) -> List[str]:
+    """Типичный диалог: /start, выбор программы, бэкграунд, вопросы, /recommend."""
+    qs = [QUESTIONS[(user_id + i) % len(QUESTIONS)] for i in range(n_questions)]
+    return ["/start", "ai" if user_id % 2 else "ai_product", "я джун ML, хочу в прод", *qs, "/recommend"]
+
+async def drive(tb, api: FakeTelegramAPI, users: int = 200, questions: int = 5) -> dict:
+    """
+    Прогоняет users диалогов одновременно; латентность — от апдейта до отправленного ответа.
+    Апдейты кладутся в update_queue, как их кладёт Updater при polling, — то есть проходят
+    через ChatOrderedProcessor (порядок в чате, слоты, «занят»).
+    """
+    app = tb.app
+    await app.initialize()
+    await app.start()
+    latencies: List[float] = []
+
+    async def user(uid: int):
+        for text in script(questions, uid):
+            upd = make_update(app.bot, uid, text)
+            ev = api.replied(uid)
+            ev.clear()
+            t0 = time.perf_counter()
+            await app.update_queue.put(upd)
+            # ответ уходит через outbox: ждём, пока он дойдёт до Bot API
+            await ev.wait()
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(10_000 + i) for i in range(users)))
+    elapsed = time.perf_counter() - t0
+    await stop(app)
+    answered = sum(len(v) for v in api.sent.values())
+    return {"users": users, "updates": len(latencies), "replies": answered,
+            "updates_per_s": len(latencies) / elapsed, **_pct(latencies),
+            "batches": tb.qa_batcher.batches, "batched_questions": tb.qa_batcher.items, **_outbox(tb, api)}
+
+async def stop(app) -> None:
+    """Останавливает Application в том же порядке, что run_polling/run_webhook, вместе с хуками."""
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+async def drive_stop(tb, api: FakeTelegramAPI, users: int = 200, questions: int = 5) -> dict:
+    """
+    Все сообщения всех пользователей — в update_queue разом; как только ответы на них поставлены
+    в outbox, бот останавливается. Ответы в этот момент ещё в очереди, и дойти до Bot API они
+    должны раньше, чем bot.shutdown закроет транспорт.
+    """
+    app = tb.app
+    await app.initialize()
+    await app.start()
+    expected = 0
+    for uid in range(10_000, 10_000 + users):
+        for text in script(questions, uid):
+            await app.update_queue.put(make_update(app.bot, uid, text))
+            expected += 1
+    # обработчики отработали, ответы поставлены в outbox, но ещё не отправлены
+    out = tb.outbox
+    while out.sent + out.coalesced + out.pending < expected:
+        await asyncio.sleep(0.001)
+    t0 = time.perf_counter()
+    await app.stop()
+    queued = tb.outbox.pending
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    delivered = out.sent + out.coalesced
+    assert queued > 0, "к остановке outbox уже пуст — случай не проверяет порядок хуков"
+    assert out.failed == 0 and delivered == expected, (delivered, expected, out.stats())
+    return {"mode": "stop", "users": users, "updates": expected, "queued_at_stop": queued,
+            "replies": delivered, "stop_s": time.perf_counter() - t0, **_outbox(tb, api)}
+
+def _outbox(tb, api: FakeTelegramAPI) -> dict:
+    out = tb.outbox.stats()
+    return {"api_calls": api.calls, "flood_429": api.flooded, "retries": out["retries"],
+            "coalesced": out["coalesced"], "undelivered": out["failed"]}
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _pct(latencies: List[float]) -> dict:
+    latencies = sorted(latencies) or [0.0]
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+# начало ответов на первые три сообщения script(): /start, программа, бэкграунд
+_SCRIPT_REPLIES = ("Привет!", "Вы выбрали программу", "Отлично, учту")
+
+async def drive_webhook(tb, api: FakeTelegramAPI, users: int = 200, questions: int = 5,
+                        port: int = 0, burst: bool = False) -> dict:
+    """
+    Апдейты — POST в webhook-сервер бота (как их шлёт Telegram). Без burst пользователь
+    ждёт ответа перед следующим сообщением; латентность — от POST до ответа бота.
+    """
+    import httpx
+    from update_processor import BUSY_TEXT
+    app, secret, path = tb.app, "bench-secret", "telegram"
+    port = port or _free_port()
+    await app.initialize()
+    await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path=path, secret_token=secret,
+                                    webhook_url=f"http://127.0.0.1:{port}/{path}")
+    await app.start()
+    url = f"http://127.0.0.1:{port}/{path}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    latencies: List[float] = []
+
+    async with httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=100)) as client:
+        async def user(uid: int):
+            texts = script(questions, uid)
+            if burst:
+                for text in texts:
+                    r = await client.post(url, json=update_json(uid, text), headers=headers)
+                    r.raise_for_status()
+                return
+            for text in texts:
+                ev = api.replied(uid)
+                ev.clear()
+                t0 = time.perf_counter()
+                r = await client.post(url, json=update_json(uid, text), headers=headers)
+                r.raise_for_status()
+                await ev.wait()
+                latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(10_000 + i) for i in range(users)))
+        expected = users * (questions + 4)
+        # в burst ответы догоняют после последнего POST; склеенные outbox считаются по одному
+        out = tb.outbox
+        while out.sent + out.coalesced + out.failed < expected and time.perf_counter() - t0 < 120:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - t0
+    await app.updater.stop()
+    await stop(app)
+    # outbox склеивает ответы, скопившиеся в чате, — поэтому смотрим на весь текст чата
+    chats = ["\n\n".join(v) for v in api.sent.values()]
+    busy = sum(text.count(BUSY_TEXT) for text in chats)
+    # порядок внутри чата: если ничего не отброшено, первые три ответа идут в порядке сценария
+    out_of_order = sum(1 for text in chats if BUSY_TEXT not in text
+                       and not _in_order(text, _SCRIPT_REPLIES))
+    return {"mode": "webhook-burst" if burst else "webhook", "users": users,
+            "replies": tb.outbox.sent + tb.outbox.coalesced, "busy": busy, "out_of_order_chats": out_of_order,
+            "updates_per_s": expected / elapsed, **_pct(latencies),
+            "batches": tb.qa_batcher.batches, "batched_questions": tb.qa_batcher.items, **_outbox(tb, api)}
+
+def _in_order(text: str, prefixes) -> bool:
+    pos = [text.find(p) for p in prefixes]
+    return -1 not in pos and pos == sorted(pos)
+
+def run(users: int = 200, questions: int = 5, n_courses: int = 10_000, latency: float = 0.0,
+        repo=None, retriever=None, webhook: bool = False, burst: bool = False,
+        http: bool = False, flood: bool = False, stop_queued: bool = False) -> dict:
+    from bot_telegram import TelegramBot
+    from retriever import Retriever
+    if repo is None:
+        repo = temp_repo()
+        seed(repo, 2, n_courses)
+    if retriever is None:
+        retriever = Retriever(repo)
+        retriever.build()
+    limits = RateLimits() if flood else RateLimits(global_rate=0, chat_rate=0, group_rate=0)
+    if stop_queued and not latency:
+        latency = 0.05  # без RTT outbox пустеет раньше, чем Application.stop вернёт управление
+    api = FakeTelegramAPI(latency, limits if flood else None)
+    port = _free_port()
+    if http:
+        tb = TelegramBot("123456:bench", repo, retriever, limits=limits, api_url=f"http://127.0.0.1:{port}")
+    else:
+        tb = TelegramBot("123456:bench", repo, retriever, request=api, limits=limits)
+
+    async def go():
+        server = serve_http(api, port) if http else None
+        try:
+            if stop_queued:
+                return await drive_stop(tb, api, users, questions)
+            if webhook or burst:
+                return await drive_webhook(tb, api, users, questions, burst=burst)
+            return await drive(tb, api, users, questions)
+        finally:
+            if server is not None:
+                server.stop()
+
+    return asyncio.run(go())
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    users = int(args[0]) if args else 200
+    questions = int(args[1]) if len(args) > 1 else 5
+    for k, v in run(users, questions, webhook="--webhook" in sys.argv, burst="--burst" in sys.argv,
+                    http="--http" in sys.argv, flood="--flood" in sys.argv,
+                    stop_queued="--stop" in sys.argv).items():
+        print(f"{k:>18}: {v:,.1f}" if isinstance(v, float) else f"{k:>18}: {v}")
+
+if __name__ == "__main__":
+    main()
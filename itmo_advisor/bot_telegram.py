@@ -1,22 +1,60 @@
 # bot_telegram.py
-import os
-from typing import Dict
+import asyncio, os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram.request import BaseRequest
 from repository import Repository
 from retriever import Retriever
 from qa import QAService
-from dialog import UserState, WELCOME, BACKGROUND_HELP, map_background
+from analytics import CurriculumAnalytics
+from dialog import UserState, BACKGROUND_HELP, map_background, program_prompt, welcome_text
 from recommender import ElectiveRecommender
+from registry import ProgramRegistry
+from batching import MicroBatcher
+from sync import SyncPipeline, SyncResult
+from state_store import StateStore, build_state_store, state_db_path
+from metrics import METRICS
+from update_processor import ChatOrderedProcessor
+from outbox import NOTICE, Outbox, RateLimits
+from config import (ADMIN_IDS, BOT_CONCURRENT_UPDATES, BOT_MAX_PENDING, BOT_MAX_PENDING_PER_CHAT, QA_WORKERS,
+                    TELEGRAM_API_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL)
 
 class TelegramBot:
-    def __init__(self, token: str, repo: Repository, retriever: Retriever):
+    def __init__(self, token: str, repo: Repository, retriever: Retriever, state: Optional[StateStore] = None,
+                 request: Optional[BaseRequest] = None, limits: Optional[RateLimits] = None,
+                 api_url: Optional[str] = TELEGRAM_API_URL):
         self.repo = repo
         self.ret = retriever
-        self.qa = QAService(repo, retriever)
+        # сводки и сравнения планов: считаются при синхронизации, здесь только читаются
+        self.analytics = CurriculumAnalytics(repo)
+        # программы из programs.json плюс уже синхронизированные в БД
+        self.programs = ProgramRegistry().with_repo(repo)
+        self.qa = QAService(repo, retriever, self.analytics, self.programs)
         self.reco = ElectiveRecommender()
-        self.app = Application.builder().token(token).build()
-        self.state: Dict[int, UserState] = {}
+        # поиск и рекомендации — CPU-работа: в ограниченном пуле, а не в цикле событий
+        self.executor = ThreadPoolExecutor(max_workers=QA_WORKERS, thread_name_prefix="qa")
+        # вопросы из разных чатов, пришедшие почти одновременно, отвечаются одной пачкой
+        self.qa_batcher = MicroBatcher(lambda items: self.qa.answer_batch(items), executor=self.executor)
+        # разные чаты — параллельно, один чат — по порядку; при перегрузке — ответ «занят»
+        self.processor = ChatOrderedProcessor(BOT_CONCURRENT_UPDATES, BOT_MAX_PENDING, BOT_MAX_PENDING_PER_CHAT)
+        builder = (Application.builder().token(token).post_stop(self._on_stop)
+                   .post_shutdown(self._on_shutdown).concurrent_updates(self.processor))
+        if request is not None:
+            # свой транспорт к Bot API (например, bench/telegram_driver.py без сети)
+            builder = builder.request(request).get_updates_request(request)
+        if api_url:
+            builder = builder.base_url(api_url.rstrip("/") + "/bot")
+        self.app = builder.build()
+        # ответы уходят через очередь с лимитами Bot API: обработчик не ждёт отправки и 429
+        self.outbox = Outbox(self.app.bot, limits)
+        self.processor.outbox = self.outbox
+        # состояние диалогов: по умолчанию в SQLite-БД рядом с каталогом, переживает рестарты
+        self.state = state if state is not None else build_state_store(path=state_db_path(repo.path))
+        # фоновая синхронизация: одна задача на всех, остальные /sync ждут её результата
+        self._sync_job: Optional[asyncio.Task] = None
+        self._sync_chats: Set[int] = set()
         self._setup_handlers()
 
     def _setup_handlers(self):
@@ -24,77 +62,169 @@ class TelegramBot:
         self.app.add_handler(CommandHandler("sync", self.on_sync))
         self.app.add_handler(CommandHandler("switch", self.on_switch))
         self.app.add_handler(CommandHandler("recommend", self.on_recommend))
+        self.app.add_handler(CommandHandler("compare", self.on_compare))
+        self.app.add_handler(CommandHandler("stats", self.on_stats))
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.on_text))
 
     async def on_start(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         uid = upd.effective_user.id
-        self.state[uid] = UserState()
-        await upd.message.reply_text(WELCOME)
+        self.state.put(uid, UserState())
+        self._reply(upd, welcome_text(self.programs))
 
     async def on_switch(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         uid = upd.effective_user.id
-        st = self.state.setdefault(uid, UserState())
+        st = self.state.get(uid)
         st.program_code = None
-        await upd.message.reply_text("Ок, выберем программу заново. Напишите ai или ai_product.")
+        self.state.put(uid, st)
+        self._reply(upd, "Ок, выберем программу заново. " + program_prompt(self.programs))
 
     async def on_sync(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
-        from scraper import ItmoProgramScraper
-        from curriculum_parser import CurriculumParser
-        s = ItmoProgramScraper(self.repo)
-        s.full_sync()
-        parser = CurriculumParser(self.repo)
-        for p in self.repo.list_programs():
-            courses = parser.parse_for_program(p.code)
-            self.repo.replace_courses(p.code, courses)
-        self.ret.build()
-        await upd.message.reply_text("Данные обновлены. Задавайте вопросы!")
+        self._sync_chats.add(upd.effective_chat.id)
+        if self._sync_job and not self._sync_job.done():
+            self._reply(upd, "Синхронизация уже идёт — пришлю результат, когда закончится.")
+            return
+        self._reply(upd, "Запускаю синхронизацию в фоне, бот продолжает отвечать на вопросы.")
+        self._sync_job = ctx.application.create_task(self._run_sync(ctx))
+
+    async def _run_sync(self, ctx: ContextTypes.DEFAULT_TYPE):
+        loop = asyncio.get_running_loop()
+
+        def progress(msg: str):
+            # вызывается из рабочего потока
+            asyncio.run_coroutine_threadsafe(self._notify_sync(ctx, msg), loop)
+
+        try:
+            res = await loop.run_in_executor(None, self._sync_worker, progress)
+        except Exception as e:
+            await self._notify_sync(ctx, f"Синхронизация не удалась: {e}")
+        else:
+            if res.retriever is None:
+                await self._notify_sync(ctx, f"Изменений на сайте нет, индекс актуален. Проверка заняла {res.summary()}.")
+                return
+            # атомарная подмена: запросы до этой строки обслуживает старый индекс
+            self.ret = res.retriever
+            self.qa.ret = res.retriever
+            await self._notify_sync(ctx, f"Данные обновлены за {res.summary()}. Задавайте вопросы!")
+        finally:
+            self._sync_chats.clear()
+
+    def _sync_worker(self, progress) -> SyncResult:
+        # Repository держит по соединению на поток, так что воркеру можно отдать общий;
+        # живой индекс — основа нового: пересоберутся только сегменты изменившихся программ
+        return SyncPipeline(self.repo).run(progress, base=self.ret)
+
+    async def _notify_sync(self, ctx: ContextTypes.DEFAULT_TYPE, msg: str):
+        for chat_id in list(self._sync_chats):
+            self.outbox.send(chat_id, msg, priority=NOTICE)
+
+    def _reply(self, upd: Update, text: str) -> None:
+        self.outbox.send(upd.effective_chat.id, text)
 
     async def on_recommend(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         uid = upd.effective_user.id
-        st = self.state.setdefault(uid, UserState())
+        st = self.state.get(uid)
         if not st.program_code:
-            await upd.message.reply_text("Сначала выберите программу: ai или ai_product")
+            self._reply(upd, "Сначала выберите программу. " + program_prompt(self.programs))
             return
         if not st.background_key:
-            await upd.message.reply_text(BACKGROUND_HELP)
+            self._reply(upd, BACKGROUND_HELP)
             return
-        courses = self.repo.list_courses(st.program_code)
-        recs = self.reco.recommend(courses, st.background_key, limit=6)
+        recs = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.reco.recommend_for, self.repo, st.program_code, st.background_key, 6)
         if not recs:
-            await upd.message.reply_text("Пока не нашёл подходящих элективов в плане. Попробуйте другой бэкграунд.")
+            self._reply(upd, "Пока не нашёл подходящих элективов в плане. Попробуйте другой бэкграунд.")
             return
         msg = "Рекомендованные элективы под ваш профиль:\n" + "\n".join(
             [f"• {c.name} (семестр {c.semester or '—'}, теги: {', '.join(c.tags) or '—'})" for c in recs]
         )
-        await upd.message.reply_text(msg)
+        self._reply(upd, msg)
+
+    async def on_compare(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
+        # /compare [программа] [программа]: недостающие — выбранная программа и, если
+        # программ всего две, вторая из них
+        progs = [(arg, self.programs.resolve(arg)) for arg in (ctx.args or [])[:2]]
+        unknown = [arg for arg, p in progs if p is None]
+        if unknown:
+            self._reply(upd, f"Не узнал программу «{unknown[0]}». " + program_prompt(self.programs))
+            return
+        codes = [p.code for _, p in progs]
+        current = self.state.get(upd.effective_user.id).program_code
+        if len(codes) < 2 and current and current not in codes:
+            codes.insert(0, current)
+        others = [c for c in self.programs.codes if c not in codes]
+        if len(codes) < 2 and len(codes) + len(others) == 2:
+            codes += others
+        if len(codes) < 2 or codes[0] == codes[1]:
+            self._reply(upd, "Укажите две программы, например: /compare 1 2\n" + self.programs.menu())
+            return
+        text = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.analytics.compare, codes[0], codes[1])
+        self._reply(upd, text or "Для сравнения нужны учебные планы обеих программ — их загружает /sync.")
 
     async def on_text(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         uid = upd.effective_user.id
-        st = self.state.setdefault(uid, UserState())
+        st = self.state.get(uid)
         text = upd.message.text.strip()
 
         if st.program_code is None:
-            if text.lower() in ("ai", "ai_product"):
-                st.program_code = text.lower()
-                await upd.message.reply_text(
-                    f"Вы выбрали программу: {st.program_code}. Теперь расскажите про ваш бэкграунд.\n{BACKGROUND_HELP}"
-                )
+            prog = self.programs.resolve(text)
+            if prog:
+                st.program_code = prog.code
+                self.state.put(uid, st)
+                self._reply(upd, f"Вы выбрали программу: «{prog.name}». Теперь расскажите про ваш бэкграунд.\n"
+                                 f"{BACKGROUND_HELP}")
             else:
-                await upd.message.reply_text("Напишите: ai или ai_product.")
+                self._reply(upd, "Не узнал программу. " + program_prompt(self.programs))
             return
 
         if st.background_key is None:
             bg = map_background(text)
             if bg:
                 st.background_key = bg
-                await upd.message.reply_text(f"Отлично, учту ваш профиль: {bg}. Задавайте вопросы по обучению или вызовите /recommend.")
+                self.state.put(uid, st)
+                self._reply(upd, f"Отлично, учту ваш профиль: {bg}. Задавайте вопросы по обучению или вызовите /recommend.")
             else:
-                await upd.message.reply_text(BACKGROUND_HELP)
+                self._reply(upd, BACKGROUND_HELP)
             return
 
         # Вопросы по программе
-        ans = self.qa.answer(st.program_code, text)
-        await upd.message.reply_text(ans)
+        with METRICS.span("bot.on_text"):
+            ans = await self.qa_batcher.submit((st.program_code, text))
+        # отправку (и её задержки из-за лимитов) считает outbox.send
+        self._reply(upd, ans)
+
+    async def on_stats(self, upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
+        # внутренние метрики — только администраторам; без ADMIN_IDS команда закрыта для всех
+        if upd.effective_user is None or upd.effective_user.id not in ADMIN_IDS:
+            return
+        lines = [METRICS.summary() if METRICS.enabled else "Метрики выключены (METRICS_ENABLED=1 включает)."]
+        cache = self.qa.cache_stats()
+        lines.append(f"кэш ответов: {cache['size']} записей, попаданий {cache['hits']}, промахов {cache['misses']}")
+        lines.append(f"пакеты вопросов: {self.qa_batcher.batches}, вопросов в них: {self.qa_batcher.items}")
+        lines.append(f"пользователей в хранилище состояний: {len(self.state)}")
+        out = self.outbox.stats()
+        lines.append(f"исходящие: отправлено {out['sent']}, склеено {out['coalesced']}, повторов {out['retries']}, "
+                     f"не доставлено {out['failed']}, в очереди {out['pending']}")
+        self._reply(upd, "\n".join(lines))
+
+    async def _on_stop(self, app: Application):
+        # post_stop идёт до bot.shutdown: HTTP-клиент ещё открыт, очередь успевает уйти
+        await self.outbox.close()
+
+    async def _on_shutdown(self, app: Application):
+        self.executor.shutdown(wait=False)
+        self.state.close()
 
     def run(self):
-        self.app.run_polling()
\ No newline at end of file
+        self.app.run_polling()
+
+    def run_webhook(self, url: Optional[str] = WEBHOOK_URL, listen: str = WEBHOOK_LISTEN,
+                    port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH, secret: Optional[str] = WEBHOOK_SECRET):
+        """
+        HTTP-сервер для апдейтов от Telegram (нужен python-telegram-bot[webhooks]).
+        url — публичный HTTPS-адрес, который регистрируется через setWebhook; за reverse proxy
+        он отличается от listen:port. Обязателен: адрес вида http://127.0.0.1 Telegram отвергает.
+        """
+        if not url:
+            raise ValueError("WEBHOOK_URL не задан: нужен публичный https-адрес для setWebhook")
+        self.app.run_webhook(listen=listen, port=port, url_path=path, secret_token=secret, webhook_url=url)
\ No newline at end of file
@@ -1,22 +1,87 @@
 # config.py
 from dataclasses import dataclass
-import os
+from typing import List, Tuple
+import json, os
 
 AI_URL = "https://abit.itmo.ru/program/master/ai"
 AI_PRODUCT_URL = "https://abit.itmo.ru/program/master/ai_product"
 
 DATA_DIR = os.environ.get("DATA_DIR", "data")
 DB_PATH = os.environ.get("DB_PATH", os.path.join(DATA_DIR, "itmo_advisor.db"))
+INDEX_DIR = os.environ.get("INDEX_DIR", DB_PATH + ".index")  # сохранённый TF-IDF индекс основной БД (другие БД — см. retriever.index_dir)
 USER_AGENT = "Mozilla/5.0 (itmo-advisor-bot)"
 REQUEST_TIMEOUT = 25
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", os.path.join(DATA_DIR, "http_cache"))
+MAX_REQUESTS_PER_HOST = int(os.environ.get("MAX_REQUESTS_PER_HOST", "2"))
+REQUESTS_PER_SECOND_PER_HOST = float(os.environ.get("REQUESTS_PER_SECOND_PER_HOST", "4"))  # 0 — без лимита
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+TEXT_CACHE_DIR = os.environ.get("TEXT_CACHE_DIR", os.path.join(DATA_DIR, "text_cache"))
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", str(os.cpu_count() or 2)))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))  # секунды
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "sqlite")  # sqlite | memory
+STATE_MAX_USERS = int(os.environ.get("STATE_MAX_USERS", "100000"))
+STATE_IDLE_TTL = float(os.environ.get("STATE_IDLE_TTL", str(30 * 24 * 3600)))  # секунды
+STATE_FLUSH_INTERVAL = float(os.environ.get("STATE_FLUSH_INTERVAL", "1.0"))
+# состояния диалогов — в своей БД: их частые коммиты не должны будить читателей каталога
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", DB_PATH + ".state")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 — без HTTP-эндпоинта
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", os.path.join(DATA_DIR, "metrics.jsonl"))
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", "0"))  # секунды, 0 — без лога
+# id пользователей Telegram через запятую для /stats; пусто — команда не доступна никому
+ADMIN_IDS = {int(x) for x in os.environ.get("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+# обработка апдейтов: одновременно разных чатов, предел очереди до ответа «занят»
+BOT_CONCURRENT_UPDATES = int(os.environ.get("BOT_CONCURRENT_UPDATES", "32"))
+BOT_MAX_PENDING = int(os.environ.get("BOT_MAX_PENDING", "256"))
+BOT_MAX_PENDING_PER_CHAT = int(os.environ.get("BOT_MAX_PENDING_PER_CHAT", "5"))
+QA_WORKERS = int(os.environ.get("QA_WORKERS", str(min(4, os.cpu_count() or 1))))  # потоки для поиска
+# запрос без программы расходится по шардам индекса (SEARCH_SHARD_SIZE программ) в SEARCH_WORKERS потоков
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+SEARCH_SHARD_SIZE = int(os.environ.get("SEARCH_SHARD_SIZE", "32"))
+# словарь поиска: столько самых частых по корпусу термов, как max_features у TfidfVectorizer; 0 — все
+INDEX_MAX_FEATURES = int(os.environ.get("INDEX_MAX_FEATURES", "5000"))
+# webhook вместо long polling: включается app.py --webhook
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")  # публичный URL, который получит Telegram
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+# свой адрес Bot API (локальный telegram-bot-api или bench/telegram_driver.py --http); пусто — api.telegram.org
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL")
+# исходящие сообщения (outbox.py): лимиты Bot API — около 30 сообщений/с на бота,
+# около 1/с в один чат (короткие всплески допустимы) и 20/мин в группу
+OUTBOX_GLOBAL_RATE = float(os.environ.get("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.environ.get("OUTBOX_CHAT_RATE", "1"))  # 0 — без лимита на чат
+OUTBOX_CHAT_BURST = int(os.environ.get("OUTBOX_CHAT_BURST", "3"))
+OUTBOX_GROUP_RATE = float(os.environ.get("OUTBOX_GROUP_RATE", str(20 / 60)))
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "16"))  # одновременных запросов к Bot API
+OUTBOX_MAX_RETRIES = int(os.environ.get("OUTBOX_MAX_RETRIES", "5"))
+PDF_PAGES_PER_TASK = 25  # большие PDF режем на диапазоны страниц для пула процессов
+
+# список обслуживаемых программ: JSON [{code, name, url, aliases?}], см. programs.json
+PROGRAMS_FILE = os.environ.get("PROGRAMS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs.json"))
 
 @dataclass(frozen=True)
 class ProgramConfig:
     code: str
     name: str
     url: str
+    aliases: Tuple[str, ...] = ()  # как ещё пользователь может назвать программу в диалоге
 
-PROGRAMS = [
+DEFAULT_PROGRAMS = [
     ProgramConfig(code="ai", name="Искусственный интеллект", url=AI_URL),
     ProgramConfig(code="ai_product", name="Управление ИИ-продуктами (AI Product)", url=AI_PRODUCT_URL),
-]
\ No newline at end of file
+]
+
+def load_programs(path: str = PROGRAMS_FILE) -> List[ProgramConfig]:
+    """Программы из JSON-файла; без файла — две исходные программы."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+    except FileNotFoundError:
+        return list(DEFAULT_PROGRAMS)
+    return [ProgramConfig(code=i["code"], name=i["name"], url=i["url"],
+                          aliases=tuple(a.lower() for a in i.get("aliases", ()))) for i in items]
+
+PROGRAMS = load_programs()
\ No newline at end of file
@@ -1,102 +1,256 @@
 # curriculum_parser.py
-import os, re
-from typing import List
+import multiprocessing, os, re, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from domain import Course
 from repository import Repository
-from config import DATA_DIR
+from config import DATA_DIR, TEXT_CACHE_DIR, EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+from utils import file_hash, text_hash
 
 # Мы не знаем точный формат планов, поэтому делаем устойчивый к PDF/DOCX парсер.
 # Поддержка PDF: pdfminer.six; DOCX: python-docx. Если план не скачался, парсим текст страницы.
 
+# эвристики: строки со схемой "семестр X", тип курса в скобках, часы/зачёты числами.
+# Все признаки строки ищутся одним скомпилированным выражением за один проход по
+# строке в нижнем регистре (дешевле, чем re.I). Поиск продолжается со start+1, а не
+# с end совпадения: так перекрывающиеся признаки ("…электиВОПРОСЫ") не теряются,
+# и первое совпадение каждого признака то же, что дал бы отдельный re.search.
+_LINE_RE = re.compile(
+    r"(?P<sem>семестр[:\s]*(?P<sem_n>\d+))"
+    r"|(?P<cred>(?P<cred_n>\d+[.,]?\d*)\s*(?:з\.?е\.?|ects|кред))"
+    r"|(?P<hours>(?P<hours_n>\d+)\s*(?:час(?:ов|а)?|ч\.))"
+    r"|(?P<elective>электив|по выбору)"
+    r"|(?P<header>партнеры программы|карьера|вопросы|как поступить)"  # вероятные заголовки
+)
+_MULTISPACE_RE = re.compile(r"\s{2,}")
+
+TAG_KEYWORDS = [
+    ("mlops", "mlops"),
+    ("production", "production"),
+    ("data", "data"),
+    ("vision", "cv"),
+    ("computer vision", "cv"),
+    ("nlp", "nlp"),
+    ("генератив", "genai"),
+    ("продукт", "product"),
+    ("менедж", "pm"),
+    ("архитектур", "arch"),
+    ("big data", "bigdata"),
+    ("облач", "cloud"),
+]
+_TAG_RE = re.compile("|".join(re.escape(kw) for kw, _ in TAG_KEYWORDS))
+
+def match_tags(name: str) -> List[str]:
+    low = name.lower()
+    # общий regex отсекает большинство названий без тегов за один проход;
+    # порядок и повторы — как в TAG_KEYWORDS ("computer vision" даёт cv дважды)
+    if _TAG_RE.search(low) is None:
+        return []
+    return [tag for kw, tag in TAG_KEYWORDS if kw in low]
+
+def classify_line(line: str) -> Tuple[Optional[str], object]:
+    """
+    ("semester", N) | ("course", Course без program_code и семестра) | (None, None).
+    """
+    s = line.strip()
+    if not s:
+        return None, None
+    low = s.lower()
+    cred = hours = None
+    elective = header = False
+    m = _LINE_RE.search(low)
+    while m is not None:
+        kind = m.lastgroup
+        if kind == "sem":
+            # семестр важнее остального: дальше строку не смотрим
+            return "semester", int(m.group("sem_n"))
+        if kind == "cred":
+            if cred is None:
+                cred = m.group("cred_n")
+        elif kind == "hours":
+            if hours is None:
+                hours = m.group("hours_n")
+        elif kind == "elective":
+            elective = True
+        else:
+            header = True
+        m = _LINE_RE.search(low, m.start() + 1)
+    # Матчим "Название курса (электив)" или "Название курса — 3 з.е."
+    name = _MULTISPACE_RE.sub(" ", s.replace("\u00A0", " "))
+    if len(name) < 4 or header:
+        return None, None
+    credits = float(cred.replace(",", ".")) if cred is not None else None
+    hours_n = int(hours) if hours is not None else None
+    # грубая эвристика — пропустим строки слишком общие
+    if credits is None and hours_n is None and len(s.split()) <= 2:
+        return None, None
+    return "course", Course(program_code="", name=name, type="elective" if elective else "core",
+                            hours=hours_n, credits=credits, raw=s, tags=match_tags(name),
+                            is_elective=elective)
+
+def _iter_lines(text: Union[str, Iterable[str]]) -> Iterator[str]:
+    for chunk in ([text] if isinstance(text, str) else text):
+        yield from chunk.splitlines()
+
+def _page_ranges(path: str) -> List[Tuple[int, int]]:
+    if not path.lower().endswith(".pdf"):
+        return [(0, 0)]  # DOCX разбирается целиком
+    from pdfminer.pdfpage import PDFPage
+    with open(path, "rb") as f:
+        n = sum(1 for _ in PDFPage.get_pages(f))
+    return [(i, min(i + PDF_PAGES_PER_TASK, n)) for i in range(0, n, PDF_PAGES_PER_TASK)] or [(0, 0)]
+
+def _extract_range(path: str, pages: Tuple[int, int]) -> str:
+    # функция уровня модуля — её выполняют процессы пула
+    if path.lower().endswith(".pdf"):
+        from pdfminer.high_level import extract_text
+        start, stop = pages
+        return extract_text(path, page_numbers=range(start, stop)) if stop > start else ""
+    from docx import Document
+    return "\n".join(p.text for p in Document(path).paragraphs)
+
+class _Done:
+    """Синхронный аналог Future: для случая без пула процессов."""
+    def __init__(self, fn, *args):
+        try:
+            self._value, self._exc = fn(*args), None
+        except Exception as e:
+            self._value, self._exc = None, e
+
+    def result(self):
+        if self._exc:
+            raise self._exc
+        return self._value
+
+def _pool_context():
+    # парсер вызывается из рабочего потока многопоточного процесса (цикл бота, пулы QA,
+    # сброс состояния, outbox): fork копирует чужие захваченные блокировки — берём forkserver
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
 class CurriculumParser:
     def __init__(self, repo: Repository):
         self.repo = repo
+        # code -> путь к извлечённому тексту плана (None — плана нет); парсер живёт один прогон sync,
+        # поэтому text_fingerprint/iter_text не ищут и не хэшируют план заново
+        self._texts: Dict[str, Optional[str]] = {}
 
-    def _parse_text_lines(self, text: str) -> List[Course]:
-        # эвристики: строки со схемой "семестр X", тип курса в скобках, часы/зачёты числами
+    def _parse_text_lines(self, text: Union[str, Iterable[str]]) -> List[Course]:
+        # text — строка или поток кусков (страниц/строк); пустые строки всё равно
+        # пропускаются, поэтому разбиение на куски по границам строк не влияет на результат
         courses: List[Course] = []
         current_sem = None
-        for line in text.splitlines():
-            s = line.strip()
-            if not s:
-                continue
-            m_sem = re.search(r"семестр[:\s]*(\d+)", s, flags=re.I)
-            if m_sem:
-                current_sem = int(m_sem.group(1))
-                continue
-            # Матчим "Название курса (электив)" или "Название курса — 3 з.е."
-            name = re.sub(r"\s{2,}", " ", re.sub(r"[\u00A0]", " ", s))
-            if len(name) < 4:
-                continue
-            m_cred = re.search(r"(\d+[.,]?\d*)\s*(з\.?е\.?|ECTS|кред)", s, flags=re.I)
-            m_hours = re.search(r"(\d+)\s*(час(ов|а)?|ч\.)", s, flags=re.I)
-            ctype = "elective" if re.search(r"(электив|по выбору)", s, flags=re.I) else "core"
-            credits = float(m_cred.group(1).replace(",", ".")) if m_cred else None
-            hours = int(m_hours.group(1)) if m_hours else None
-            # Фильтр вероятных заголовков
-            if any(k in s.lower() for k in ["партнеры программы", "карьера", "вопросы", "как поступить"]):
-                continue
-            # грубая эвристика — пропустим строки слишком общие
-            if len(s.split()) <= 2 and credits is None and hours is None:
-                continue
-            courses.append(Course(program_code="", name=name, semester=current_sem, type=ctype, hours=hours, credits=credits, raw=s))
+        for line in _iter_lines(text):
+            kind, value = classify_line(line)
+            if kind == "semester":
+                current_sem = value
+            elif kind == "course":
+                value.semester = current_sem
+                courses.append(value)
         return courses
 
-    def _extract_text_from_pdf(self, path: str) -> str:
-        from pdfminer.high_level import extract_text
-        return extract_text(path)
-
-    def _extract_text_from_docx(self, path: str) -> str:
-        from docx import Document
-        doc = Document(path)
-        return "\n".join(p.text for p in doc.paragraphs)
-
-    def parse_for_program(self, program_code: str) -> List[Course]:
-        # 1) пробуем файл плана, если есть
+    def find_plan_file(self, program_code: str) -> Optional[str]:
         plan_dir = os.path.join(DATA_DIR, "plans")
-        text = ""
         if os.path.isdir(plan_dir):
             for name in os.listdir(plan_dir):
-                if name.startswith(program_code):
-                    p = os.path.join(plan_dir, name)
-                    try:
-                        if name.lower().endswith(".pdf"):
-                            text = self._extract_text_from_pdf(p)
-                        elif name.lower().endswith(".docx"):
-                            text = self._extract_text_from_docx(p)
-                    except Exception:
-                        text = ""
-                    break
-        if not text:
-            # 2) fallback: берём HTML страницы и чистим от тегов
-            prog = self.repo.get_program(program_code)
-            if prog and prog.about_html:
-                import bs4
-                soup = bs4.BeautifulSoup(prog.about_html, "html.parser")
-                text = soup.get_text(separator="\n")
+                # точное совпадение: иначе "ai" подхватит план "ai_product"
+                if os.path.splitext(name)[0] == program_code and name.lower().endswith((".pdf", ".docx")):
+                    return os.path.join(plan_dir, name)
+        return None
+
+    def _cache_path(self, plan_path: str, plan_hash: Optional[str] = None) -> str:
+        return os.path.join(TEXT_CACHE_DIR, f"{plan_hash or file_hash(plan_path)}.txt")
+
+    def extract_plans(self, program_codes: Iterable[str],
+                      plan_hashes: Optional[Dict[str, str]] = None) -> Dict[str, Optional[str]]:
+        """
+        Извлекает текст планов в дисковый кэш (ключ — хэш файла плана) и возвращает
+        пути к кэшу. Несколько планов и диапазоны страниц больших PDF разбираются
+        в пуле процессов; неизменившийся план не разбирается вовсе. plan_hashes — уже
+        посчитанные хэши файлов планов (sync хэширует их для ключа этапа).
+        """
+        os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+        plan_hashes = plan_hashes or {}
+        result: Dict[str, Optional[str]] = {}
+        todo: Dict[str, Tuple[str, str, List[Tuple[int, int]]]] = {}
+        for code in program_codes:
+            plan = self.find_plan_file(code)
+            if not plan:
+                result[code] = None
+                continue
+            cache = self._cache_path(plan, plan_hashes.get(code))
+            if os.path.exists(cache):
+                result[code] = cache
+                continue
+            try:
+                todo[code] = (plan, cache, _page_ranges(plan))
+            except Exception:
+                result[code] = None
+        tasks = [(code, plan, r) for code, (plan, _, ranges) in todo.items() for r in ranges]
+        if len(tasks) <= 1:
+            # один маленький план — пул процессов дороже самой работы
+            futures = {(code, r): _Done(_extract_range, plan, r) for code, plan, r in tasks}
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=min(EXTRACT_WORKERS, len(tasks)), mp_context=_pool_context())
+            futures = {(code, r): pool.submit(_extract_range, plan, r) for code, plan, r in tasks}
+        try:
+            for code, (plan, cache, ranges) in todo.items():
+                # имя временного файла уникально: тот же план может разбирать и CLI --sync, и /sync бота
+                fd, tmp = tempfile.mkstemp(suffix=".part", dir=TEXT_CACHE_DIR)
+                try:
+                    # пишем по диапазонам по мере готовности, не собирая весь текст в памяти
+                    with open(fd, "w", encoding="utf-8") as f:
+                        for r in ranges:
+                            f.write(futures.pop((code, r)).result())
+                    os.replace(tmp, cache)
+                    result[code] = cache
+                except Exception:
+                    result[code] = None
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+        self._texts.update(result)
+        return result
+
+    def _plan_text(self, program_code: str) -> Optional[str]:
+        if program_code not in self._texts:
+            self.extract_plans([program_code])
+        return self._texts[program_code]
+
+    def text_fingerprint(self, program_code: str) -> str:
+        cache = self._plan_text(program_code)
+        if cache and os.path.getsize(cache):
+            return file_hash(cache)
+        return text_hash(self._html_text(program_code))
+
+    def iter_text(self, program_code: str) -> Iterator[str]:
+        # 1) пробуем текст плана из кэша — построчно, без загрузки целиком
+        cache = self._plan_text(program_code)
+        if cache and os.path.getsize(cache):
+            with open(cache, encoding="utf-8", newline="") as f:
+                yield from f
+            return
+        # 2) fallback: берём HTML страницы и чистим от тегов
+        yield self._html_text(program_code)
+
+    def _html_text(self, program_code: str) -> str:
+        # текст страницы сохраняет синхронизация; HTML разбираем, только если его ещё нет (старая БД)
+        text = self.repo.get_page_text(program_code)
+        if text is None:
+            html = self.repo.get_program_html(program_code)
+            if not html:
+                return ""
+            from html_doc import parse_page
+            text = parse_page(html).text
+            self.repo.set_page_text(program_code, text)
+        return text
+
+    def parse_text(self, program_code: str, text: Union[str, Iterable[str]]) -> List[Course]:
         courses = self._parse_text_lines(text)
-        # проставим program_code и простые теги
-        enriched: List[Course] = []
+        # теги проставляет classify_line, здесь — только program_code
         for c in courses:
             c.program_code = program_code
-            low = c.name.lower()
-            tags = []
-            for kw, tag in [
-                ("mlops", "mlops"),
-                ("production", "production"),
-                ("data", "data"),
-                ("vision", "cv"),
-                ("computer vision", "cv"),
-                ("nlp", "nlp"),
-                ("генератив", "genai"),
-                ("продукт", "product"),
-                ("менедж", "pm"),
-                ("архитектур", "arch"),
-                ("big data", "bigdata"),
-                ("облач", "cloud"),
-            ]:
-                if kw in low:
-                    tags.append(tag)
-            c.tags = tags
-            enriched.append(c)
-        return enriched
\ No newline at end of file
+        return courses
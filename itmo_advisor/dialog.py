@@ -1,24 +1,46 @@
 # dialog.py
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
+from keywords import KeywordMatcher, keyword_map
+from registry import ProgramRegistry
 
-@dataclass
+@dataclass(slots=True)
 class UserState:
-    program_code: Optional[str] = None     # "ai" | "ai_product"
+    program_code: Optional[str] = None     # код программы из ProgramRegistry
     background_key: Optional[str] = None   # см. recommender.py
     stage: str = "welcome"
 
-WELCOME = ("Привет! Я помогу выбрать между программами ИТМО «Искусственный интеллект» и «AI Product», "
-           "объясню различия, подскажу по учебным планам и порекомендую элективы под ваш бэкграунд.\n\n"
-           "Напишите: ai — если интересует «Искусственный интеллект»,\n"
-           "или ai_product — «Управление ИИ-продуктами». "
-           "Позже можно поменять выбор командой /switch.")
+def program_prompt(programs: ProgramRegistry) -> str:
+    return "Напишите код, номер или название программы:\n" + programs.menu()
+
+def welcome_text(programs: ProgramRegistry) -> str:
+    return ("Привет! Я помогу выбрать магистерскую программу ИТМО, объясню различия, "
+            "подскажу по учебным планам и порекомендую элективы под ваш бэкграунд.\n\n"
+            + program_prompt(programs) +
+            "\n\nПозже можно поменять выбор командой /switch.")
 
 BACKGROUND_HELP = ("Расскажите кратко про ваш бэкграунд. Варианты: "
                    "junior_ml, data_engineer, product_manager, backend, research. "
                    "Можно одной фразой: «я джун ML, хочу в прод» — я распознаю.")
 
+# порядок ключей — приоритет, если во фразе узнаётся несколько бэкграундов
+BACKGROUND_KEYWORDS = {
+    "product_manager": ("product", "продукт", "pm"),
+    "junior_ml": ("ml", "data scientist", "джун"),
+    "data_engineer": ("data eng", "инженер данных"),
+    "backend": ("backend", "бэкенд"),
+    "research": ("research", "ресерч", "наука"),
+}
+_BACKGROUNDS = KeywordMatcher(keyword_map(BACKGROUND_KEYWORDS))
+
+def match_backgrounds(text: str) -> List[str]:
+    """Все узнанные бэкграунды в порядке приоритета."""
+    found = _BACKGROUNDS.labels(text.lower())
+    return [k for k in BACKGROUND_KEYWORDS if k in found]
+
 def map_background(text: str) -> Optional[str]:
+    # то же, что match_backgrounds(text)[0], но с ранним выходом и без цикла: вызывается
+    # на каждое сообщение с бэкграундом. Слова — как в BACKGROUND_KEYWORDS (сверяет bench_guard)
     t = text.lower()
     if "product" in t or "продукт" in t or "pm" in t:
         return "product_manager"
@@ -30,4 +52,4 @@ def map_background(text: str) -> Optional[str]:
         return "backend"
     if "research" in t or "ресерч" in t or "наука" in t:
         return "research"
-    return None
\ No newline at end of file
+    return None
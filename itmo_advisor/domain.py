@@ -10,6 +10,7 @@ class Program:
     plan_url: Optional[str] = None
     about_html: Optional[str] = None
     faq_text: Optional[str] = None
+    page_text: Optional[str] = None  # видимый текст страницы (html_doc.parse_page), для запасного разбора плана
 
 @dataclass
 class Course:
@@ -20,4 +21,16 @@ class Course:
     hours: Optional[int] = None
     credits: Optional[float] = None
     raw: Optional[str] = None
-    tags: List[str] = field(default_factory=list)
\ No newline at end of file
+    tags: List[str] = field(default_factory=list)
+    is_elective: bool = False  # проставляет парсер, см. detect_elective
+
+def detect_elective(c: Course) -> bool:
+    """Курс по выбору: помечен как электив или в строке плана есть "по выбору"."""
+    return c.is_elective or c.type == "elective" or "по выбору" in (c.raw or "").lower()
+
+@dataclass
+class FaqEntry:
+    program_code: str
+    question: str
+    answer: str = ""
+    id: Optional[int] = None
@@ -1,11 +1,41 @@
 # guard.py
-from typing import Optional
+from typing import Dict, Iterable, Set
+from keywords import KeywordMatcher
 
 ALLOWED_THEMES = [
     "итмо", "магистратур", "мастер", "ai", "искусствен", "продукт", "поступлен", "экзамен",
-    "учебн", "план", "курс", "семестр", "зачет", "з.е", "ects", "расписан", "стипенд", "стажиров",
-    "электив", "по выбору", "портфолио", "вкрд", "вкрд", "вкрд".replace("вкрд","вкр") # ВКР
+    "учебн", "план", "курс", "дисциплин", "семестр", "зачет", "з.е", "ects", "расписан", "стипенд", "стажиров",
+    "электив", "по выбору", "портфолио", "вкр", "программ",
 ]
+_THEMES = KeywordMatcher({t: t for t in ALLOWED_THEMES})
+
+# темы, по которым ясно, где искать ответ: в учебном плане (курсы) или в FAQ программы
+THEME_DOC_TYPES = {
+    "учебн": "course", "план": "course", "курс": "course", "дисциплин": "course", "семестр": "course", "зачет": "course",
+    "з.е": "course", "ects": "course", "электив": "course", "по выбору": "course",
+    "поступлен": "faq", "экзамен": "faq", "стипенд": "faq", "стажиров": "faq",
+    "портфолио": "faq", "расписан": "faq", "вкр": "faq",
+}
+# во сколько раз поднимаем скор документов предпочтительного типа
+THEME_BIAS = 1.2
+
 def is_in_domain(question: str) -> bool:
-    ql = question.lower()
-    return any(k in ql for k in ALLOWED_THEMES)
\ No newline at end of file
+    return _THEMES.search(question.lower())
+
+def match_themes(question: str) -> Set[str]:
+    """Все темы ALLOWED_THEMES, встретившиеся в вопросе (за один проход)."""
+    return _THEMES.keywords(question.lower())
+
+def doc_type_weights(themes: Iterable[str]) -> Dict[str, float]:
+    """Множители скора по типу документа: тип, к которому относится больше тем, поднимаем."""
+    votes: Dict[str, int] = {}
+    for t in themes:
+        typ = THEME_DOC_TYPES.get(t)
+        if typ:
+            votes[typ] = votes.get(typ, 0) + 1
+    if not votes:
+        return {}
+    best = max(votes, key=votes.get)
+    if list(votes.values()).count(votes[best]) > 1:
+        return {}
+    return {best: THEME_BIAS}
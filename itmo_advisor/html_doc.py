@@ -0,0 +1,63 @@
+# html_doc.py
+import importlib.util, re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+# lxml в разы быстрее встроенного html.parser; без него работаем на встроенном
+PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+
+_PLAN_TEXTS = ("учебный план", "план обучения")
+_PLAN_HREF_RE = re.compile(r"\.(pdf|docx?)$")
+_FAQ_KEYWORDS = ("вопрос", "экзамен", "как", "можно ли", "чем", "будет ли", "уровень", "сможу ли")
+# строки, которые попадают в get_text(): без комментариев, doctype, <script> и <style>
+_TEXT_TYPES = (NavigableString, CData)
+
+@dataclass
+class PageDoc:
+    plan_url: Optional[str] = None
+    faq_pairs: List[Tuple[str, str]] = field(default_factory=list)
+    text: str = ""  # видимый текст страницы, как soup.get_text(separator="\n")
+
+def parse_page(html: str, base_url: str = "https://abit.itmo.ru") -> PageDoc:
+    """
+    Страница программы разбирается один раз: за один обход дерева находим ссылку
+    на учебный план (первая подходящая <a>), пары FAQ (заголовки h5/h6 и следующий
+    за ними блок) и собираем чистый текст для запасного разбора плана.
+    """
+    soup = BeautifulSoup(html, PARSER)
+    doc = PageDoc()
+    strings: List[str] = []
+    for node in soup.descendants:
+        if type(node) in _TEXT_TYPES:
+            strings.append(node)
+        elif isinstance(node, Tag):
+            if node.name == "a":
+                if doc.plan_url is None:
+                    doc.plan_url = _plan_link(node, base_url)
+            elif node.name in ("h5", "h6"):
+                pair = _faq_pair(node)
+                if pair:
+                    doc.faq_pairs.append(pair)
+    doc.text = "\n".join(strings)
+    return doc
+
+def _plan_link(a: Tag, base_url: str) -> Optional[str]:
+    # ссылка без / и http всё равно не годится — её текст не читаем
+    href = a.get("href") or ""
+    if not href.startswith(("/", "http")):
+        return None
+    if not _PLAN_HREF_RE.search(href):
+        text = a.get_text().strip().lower()
+        if not any(t in text for t in _PLAN_TEXTS):
+            return None
+    return urljoin(base_url, href) if href.startswith("/") else href
+
+def _faq_pair(h: Tag) -> Optional[Tuple[str, str]]:
+    txt = h.get_text().strip()
+    if not txt or not any(k in txt.lower() for k in _FAQ_KEYWORDS):
+        return None
+    # захват следующего блока
+    nxt = h.find_next_sibling()
+    return txt, nxt.get_text() if nxt else ""
@@ -0,0 +1,29 @@
+# keywords.py
+import re
+from typing import Dict, Iterable, Set
+
+class KeywordMatcher:
+    """
+    Поиск ключевых слов-подстрок. search() («есть ли хоть одно») — один скомпилированный
+    regex вместо цепочки `k in text`. Для набора слов (keywords, labels) regex не выигрывает:
+    слова перекрываются, и findall пришлось бы перепроверять с каждой позиции, а на паре
+    десятков коротких слов поиск подстроки в C быстрее. Текст ожидается в нижнем регистре.
+    """
+    def __init__(self, keywords: Dict[str, str]):
+        # keywords: ключевое слово -> метка (тема, бэкграунд)
+        self._labels = dict(keywords)
+        self._words = tuple(self._labels)
+        self._re = re.compile("|".join(map(re.escape, sorted(self._words, key=len, reverse=True))))
+
+    def search(self, text: str) -> bool:
+        return self._re.search(text) is not None
+
+    def keywords(self, text: str) -> Set[str]:
+        return {w for w in self._words if w in text}
+
+    def labels(self, text: str) -> Set[str]:
+        return {self._labels[w] for w in self._words if w in text}
+
+def keyword_map(groups: Dict[str, Iterable[str]]) -> Dict[str, str]:
+    """{метка: [слова]} -> {слово: метка}."""
+    return {w: label for label, words in groups.items() for w in words}
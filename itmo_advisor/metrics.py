@@ -0,0 +1,218 @@
+# metrics.py
+import bisect, json, threading, time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Optional, Tuple
+from config import METRICS_ENABLED, METRICS_PORT, METRICS_LOG_PATH, METRICS_LOG_INTERVAL
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]  # (имя, отсортированные метки)
+
+def _key(name: str, labels: Dict[str, str]) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Histogram:
+    """Бакеты в стиле Prometheus плюс окно последних наблюдений для p50/p95/p99."""
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, window: int = 2048):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        i = bisect.bisect_left(self.BUCKETS, seconds)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentiles(self) -> Dict[str, float]:
+        xs = sorted(self.recent)
+        if not xs:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        return {f"p{q}": xs[min(len(xs) - 1, len(xs) * q // 100)] for q in (50, 95, 99)}
+
+class _Span:
+    __slots__ = ("_metrics", "_key", "_t0")
+
+    def __init__(self, metrics: "Metrics", key: Key):
+        self._metrics = metrics
+        self._key = key
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics._observe(self._key, time.perf_counter() - self._t0)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Metrics:
+    """
+    Счётчики и гистограммы латентности по этапам запроса и синхронизации.
+    Выключенный реестр (по умолчанию, METRICS_ENABLED=0) ничего не считает: inc()
+    сразу возвращается, span() отдаёт общий пустой контекст без замера времени.
+    Экспорт — текст Prometheus по HTTP (METRICS_PORT) и/или JSON-строки в файл
+    раз в METRICS_LOG_INTERVAL секунд.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._counters: Dict[Key, int] = {}
+        self._hists: Dict[Key, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, n: int = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        k = _key(name, labels)
+        with self._lock:
+            self._counters[k] = self._counters.get(k, 0) + n
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if self.enabled:
+            self._observe(_key(name, labels), seconds)
+
+    def _observe(self, k: Key, seconds: float) -> None:
+        with self._lock:
+            h = self._hists.get(k)
+            if h is None:
+                h = self._hists[k] = Histogram()
+            h.observe(seconds)
+
+    def span(self, name: str, **labels):
+        """with METRICS.span("qa.retrieve"): ... — время блока в гистограмму name."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, _key(name, labels))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._hists.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            hists = {k: (h.count, h.sum, h.percentiles(), list(h.counts)) for k, h in self._hists.items()}
+        return {
+            "ts": time.time(),
+            "uptime": time.time() - self.started,
+            "counters": {_label_str(k): v for k, v in sorted(counters.items())},
+            "histograms": {_label_str(k): {"count": c, "sum": s, **p} for k, (c, s, p, _) in sorted(hists.items())},
+        }
+
+    def render_prometheus(self, prefix: str = "itmo_advisor") -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted((k, h.count, h.sum, list(h.counts)) for k, h in self._hists.items())
+        lines = []
+        typed = set()
+        for (name, labels), v in counters:
+            metric = f"{prefix}_{_prom_name(name)}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_prom_labels(labels)} {v}")
+        for (name, labels), count, total, counts in hists:
+            metric = f"{prefix}_{_prom_name(name)}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            acc = 0
+            for b, c in zip(Histogram.BUCKETS, counts):
+                acc += c
+                lines.append(f"{metric}_bucket{_prom_labels(labels + (('le', repr(b)),))} {acc}")
+            lines.append(f"{metric}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_prom_labels(labels)} {total}")
+            lines.append(f"{metric}_count{_prom_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """Короткая сводка для /stats."""
+        snap = self.snapshot()
+        lines = [f"аптайм: {snap['uptime'] / 3600:.1f} ч"]
+        if snap["counters"]:
+            lines.append("счётчики:")
+            lines += [f"  {k}: {v}" for k, v in snap["counters"].items()]
+        if snap["histograms"]:
+            lines.append("латентность, мс (p50 / p95 / p99, n):")
+            for k, h in snap["histograms"].items():
+                lines.append(f"  {k}: {h['p50'] * 1000:.1f} / {h['p95'] * 1000:.1f} / {h['p99'] * 1000:.1f}, {h['count']}")
+        return "\n".join(lines)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Локальный эндпоинт: /metrics — текст Prometheus, /metrics.json — snapshot()."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, ctype = json.dumps(metrics.snapshot(), ensure_ascii=False).encode("utf-8"), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, ctype = metrics.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def start_json_log(self, path: str, interval: float) -> threading.Thread:
+        """Раз в interval секунд дописывает snapshot() строкой JSON в path."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+
+        t = threading.Thread(target=loop, name="metrics-log", daemon=True)
+        t.start()
+        return t
+
+    def start_exporters(self, port: int = METRICS_PORT, log_path: Optional[str] = METRICS_LOG_PATH,
+                        interval: float = METRICS_LOG_INTERVAL) -> None:
+        if not self.enabled:
+            return
+        if port:
+            self.serve(port)
+        if log_path and interval > 0:
+            self.start_json_log(log_path, interval)
+
+def _prom_name(name: str) -> str:
+    return "".join(ch if ch.isascii() and (ch.isalnum() or ch == "_") else "_" for ch in name)
+
+def _prom_labels(labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+def _label_str(k: Key) -> str:
+    name, labels = k
+    return name + ("{" + ",".join(f"{a}={b}" for a, b in labels) + "}" if labels else "")
+
+# общий реестр процесса
+METRICS = Metrics(enabled=METRICS_ENABLED)
@@ -0,0 +1,266 @@
+# outbox.py
+import asyncio, itertools, time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from metrics import METRICS
+from config import (OUTBOX_CHAT_BURST, OUTBOX_CHAT_RATE, OUTBOX_GLOBAL_RATE, OUTBOX_GROUP_RATE,
+                    OUTBOX_MAX_RETRIES, OUTBOX_WORKERS)
+
+MAX_MESSAGE_LEN = 4096  # предел sendMessage, в UTF-16 символах, как считает Telegram
+# приоритеты: ответы пользователям уходят раньше уведомлений (прогресс /sync и т.п.)
+REPLY, NOTICE = 0, 1
+
+@dataclass
+class RateLimits:
+    global_rate: float = OUTBOX_GLOBAL_RATE  # сообщений/с на бота; 0 — без лимита
+    chat_rate: float = OUTBOX_CHAT_RATE      # в личный чат; 0 — без лимита
+    chat_burst: int = OUTBOX_CHAT_BURST
+    group_rate: float = OUTBOX_GROUP_RATE    # в группу (chat_id < 0)
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst про запас."""
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self) -> float:
+        """Через сколько секунд будет токен (0 — уже есть); токен не берётся."""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self) -> float:
+        """Берёт токен, при необходимости в долг; возвращает, сколько ждать до отправки."""
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+@dataclass
+class _Message:
+    text: str
+    kwargs: dict
+    priority: int
+    futures: List[asyncio.Future] = field(default_factory=list)
+    parts: int = 1      # сколько поставленных частей слито в это сообщение
+    attempts: int = 0
+
+class _Chat:
+    def __init__(self, bucket: Optional[TokenBucket]):
+        self.queue: Deque[_Message] = deque()
+        self.bucket = bucket
+        self.busy = False           # в очереди готовых, ждёт лимита или отправляется
+        self.blocked_until = 0.0    # после 429 (retry_after) или сетевой ошибки
+
+class Outbox:
+    """
+    Очередь исходящих сообщений. Обработчик кладёт ответ через send() и не ждёт Bot API:
+    отправляют workers задач, соблюдая лимиты (общий и на чат, token bucket), а 429
+    Too Many Requests откладывает только свой чат на retry_after. Сообщения одного чата
+    уходят по порядку: чат стоит в очереди готовых не больше одного раза. Ответы,
+    скопившиеся в чате за время ожидания лимита, склеиваются в одно сообщение, а текст
+    длиннее 4096 символов режется на части.
+    """
+    def __init__(self, bot: Bot, limits: Optional[RateLimits] = None, workers: int = OUTBOX_WORKERS,
+                 max_retries: int = OUTBOX_MAX_RETRIES):
+        self.bot = bot
+        self.limits = limits or RateLimits()
+        self.workers = workers
+        self.max_retries = max_retries
+        self._global = (TokenBucket(self.limits.global_rate, max(1.0, self.limits.global_rate))
+                        if self.limits.global_rate > 0 else None)
+        self._chats: Dict[int, _Chat] = {}
+        self._ready: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        self._idle: Optional[asyncio.Event] = None
+        self.pending = 0  # частей в очереди и в отправке
+        self.sent = self.coalesced = self.retries = self.failed = 0
+
+    def send(self, chat_id: int, text: str, priority: int = REPLY, **kwargs) -> "asyncio.Future[bool]":
+        """
+        Ставит сообщение в очередь чата (kwargs — как у Bot.send_message). Future даёт True,
+        когда ушла последняя часть, и False, если сообщение пришлось выбросить; ждать его не обязательно.
+        """
+        self._start()
+        fut = asyncio.get_running_loop().create_future()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(self._bucket(chat_id))
+        parts = split_text(text) or [text]
+        for i, part in enumerate(parts):
+            chat.queue.append(_Message(part, kwargs, priority, [fut] if i == len(parts) - 1 else []))
+        self.pending += len(parts)
+        self._idle.clear()
+        METRICS.inc("outbox.queued", len(parts))
+        self._schedule(chat_id, chat)
+        return fut
+
+    async def drain(self) -> None:
+        """Ждёт, пока очередь опустеет."""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Дожидается отправки (не дольше timeout) и останавливает workers."""
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self.pending, "sent": self.sent, "coalesced": self.coalesced,
+                "retries": self.retries, "failed": self.failed}
+
+    def _start(self) -> None:
+        # workers запускаются в цикле событий первого send(): бот создаётся до него
+        if self._tasks:
+            return
+        self._ready = asyncio.PriorityQueue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.get_running_loop().create_task(self._worker()) for _ in range(self.workers)]
+
+    def _bucket(self, chat_id: int) -> Optional[TokenBucket]:
+        if chat_id < 0:
+            return TokenBucket(self.limits.group_rate, 1) if self.limits.group_rate > 0 else None
+        if self.limits.chat_rate > 0:
+            return TokenBucket(self.limits.chat_rate, self.limits.chat_burst)
+        return None
+
+    def _schedule(self, chat_id: int, chat: _Chat) -> None:
+        if chat.busy or not chat.queue:
+            return
+        chat.busy = True
+        delay = max(chat.bucket.delay() if chat.bucket else 0.0, chat.blocked_until - time.monotonic())
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._make_ready, chat_id, chat)
+        else:
+            self._make_ready(chat_id, chat)
+
+    def _make_ready(self, chat_id: int, chat: _Chat) -> None:
+        self._ready.put_nowait((chat.queue[0].priority, next(self._seq), chat_id))
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, chat_id = await self._ready.get()
+            chat = self._chats[chat_id]
+            try:
+                await self._send_next(chat_id, chat)
+            except Exception:
+                METRICS.inc("outbox.error")
+            finally:
+                chat.busy = False
+                if chat.queue:
+                    self._schedule(chat_id, chat)
+                elif chat.bucket is not None:
+                    # полный bucket ничем не отличается от нового — чат можно забыть
+                    asyncio.get_running_loop().call_later(chat.bucket.burst / chat.bucket.rate,
+                                                          self._forget, chat_id)
+                else:
+                    self._forget(chat_id)
+
+    async def _send_next(self, chat_id: int, chat: _Chat) -> None:
+        wait = self._global.reserve() if self._global else 0.0
+        if wait:
+            await asyncio.sleep(wait)
+        msg = self._coalesce(chat)
+        if chat.bucket is not None:
+            chat.bucket.reserve()
+        msg.attempts += 1
+        try:
+            with METRICS.span("outbox.send"):
+                await self.bot.send_message(chat_id, msg.text, **msg.kwargs)
+        except RetryAfter as e:
+            # Telegram сам говорит, сколько ждать; остальные чаты продолжают отправку
+            self.retries += 1
+            METRICS.inc("outbox.retry_after")
+            self._retry(chat, msg, _seconds(e.retry_after))
+        except (BadRequest, Forbidden):
+            # сообщение не уйдёт и при повторе (бот заблокирован, неверный текст)
+            self._finish(msg, False)
+        except NetworkError:
+            self.retries += 1
+            METRICS.inc("outbox.network_error")
+            self._retry(chat, msg, min(30.0, 0.5 * 2 ** msg.attempts))
+        except Exception:
+            self._finish(msg, False)
+            raise
+        else:
+            self._finish(msg, True)
+
+    def _coalesce(self, chat: _Chat) -> _Message:
+        msg = chat.queue.popleft()
+        while chat.queue and chat.queue[0].kwargs == msg.kwargs:
+            nxt = chat.queue[0]
+            text = msg.text + "\n\n" + nxt.text
+            if tg_len(text) > MAX_MESSAGE_LEN:
+                break
+            chat.queue.popleft()
+            msg = _Message(text, msg.kwargs, min(msg.priority, nxt.priority), msg.futures + nxt.futures,
+                           msg.parts + nxt.parts, msg.attempts)
+            self.coalesced += 1
+            METRICS.inc("outbox.coalesced")
+        return msg
+
+    def _retry(self, chat: _Chat, msg: _Message, delay: float) -> None:
+        if msg.attempts > self.max_retries:
+            self._finish(msg, False)
+            return
+        chat.blocked_until = max(chat.blocked_until, time.monotonic() + delay)
+        chat.queue.appendleft(msg)
+
+    def _finish(self, msg: _Message, ok: bool) -> None:
+        if ok:
+            self.sent += 1
+            METRICS.inc("outbox.sent")
+        else:
+            self.failed += 1
+            METRICS.inc("outbox.failed")
+        for fut in msg.futures:
+            if not fut.done():
+                fut.set_result(ok)
+        self.pending -= msg.parts
+        if self.pending == 0:
+            self._idle.set()
+
+    def _forget(self, chat_id: int) -> None:
+        chat = self._chats.get(chat_id)
+        if chat is not None and not chat.busy and not chat.queue:
+            del self._chats[chat_id]
+
+def tg_len(text: str) -> int:
+    """Длина так, как её считает Telegram: в UTF-16 единицах (эмодзи — две)."""
+    return len(text.encode("utf-16-le")) // 2
+
+def split_text(text: str, limit: int = MAX_MESSAGE_LEN) -> List[str]:
+    """Режет текст на части не длиннее limit — по возможности по строкам, затем по пробелам."""
+    parts = []
+    while tg_len(text) > limit:
+        cut = limit
+        while tg_len(text[:cut]) > limit:
+            cut -= (tg_len(text[:cut]) - limit + 1) // 2  # символ — одна или две единицы
+        end = text.rfind("\n", 0, cut + 1)
+        if end < cut // 2:
+            end = text.rfind(" ", 0, cut + 1)
+        if end < cut // 2:
+            end = cut
+        parts.append(text[:end].rstrip())
+        text = text[end:].lstrip()
+    if text.strip():
+        parts.append(text)
+    return [p for p in parts if p]
+
+def _seconds(value) -> float:
+    # retry_after — int секунд, в новых python-telegram-bot — timedelta
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
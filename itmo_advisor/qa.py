@@ -1,31 +1,144 @@
 # qa.py
-from typing import Tuple, List
+import re
+from typing import Dict, Optional, Sequence, Tuple, List
+from registry import ProgramRegistry
 from repository import Repository
 from retriever import Retriever
-from guard import is_in_domain
+from analytics import CurriculumAnalytics, match_intent
+from guard import doc_type_weights, is_in_domain, match_themes
+from cache import LRUCache
+from metrics import METRICS
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL
+
+# пунктуация -> пробел; точку внутри слова оставляем ради "з.е" в guard
+_PUNCT_RE = re.compile(r"[^\w\s.]|(?<!\w)\.|\.(?!\w)")
+
+def normalize_question(question: str) -> str:
+    return " ".join(_PUNCT_RE.sub(" ", question.lower()).split())
 
 class QAService:
-    def __init__(self, repo: Repository, retriever: Retriever):
+    OFF_TOPIC = "Хэй! Я отвечаю только на вопросы по обучению на магистерских программах ИТМО. Переформулируйте, пожалуйста, в рамках темы."
+
+    def __init__(self, repo: Repository, retriever: Retriever, analytics: Optional[CurriculumAnalytics] = None,
+                 programs: Optional[ProgramRegistry] = None):
         self.repo = repo
         self.ret = retriever
+        # вопросы-агрегаты («в чём разница», «сколько курсов», «что во 2 семестре») —
+        # из посчитанной при синхронизации аналитики, а не поиском по отдельным курсам
+        self.analytics = analytics
+        # по кодам и алиасам программ узнаём «сравни ai и ai_product»
+        self.programs = programs if programs is not None else ProgramRegistry()
+        # ключ — (программа, нормализованный вопрос); ответ считается по нормализованному
+        # вопросу, поэтому он однозначно определяется ключом
+        self.cache = LRUCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+        self._cache_generation = None
+
+    def _check_generation(self) -> None:
+        # индекс пересобран или подменён — все закэшированные ответы устарели
+        gen = self.ret.generation
+        if gen != self._cache_generation:
+            self.cache.clear()
+            self._cache_generation = gen
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
 
     def answer(self, program_code: str, question: str) -> str:
-        if not is_in_domain(question):
-            return "Хэй! Я отвечаю только на вопросы по обучению на магистерских программах «Искусственный интеллект» и «AI Product» ИТМО. Переформулируйте, пожалуйста, в рамках темы."
-        # уточнение: если программа не выбрана — отвечаем по обеим
-        hits = self.ret.query(question, topk=5)
+        self._check_generation()
+        METRICS.inc("qa.queries")
+        key = (program_code or None, normalize_question(question))
+        ans = self.cache.get(key)
+        if ans is None:
+            ans = self._answer(program_code, key[1])
+            self.cache.put(key, ans)
+        else:
+            METRICS.inc("qa.cache_hits")
+        return ans
+
+    def _answer(self, program_code: str, question: str) -> str:
+        # guard — один поиск по regex; темы собираем, только если дошло до поиска
+        with METRICS.span("qa.guard"):
+            in_domain = self._in_domain(question)
+        if not in_domain:
+            METRICS.inc("qa.guard_rejections")
+            return self.OFF_TOPIC
+        ans = self._aggregate(program_code, question)
+        if ans is not None:
+            return ans
+        # уточнение: если программа не выбрана — отвечаем по обеим;
+        # иначе фильтруем по программе до ранжирования, а не после top-k.
+        # Темы вопроса (курсы/поступление) смещают ранжирование к курсам или FAQ
+        with METRICS.span("qa.retrieve"):
+            hits = self.ret.query(question, topk=5, program_code=program_code or None,
+                                  type_weights=doc_type_weights(match_themes(question)))
+        with METRICS.span("qa.format"):
+            return self._format(hits)
+
+    def answer_batch(self, items: Sequence[Tuple[Optional[str], str]]) -> List[str]:
+        """Ответы на пачку (program_code, вопрос) с одним проходом ретривера на всю пачку."""
+        self._check_generation()
+        METRICS.inc("qa.queries", len(items))
+        keys = [(code or None, normalize_question(q)) for code, q in items]
+        answers: List[Optional[str]] = [self.cache.get(k) for k in keys]
+        METRICS.inc("qa.cache_hits", sum(a is not None for a in answers))
+        todo, weights = [], []
+        with METRICS.span("qa.guard"):
+            for i, k in enumerate(keys):
+                if answers[i] is None:
+                    if not self._in_domain(k[1]):
+                        METRICS.inc("qa.guard_rejections")
+                        answers[i] = self.OFF_TOPIC
+                        self.cache.put(k, self.OFF_TOPIC)
+                        continue
+                    answers[i] = self._aggregate(*k)
+                    if answers[i] is not None:
+                        self.cache.put(k, answers[i])
+                        continue
+                    todo.append(i)
+                    weights.append(doc_type_weights(match_themes(k[1])))
+        with METRICS.span("qa.retrieve_batch"):
+            hits = self.ret.query_batch([keys[i][1] for i in todo], topk=5,
+                                        program_codes=[keys[i][0] for i in todo], type_weights=weights)
+        with METRICS.span("qa.format"):
+            for i, h in zip(todo, hits):
+                answers[i] = self._format(h)
+                self.cache.put(keys[i], answers[i])
+        return answers
+
+    def _in_domain(self, question: str) -> bool:
+        # вопрос, назвавший программу по коду («сравни ai и ai_product»), — тоже по теме;
+        # имена программ проверяем, только если не нашлось ни одной темы
+        return is_in_domain(question) or bool(self.programs.mentions(question))
+
+    def _aggregate(self, program_code: Optional[str], question: str) -> Optional[str]:
+        if self.analytics is None:
+            return None
+        intent = match_intent(question, self.programs)
+        if intent is None:
+            return None
+        with METRICS.span("qa.analytics"):
+            ans = self.analytics.answer(intent, program_code or None)
+        if ans is not None:
+            METRICS.inc("qa.analytics_answers")
+        return ans
+
+    def _format(self, hits) -> str:
         # если пусто — честный ответ
         if not hits:
+            METRICS.inc("qa.empty_answers")
             return "Не нашёл ответа в учебных планах и описании программ. Попробуйте перефразировать или спросить о других деталях обучения."
         parts: List[str] = []
         for score, (typ, mid), doc in hits:
             if typ == "faq":
-                parts.append(f"• Из FAQ программы: {doc.splitlines()[0]}")
+                question, _, answer = doc.partition("\n")
+                answer = " ".join(answer.split())
+                if len(answer) > 400:
+                    answer = answer[:400].rsplit(" ", 1)[0] + "…"
+                parts.append(f"• Из FAQ программы: {question}" + (f"\n  {answer}" if answer else ""))
             elif typ == "course":
-                pg, name = mid.split(":",1)
-                if program_code and pg != program_code:
-                    continue
+                name = mid.split(":", 1)[1]
                 parts.append(f"• Курс «{name}» — возможно релевантно вашему вопросу")
         if not parts:
+            METRICS.inc("qa.empty_answers")
             return "Не нашёл точного ответа, но могу помочь с навигацией по курсам и FAQ."
-        return "\n".join(parts[:5])
\ No newline at end of file
+        return "\n".join(parts[:5])
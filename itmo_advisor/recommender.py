@@ -1,7 +1,51 @@
 # recommender.py
-from typing import List
-from domain import Course
-from collections import defaultdict
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Tuple
+import numpy as np
+from domain import Course, detect_elective
+
+def _project_bonus(name: str) -> int:
+    name = name.lower()
+    return 1 if ("проект" in name or "практикум" in name) else 0
+
+@dataclass
+class _CompiledElectives:
+    """Элективы одной программы в виде массивов: строка i — courses[i] (порядок id)."""
+    version: int
+    courses: List[Course]
+    tag_index: Dict[str, int]
+    tags: np.ndarray      # n x число тегов, 0/1
+    project: np.ndarray
+    credits: np.ndarray
+    hours: np.ndarray
+    # полный порядок элективов по набору приоритетных тегов; limit — просто срез
+    rankings: Dict[FrozenSet[str], np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, version: int, courses: List[Course]) -> "_CompiledElectives":
+        tag_index: Dict[str, int] = {}
+        for c in courses:
+            for t in c.tags or []:
+                tag_index.setdefault(t, len(tag_index))
+        tags = np.zeros((len(courses), len(tag_index)), dtype=np.int32)
+        for i, c in enumerate(courses):
+            for t in c.tags or []:
+                tags[i, tag_index[t]] = 1
+        return cls(version, courses, tag_index, tags,
+                   np.array([_project_bonus(c.name) for c in courses], dtype=np.int8),
+                   np.array([c.credits or 0.0 for c in courses], dtype=np.float64),
+                   np.array([c.hours or 0 for c in courses], dtype=np.int64))
+
+    def rank(self, pri: FrozenSet[str]) -> np.ndarray:
+        order = self.rankings.get(pri)
+        if order is None:
+            cols = [self.tag_index[t] for t in pri if t in self.tag_index]
+            match = self.tags[:, cols].sum(axis=1) if cols else np.zeros(len(self.courses), dtype=np.int32)
+            # lexsort устойчив: при равных ключах сохраняется порядок id, как у sort(reverse=True)
+            order = np.lexsort((-self.hours, -self.credits, -self.project, -match))
+            self.rankings[pri] = order
+        return order
 
 class ElectiveRecommender:
     """
@@ -18,16 +62,37 @@ class ElectiveRecommender:
             "backend": {"cloud","mlops","arch","bigdata"},
             "research": {"genai","nlp","cv","data"},
         }
+        # (репозиторий, program_code) -> скомпилированные элективы; живут до следующего replace_courses
+        self._compiled: Dict[Tuple[int, str], _CompiledElectives] = {}
+        self._lock = threading.Lock()
 
     def recommend(self, courses: List[Course], background_key: str, limit: int = 8) -> List[Course]:
         pri = self.background_map.get(background_key, set())
-        elect = [c for c in courses if c.type == "elective" or "по выбору" in (c.raw or "").lower()]
-        def score(c: Course):
-            tags = set(c.tags or [])
-            match = len(tags & pri)
-            project_bonus = 1 if ("проект" in (c.name.lower()) or "практикум" in (c.name.lower())) else 0
+        elect = [(len(set(c.tags or []) & pri), c) for c in courses if detect_elective(c)]
+        return self._rank(elect, limit)
+
+    def recommend_for(self, repo, program_code: str, background_key: str, limit: int = 8) -> List[Course]:
+        """
+        То же, что recommend(repo.list_courses(program_code), ...). Элективы программы
+        компилируются в массивы один раз на версию курсов в БД, порядок для каждого
+        бэкграунда считается векторно и запоминается до следующей синхронизации.
+        """
+        pri = frozenset(self.background_map.get(background_key, ()))
+        version = repo.courses_version()
+        with self._lock:
+            key = (id(repo), program_code)
+            comp = self._compiled.get(key)
+            if comp is None or comp.version != version:
+                comp = _CompiledElectives.build(version, repo.list_electives(program_code))
+                self._compiled[key] = comp
+            order = comp.rank(pri)
+        return [comp.courses[i] for i in order[:limit]]
+
+    def _rank(self, scored: List[Tuple[int, Course]], limit: int) -> List[Course]:
+        def score(item: Tuple[int, Course]):
+            match, c = item
             credits = c.credits or 0.0
             hours = c.hours or 0
-            return (match, project_bonus, credits, hours)
-        elect.sort(key=score, reverse=True)
-        return elect[:limit]
\ No newline at end of file
+            return (match, _project_bonus(c.name), credits, hours)
+        scored.sort(key=score, reverse=True)
+        return [c for _, c in scored[:limit]]
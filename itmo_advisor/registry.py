@@ -0,0 +1,72 @@
+# registry.py
+import re
+from typing import Dict, Iterable, List, Optional
+from config import PROGRAMS, ProgramConfig
+from repository import Repository
+
+class ProgramRegistry:
+    """
+    Обслуживаемые программы: из programs.json (config.PROGRAMS) и, при with_repo,
+    программы, которые уже есть в БД после прошлых синхронизаций. Отвечает за выбор
+    программы в диалоге: по коду, алиасу, номеру в списке или однозначной части названия.
+    """
+    def __init__(self, programs: Iterable[ProgramConfig] = PROGRAMS):
+        self._by_code: Dict[str, ProgramConfig] = {}
+        for p in programs:
+            self._by_code.setdefault(p.code, p)
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self.programs: List[ProgramConfig] = list(self._by_code.values())
+        self._names: Dict[str, ProgramConfig] = {}
+        for p in self.programs:
+            for key in (p.code, p.name, *p.aliases):
+                self._names.setdefault(key.lower(), p)
+        # упоминания программ в тексте: длинные имена раньше, чтобы «ai product» не читался как «ai»
+        keys = sorted(self._names, key=len, reverse=True)
+        self._mention_re = (re.compile(r"(?<!\w)(?:" + "|".join(map(re.escape, keys)) + r")(?!\w)")
+                            if keys else None)
+
+    def with_repo(self, repo: Repository) -> "ProgramRegistry":
+        for p in repo.list_programs():
+            if p.code not in self._by_code:
+                self._by_code[p.code] = ProgramConfig(code=p.code, name=p.name, url=p.url)
+        self._rebuild()
+        return self
+
+    def __len__(self) -> int:
+        return len(self.programs)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._by_code
+
+    def get(self, code: str) -> Optional[ProgramConfig]:
+        return self._by_code.get(code)
+
+    @property
+    def codes(self) -> List[str]:
+        return [p.code for p in self.programs]
+
+    def resolve(self, text: str) -> Optional[ProgramConfig]:
+        """Программа по ответу пользователя или None, если не узнали (или узнали неоднозначно)."""
+        t = " ".join(text.lower().strip(" «»\"'.!").split())
+        if not t:
+            return None
+        if t in self._names:
+            return self._names[t]
+        if t.isdigit() and 1 <= int(t) <= len(self.programs):
+            return self.programs[int(t) - 1]
+        if len(t) >= 4:
+            found = {p.code: p for p in self.programs if t in p.name.lower()}
+            if len(found) == 1:
+                return next(iter(found.values()))
+        return None
+
+    def mentions(self, text: str) -> List[str]:
+        """Коды программ, названных в тексте кодом, алиасом или полным названием, — по порядку, без повторов."""
+        if self._mention_re is None:
+            return []
+        return list(dict.fromkeys(self._names[m].code for m in self._mention_re.findall(text.lower())))
+
+    def menu(self) -> str:
+        return "\n".join(f"{i}. {p.code} — «{p.name}»" for i, p in enumerate(self.programs, 1))
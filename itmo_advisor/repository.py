@@ -1,7 +1,7 @@
 # repository.py
-import os, sqlite3
-from typing import Iterable, List, Optional
-from domain import Program, Course
+import hashlib, json, os, sqlite3, threading, zlib
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from domain import Program, Course, FaqEntry, detect_elective
 from config import DB_PATH, DATA_DIR
 
 SCHEMA = """
@@ -12,7 +12,8 @@ CREATE TABLE IF NOT EXISTS programs(
   url TEXT NOT NULL,
   plan_url TEXT,
   about_html TEXT,
-  faq_text TEXT
+  faq_text TEXT,
+  page_text BLOB
 );
 CREATE TABLE IF NOT EXISTS courses(
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -24,75 +25,419 @@ CREATE TABLE IF NOT EXISTS courses(
   credits REAL,
   raw TEXT,
   tags TEXT,
+  is_elective INTEGER NOT NULL DEFAULT 0,
   FOREIGN KEY(program_code) REFERENCES programs(code)
 );
+CREATE INDEX IF NOT EXISTS idx_courses_program ON courses(program_code);
+CREATE INDEX IF NOT EXISTS idx_courses_type ON courses(type);
+CREATE TABLE IF NOT EXISTS faqs(
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  program_code TEXT NOT NULL,
+  question TEXT NOT NULL,
+  answer TEXT,
+  FOREIGN KEY(program_code) REFERENCES programs(code)
+);
+CREATE INDEX IF NOT EXISTS idx_faqs_program ON faqs(program_code);
+CREATE TABLE IF NOT EXISTS sync_hashes(
+  program_code TEXT NOT NULL,
+  stage TEXT NOT NULL,
+  hash TEXT NOT NULL,
+  PRIMARY KEY(program_code, stage)
+);
+CREATE TABLE IF NOT EXISTS program_stats(
+  program_code TEXT PRIMARY KEY,
+  stats TEXT NOT NULL,
+  FOREIGN KEY(program_code) REFERENCES programs(code)
+);
+CREATE TABLE IF NOT EXISTS program_pairs(
+  a TEXT NOT NULL,
+  b TEXT NOT NULL,
+  stats TEXT NOT NULL,
+  PRIMARY KEY(a, b)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_program_pairs_b ON program_pairs(b);
+CREATE TABLE IF NOT EXISTS meta(
+  key TEXT PRIMARY KEY,
+  value INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO meta(key,value) VALUES('courses_version', 0);
 """
 
+def split_faq_text(text: str) -> List[Tuple[str, str]]:
+    """faq_text хранит пары как "вопрос\nответ", разделённые пустой строкой."""
+    pairs = []
+    for chunk in (text or "").split("\n\n"):
+        q, _, a = chunk.strip().partition("\n")
+        if q.strip():
+            pairs.append((q.strip(), a.strip()))
+    return pairs
+
+# версия схемы в PRAGMA user_version; миграции в Repository._migrate
+SCHEMA_VERSION = 6
+
+# stage в sync_hashes: хэш FAQ и курсов программы — ключ её сегмента в поисковом индексе
+INDEX_STAGE = "index_segment"
+
+# programs.about_html, faq_text и page_text хранятся сжатыми: BLOB = маркер формата + тело.
+# Значение TEXT — несжатое (БД до миграции), читается как есть
+ZLIB_MARKER = b"zlib1:"
+ZLIB_LEVEL = 6
+
+def pack_text(text: Optional[str]) -> Optional[bytes]:
+    if text is None:
+        return None
+    return ZLIB_MARKER + zlib.compress(text.encode("utf-8"), ZLIB_LEVEL)
+
+def unpack_text(value: Union[str, bytes, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if value.startswith(ZLIB_MARKER):
+        return zlib.decompress(value[len(ZLIB_MARKER):]).decode("utf-8")
+    raise ValueError(f"неизвестный формат сжатого текста: {bytes(value[:8])!r}")
+
+# настройки каждого соединения: чтения из mmap и большого page cache, WAL без fsync на коммит
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",     # 16 МБ
+    "PRAGMA mmap_size=268435456",   # 256 МБ
+    "PRAGMA temp_store=MEMORY",
+)
+
 class Repository:
+    """
+    Доступ к SQLite. Соединение своё у каждого потока (sqlite3 не разрешает делить его
+    между потоками), поэтому экземпляр можно использовать из пулов и executor-ов.
+    Списки курсов по программам кэшируются в памяти до следующего replace_courses,
+    в том числе из другого соединения или процесса: replace_courses увеличивает счётчик
+    meta.courses_version в своей транзакции, а читатели перечитывают его, только когда
+    PRAGMA data_version говорит, что в БД кто-то коммитил.
+    """
     def __init__(self, path: str = DB_PATH):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        self.conn = sqlite3.connect(path)
-        self.conn.execute("PRAGMA foreign_keys=ON;")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        self._conns: List[sqlite3.Connection] = []
+        self._conns_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._courses_cache: Dict[Optional[str], Tuple[int, List[Course]]] = {}
         for stmt in SCHEMA.strip().split(";"):
             if stmt.strip():
                 self.conn.execute(stmt)
         self.conn.commit()
+        self._migrate()
+        self._version = self._read_version()  # meta.courses_version, который видел процесс
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            # запросы — константные строки, их подготовленные выражения живут в кэше соединения
+            c = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+            for pragma in CONNECTION_PRAGMAS:
+                c.execute(pragma)
+            self._local.conn = c
+            self._local.data_version = c.execute("PRAGMA data_version").fetchone()[0]
+            with self._conns_lock:
+                self._conns.append(c)
+        return c
+
+    def _read_version(self) -> int:
+        return self.conn.execute("SELECT value FROM meta WHERE key='courses_version'").fetchone()[0]
+
+    def _set_version(self, version: int) -> None:
+        # счётчик в БД только растёт; поток, прочитавший его раньше чужого коммита, не откатит версию
+        with self._cache_lock:
+            if version > self._version:
+                self._version = version
+                self._courses_cache.clear()
+
+    def courses_version(self) -> int:
+        """Растёт при каждом replace_courses (в том числе из другого процесса)."""
+        self._check_foreign_writes()
+        with self._cache_lock:
+            return self._version
+
+    def _check_foreign_writes(self) -> None:
+        # data_version соединения меняется, если коммитило любое другое соединение (FAQ, sync_hashes,
+        # аналитика); счётчик курсов перечитываем только тогда — одно чтение по первичному ключу
+        dv = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if dv != self._local.data_version:
+            self._local.data_version = dv
+            self._set_version(self._read_version())
+
+    def _migrate(self) -> None:
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self._migrate_faqs()
+        if version < 2:
+            self._migrate_is_elective()
+        if version < 3:
+            self._migrate_compress_programs()
+        if version < 4:
+            # текст страницы заполнится при первом запасном разборе плана (CurriculumParser)
+            cols = {r[1] for r in self.conn.execute("PRAGMA table_info(programs)")}
+            if "page_text" not in cols:
+                self.conn.execute("ALTER TABLE programs ADD COLUMN page_text BLOB")
+        # индекс по is_elective — после миграции: в старой БД колонки нет до ALTER TABLE
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_courses_elective ON courses(program_code, is_elective)")
+        if version < 5:
+            for (code,) in self.conn.execute("SELECT program_code FROM faqs UNION SELECT program_code FROM courses").fetchall():
+                self._update_index_hash(code)
+        if version < 6:
+            # теги читаются из courses.tags, а элективы ранжирует ElectiveRecommender:
+            # таблица course_tags (схема 2–5) только дублировала запись
+            self.conn.execute("DROP TABLE IF EXISTS course_tags")
+        if version < SCHEMA_VERSION:
+            self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self.conn.commit()
+
+    def _migrate_is_elective(self) -> None:
+        # is_elective считаем по type/raw (в Python: lower() SQLite не знает кириллицу)
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(courses)")}
+        if "is_elective" not in cols:
+            self.conn.execute("ALTER TABLE courses ADD COLUMN is_elective INTEGER NOT NULL DEFAULT 0")
+        rows = self.conn.execute("SELECT id,type,raw FROM courses").fetchall()
+        self.conn.executemany(
+            "UPDATE courses SET is_elective=? WHERE id=?",
+            [(int(detect_elective(Course("", "", type=t or "", raw=raw))), cid) for cid, t, raw in rows],
+        )
+        self.conn.commit()
+
+    def _migrate_compress_programs(self) -> None:
+        # HTML и FAQ-текст программ: TEXT -> сжатый BLOB, затем VACUUM, чтобы файл БД уменьшился
+        rows = self.conn.execute(
+            "SELECT code,about_html,faq_text FROM programs WHERE typeof(about_html)='text' OR typeof(faq_text)='text'"
+        ).fetchall()
+        if not rows:
+            return
+        self.conn.executemany(
+            "UPDATE programs SET about_html=?, faq_text=? WHERE code=?",
+            [(pack_text(unpack_text(html)), pack_text(unpack_text(faq)), code) for code, html, faq in rows],
+        )
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+
+    def _migrate_faqs(self) -> None:
+        # БД до появления таблицы faqs: раскладываем сохранённый faq_text на пары
+        rows = self.conn.execute(
+            """SELECT code,faq_text FROM programs WHERE faq_text IS NOT NULL AND faq_text != ''
+               AND NOT EXISTS (SELECT 1 FROM faqs WHERE faqs.program_code=programs.code)"""
+        ).fetchall()
+        for code, faq_text in rows:
+            self.replace_faqs(code, split_faq_text(faq_text))
+
+    def close(self) -> None:
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for c in conns:
+            try:
+                c.close()
+            except sqlite3.ProgrammingError:
+                pass  # закрываем соединение чужого потока
+        self._local = threading.local()
 
     def upsert_program(self, p: Program) -> None:
+        # about_html/faq_text = None (сводка из list_programs) не затирают сохранённые
         self.conn.execute(
-            """INSERT INTO programs(code,name,url,plan_url,about_html,faq_text)
-               VALUES(?,?,?,?,?,?)
+            """INSERT INTO programs(code,name,url,plan_url,about_html,faq_text,page_text)
+               VALUES(?,?,?,?,?,?,?)
                ON CONFLICT(code) DO UPDATE SET
                  name=excluded.name, url=excluded.url, plan_url=excluded.plan_url,
-                 about_html=excluded.about_html, faq_text=excluded.faq_text""",
-            (p.code, p.name, p.url, p.plan_url, p.about_html, p.faq_text),
+                 about_html=COALESCE(excluded.about_html, programs.about_html),
+                 faq_text=COALESCE(excluded.faq_text, programs.faq_text),
+                 page_text=CASE WHEN excluded.about_html IS NULL THEN programs.page_text
+                                ELSE excluded.page_text END""",
+            (p.code, p.name, p.url, p.plan_url, pack_text(p.about_html), pack_text(p.faq_text),
+             pack_text(p.page_text)),
         )
         self.conn.commit()
 
     def replace_courses(self, program_code: str, courses: Iterable[Course]) -> None:
-        self.conn.execute("DELETE FROM courses WHERE program_code=?", (program_code,))
+        conn = self.conn
+        conn.execute("DELETE FROM courses WHERE program_code=?", (program_code,))
+        conn.executemany(
+            """INSERT INTO courses(program_code,name,semester,type,hours,credits,raw,tags,is_elective)
+               VALUES(?,?,?,?,?,?,?,?,?)""",
+            [(c.program_code, c.name, c.semester, c.type, c.hours, c.credits, c.raw,
+              ",".join(c.tags or []), int(detect_elective(c))) for c in courses],
+        )
+        self._update_index_hash(program_code)
+        # агрегаты по плану устарели: CurriculumAnalytics.refresh пересчитает только эту программу
+        conn.execute("DELETE FROM program_stats WHERE program_code=?", (program_code,))
+        conn.execute("DELETE FROM program_pairs WHERE a=? OR b=?", (program_code, program_code))
+        conn.execute("UPDATE meta SET value=value+1 WHERE key='courses_version'")
+        version = self._read_version()
+        conn.commit()
+        self._set_version(version)
+
+    def replace_faqs(self, program_code: str, pairs: Iterable[Tuple[str, str]]) -> None:
+        self.conn.execute("DELETE FROM faqs WHERE program_code=?", (program_code,))
         self.conn.executemany(
-            """INSERT INTO courses(program_code,name,semester,type,hours,credits,raw,tags)
-               VALUES(?,?,?,?,?,?,?,?)""",
-            [
-                (
-                    c.program_code,
-                    c.name,
-                    c.semester,
-                    c.type,
-                    c.hours,
-                    c.credits,
-                    c.raw,
-                    ",".join(c.tags or []),
-                )
-                for c in courses
-            ],
+            "INSERT INTO faqs(program_code,question,answer) VALUES(?,?,?)",
+            [(program_code, q, a) for q, a in pairs],
         )
+        self._update_index_hash(program_code)
         self.conn.commit()
 
-    def get_program(self, code: str) -> Optional[Program]:
+    def list_faqs(self, program_code: Optional[str] = None) -> List[FaqEntry]:
+        q = "SELECT program_code,question,answer,id FROM faqs"
+        if program_code:
+            rows = self.conn.execute(q + " WHERE program_code=? ORDER BY id", (program_code,)).fetchall()
+        else:
+            rows = self.conn.execute(q + " ORDER BY id").fetchall()
+        return [FaqEntry(*r) for r in rows]
+
+    def get_program(self, code: str, full: bool = False) -> Optional[Program]:
+        """Сводка программы (без about_html, faq_text и page_text); full=True — вместе с ними."""
         row = self.conn.execute(
-            "SELECT code,name,url,plan_url,about_html,faq_text FROM programs WHERE code=?", (code,)
+            (_PROGRAM_FULL if full else _PROGRAM_SUMMARY) + " WHERE code=?", (code,)
         ).fetchone()
-        if not row:
-            return None
-        return Program(*row)
+        return _program_from_row(row) if row else None
+
+    def list_programs(self, full: bool = False) -> List[Program]:
+        """Сводки программ: страницы целиком читаются с диска и распаковываются только при full=True."""
+        rows = self.conn.execute((_PROGRAM_FULL if full else _PROGRAM_SUMMARY) + " ORDER BY rowid").fetchall()
+        return [_program_from_row(r) for r in rows]
+
+    def get_program_html(self, code: str) -> Optional[str]:
+        row = self.conn.execute("SELECT about_html FROM programs WHERE code=?", (code,)).fetchone()
+        return unpack_text(row[0]) if row else None
 
-    def list_programs(self) -> List[Program]:
-        rows = self.conn.execute("SELECT code,name,url,plan_url,about_html,faq_text FROM programs").fetchall()
-        return [Program(*r) for r in rows]
+    def get_page_text(self, code: str) -> Optional[str]:
+        row = self.conn.execute("SELECT page_text FROM programs WHERE code=?", (code,)).fetchone()
+        return unpack_text(row[0]) if row else None
+
+    def set_page_text(self, code: str, text: str) -> None:
+        self.conn.execute("UPDATE programs SET page_text=? WHERE code=?", (pack_text(text), code))
+        self.conn.commit()
+
+    def get_faq_text(self, code: str) -> Optional[str]:
+        row = self.conn.execute("SELECT faq_text FROM programs WHERE code=?", (code,)).fetchone()
+        return unpack_text(row[0]) if row else None
 
     def list_courses(self, program_code: Optional[str] = None) -> List[Course]:
+        """Курсы программы (или все). Объекты Course общие с кэшем — не изменяйте их."""
+        self._check_foreign_writes()
+        key = program_code or None
+        with self._cache_lock:
+            version = self._version
+            hit = self._courses_cache.get(key)
+        if hit and hit[0] == version:
+            return list(hit[1])
+        res = self._load_courses(program_code)
+        with self._cache_lock:
+            if self._version == version:
+                self._courses_cache[key] = (version, res)
+        return list(res)
+
+    def _load_courses(self, program_code: Optional[str]) -> List[Course]:
         cur = self.conn.cursor()
         if program_code:
             cur.execute(
-                "SELECT program_code,name,semester,type,hours,credits,raw,tags FROM courses WHERE program_code=?",
+                "SELECT program_code,name,semester,type,hours,credits,raw,tags,is_elective FROM courses WHERE program_code=?",
                 (program_code,),
             )
         else:
-            cur.execute("SELECT program_code,name,semester,type,hours,credits,raw,tags FROM courses")
-        res = []
-        for row in cur.fetchall():
-            tags = row[7].split(",") if row[7] else []
-            res.append(Course(row[0], row[1], row[2], row[3], row[4], row[5], row[6], tags))
-        return res
\ No newline at end of file
+            cur.execute("SELECT program_code,name,semester,type,hours,credits,raw,tags,is_elective FROM courses")
+        return [_course_from_row(row) for row in cur.fetchall()]
+
+    def list_electives(self, program_code: str) -> List[Course]:
+        """
+        Элективы программы в порядке id, как их отдаёт list_courses. Читаются только
+        строки с is_elective=1 (по индексу); совпадения с тегами бэкграунда считает
+        ElectiveRecommender по скомпилированным массивам.
+        """
+        rows = self.conn.execute(
+            """SELECT program_code,name,semester,type,hours,credits,raw,tags,is_elective
+               FROM courses WHERE program_code=? AND is_elective=1 ORDER BY id""",
+            (program_code,),
+        ).fetchall()
+        return [_course_from_row(row) for row in rows]
+
+    def get_sync_hash(self, program_code: str, stage: str) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT hash FROM sync_hashes WHERE program_code=? AND stage=?", (program_code, stage)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_sync_hash(self, program_code: str, stage: str, value: str) -> None:
+        self.conn.execute(
+            """INSERT INTO sync_hashes(program_code,stage,hash) VALUES(?,?,?)
+               ON CONFLICT(program_code,stage) DO UPDATE SET hash=excluded.hash""",
+            (program_code, stage, value),
+        )
+        self.conn.commit()
+
+    def index_hashes(self) -> Dict[str, str]:
+        """
+        Хэши того, из чего строится сегмент поискового индекса (FAQ и строки курсов),
+        по программам. Пересчитываются при записи программы (replace_courses/replace_faqs),
+        поэтому здесь — одно чтение sync_hashes, а не проход по всей БД.
+        """
+        rows = self.conn.execute("SELECT program_code,hash FROM sync_hashes WHERE stage=?", (INDEX_STAGE,))
+        return dict(rows.fetchall())
+
+    def _update_index_hash(self, program_code: str) -> None:
+        # вызывается до commit() записи программы: хэш меняется в той же транзакции
+        h, n = hashlib.sha256(), 0
+        for q in ("SELECT program_code,question,answer FROM faqs WHERE program_code=? ORDER BY id",
+                  "SELECT program_code,name,semester,type,hours,credits,raw,tags FROM courses WHERE program_code=? ORDER BY id"):
+            for row in self.conn.execute(q, (program_code,)):
+                h.update(repr(row).encode("utf-8"))
+                n += 1
+        if n:
+            self.conn.execute(
+                """INSERT INTO sync_hashes(program_code,stage,hash) VALUES(?,?,?)
+                   ON CONFLICT(program_code,stage) DO UPDATE SET hash=excluded.hash""",
+                (program_code, INDEX_STAGE, h.hexdigest()),
+            )
+        else:
+            # программа без документов — сегмента у неё нет
+            self.conn.execute("DELETE FROM sync_hashes WHERE program_code=? AND stage=?", (program_code, INDEX_STAGE))
+
+    def stale_stats_programs(self) -> List[str]:
+        """Программы с курсами, у которых нет агрегатов (новые или после replace_courses)."""
+        rows = self.conn.execute(
+            """SELECT DISTINCT program_code FROM courses
+               WHERE program_code NOT IN (SELECT program_code FROM program_stats)"""
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def list_program_stats(self) -> Dict[str, dict]:
+        rows = self.conn.execute("SELECT program_code,stats FROM program_stats").fetchall()
+        return {code: json.loads(stats) for code, stats in rows}
+
+    def list_pair_stats(self) -> Dict[Tuple[str, str], dict]:
+        """Сравнения пар программ; ключ — (a, b) с a < b."""
+        rows = self.conn.execute("SELECT a,b,stats FROM program_pairs").fetchall()
+        return {(a, b): json.loads(stats) for a, b, stats in rows}
+
+    def save_analytics(self, stats: Dict[str, dict], pairs: Dict[Tuple[str, str], dict],
+                       replace_all: bool = False) -> None:
+        """Агрегаты программ и пар — одной транзакцией; replace_all сначала удаляет все прежние."""
+        if replace_all:
+            self.conn.execute("DELETE FROM program_pairs")
+            self.conn.execute("DELETE FROM program_stats")
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO program_stats(program_code,stats) VALUES(?,?)",
+            [(code, json.dumps(st, ensure_ascii=False)) for code, st in stats.items()],
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO program_pairs(a,b,stats) VALUES(?,?,?)",
+            [(a, b, json.dumps(st, ensure_ascii=False)) for (a, b), st in pairs.items()],
+        )
+        self.conn.commit()
+
+_PROGRAM_SUMMARY = "SELECT code,name,url,plan_url FROM programs"
+_PROGRAM_FULL = "SELECT code,name,url,plan_url,about_html,faq_text,page_text FROM programs"
+
+def _program_from_row(row) -> Program:
+    if len(row) == 4:
+        return Program(*row)
+    return Program(*row[:4], about_html=unpack_text(row[4]), faq_text=unpack_text(row[5]),
+                   page_text=unpack_text(row[6]))
+
+def _course_from_row(row) -> Course:
+    tags = row[7].split(",") if row[7] else []
+    return Course(row[0], row[1], row[2], row[3], row[4], row[5], row[6], tags, bool(row[8]))
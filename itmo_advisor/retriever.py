@@ -1,47 +1,575 @@
 # retriever.py
-from typing import List, Tuple
+import copy, glob, io, itertools, json, os, re, tempfile, threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from scipy.sparse import csc_matrix, csr_matrix
 from repository import Repository
-from domain import Course, Program
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from config import DB_PATH, INDEX_DIR, INDEX_MAX_FEATURES, SEARCH_WORKERS, SEARCH_SHARD_SIZE
+from metrics import METRICS
+
+# версия формата сохранённого индекса: при несовпадении индекс пересобирается
+INDEX_FORMAT_VERSION = 4
+# токенизация как у TfidfVectorizer(ngram_range=(1, 2)), см. _analyze. max_features
+# (INDEX_MAX_FEATURES) применяется к общей статистике при каждом refresh, на сохранённые
+# частоты сегментов не влияет и в манифест не входит
+VECTORIZER_PARAMS = dict(ngram_range=(1, 2))
+_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+# поколение индекса: уникально для каждой сборки/загрузки в процессе, в том числе
+# между разными экземплярами Retriever (sync подменяет ретривер целиком)
+_generations = itertools.count(1)
+# общий словарь дополняется только под этой блокировкой (номера термов не должны совпасть)
+_vocab_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+Hit = Tuple[float, Tuple[str, str], str]
+
+class Segment:
+    """
+    Документы одной программы (FAQ, затем курсы) и сырые частоты их термов в локальном
+    словаре сегмента. От других программ сегмент не зависит: IDF и нормировку строк
+    Retriever считает по объединённой статистике, поэтому пересобирать сегмент нужно
+    только при изменении его программы.
+    """
+    def __init__(self, code: str, hash: str, docs: List[str], meta: List[Tuple[str, str]],
+                 terms: List[str], counts: csr_matrix, gids: Optional[np.ndarray] = None):
+        self.code = code
+        self.hash = hash              # Repository.index_hashes()[code] на момент сборки
+        self.docs = docs
+        self.meta = meta              # ("course", "code:name") или ("faq", "code:faq_id")
+        self.terms = terms            # локальный словарь
+        self.counts = counts          # документы x локальные термы, tf
+        self.df = np.bincount(counts.indices, minlength=counts.shape[1])
+        self.tf = np.bincount(counts.indices, weights=counts.data, minlength=counts.shape[1])
+        self.is_course = np.fromiter((typ == "course" for typ, _ in meta), dtype=bool, count=len(meta))
+        # номера локальных термов в общем словаре (bind) и они же по возрастанию — для поиска
+        self._bound: Optional[dict] = None
+        self._set_gids(gids if gids is not None else np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def merged(cls, segs: Sequence["Segment"]) -> "Segment":
+        """
+        Шард: несколько сегментов одной матрицей со столбцами — объединением их термов.
+        Запрос без программы проходит по шардам, а не по каждому сегменту отдельно.
+        """
+        gids = np.unique(np.concatenate([seg.gids for seg in segs]))
+        indptr, offset = [np.zeros(1, dtype=np.int64)], 0
+        for seg in segs:
+            indptr.append(np.asarray(seg.counts.indptr[1:], dtype=np.int64) + offset)
+            offset += seg.counts.nnz
+        counts = csr_matrix((np.concatenate([seg.counts.data for seg in segs]),
+                             np.concatenate([np.searchsorted(gids, seg.gids[seg.counts.indices]) for seg in segs]),
+                             np.concatenate(indptr)),
+                            shape=(sum(seg.counts.shape[0] for seg in segs), len(gids)))
+        counts.sort_indices()
+        return cls("*", "", [d for seg in segs for d in seg.docs], [m for seg in segs for m in seg.meta],
+                   [], counts, gids)
+
+    def _set_gids(self, gids: np.ndarray) -> None:
+        self.gids = gids
+        self._order = np.argsort(gids, kind="stable")
+        self._sorted = gids[self._order]
+
+    def bind(self, vocab: Dict[str, int]) -> None:
+        # общий словарь только растёт, так что выданные номера остаются верными
+        if self._bound is vocab:
+            return
+        self._set_gids(np.fromiter((vocab.setdefault(t, len(vocab)) for t in self.terms),
+                                   dtype=np.int64, count=len(self.terms)))
+        self._bound = vocab
+
+    def detached(self) -> "Segment":
+        """Копия сегмента без привязки к словарю: её можно привязать к другому, не трогая оригинал."""
+        seg = copy.copy(self)
+        seg._bound = None
+        return seg
+
+    def local(self, gids: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Термы запроса (номера в общем словаре, по возрастанию) -> локальные столбцы и их веса."""
+        if not len(self._sorted) or not len(gids):
+            return gids[:0], weights[:0]
+        pos = np.minimum(np.searchsorted(self._sorted, gids), len(self._sorted) - 1)
+        hit = self._sorted[pos] == gids
+        return self._order[pos[hit]], weights[hit]
 
 class Retriever:
+    """
+    TF-IDF поиск по FAQ и курсам, разбитый на сегменты по программам. Сегмент хранит
+    только свои частоты термов; общий IDF собирается из документных частот сегментов,
+    поэтому добавление, замена или удаление программы перевекторизует только её сегмент
+    (refresh), а скоры совпадают с одним TfidfVectorizer(max_features=INDEX_MAX_FEATURES)
+    на весь корпус. Частоты сегменты хранят по всем своим термам, а ограничение словаря
+    применяется к общей статистике: матрицы весов и запросы — только по его термам.
+    """
     def __init__(self, repo: Repository):
         self.repo = repo
-        self._vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1,2))
-        self._docs: List[str] = []
-        self._meta: List[Tuple[str,str]] = []  # (type, id) -> ("course", name) или ("faq", program_code)
+        self._segments: Dict[str, Segment] = {}  # в порядке программ
+        # общий словарь: терм -> номер; только растёт, а когда больше половины его термов нет
+        # ни в одном сегменте, _set_segments заводит новый
+        self._vocab: Dict[str, int] = {}
+        self._idf = np.zeros(0)
+        self._n_docs = 0
+        # шарды для запросов без программы: группа сегментов -> Segment.merged; от IDF не
+        # зависят, поэтому переживают refresh, если ни один сегмент группы не изменился
+        self._shards: Dict[Tuple[Segment, ...], Segment] = {}
+        # tf-idf с L2-нормой строк при текущем IDF: сегмент/шард -> CSC (его инвертированный
+        # индекс); строятся лениво при первом запросе
+        self._weights: Dict[Segment, csc_matrix] = {}
+        self.generation = 0
+
+    @property
+    def n_docs(self) -> int:
+        return self._n_docs
+
+    @property
+    def codes(self) -> List[str]:
+        return list(self._segments)
 
     def build(self):
-        docs = []
-        meta = []
-        # FAQ + about
-        for p in self.repo.list_programs():
-            blocks = []
-            if p.faq_text:
-                blocks.append(p.faq_text)
-            self._append_doc(docs, meta, "\n\n".join(blocks), ("faq", p.code))
+        """Полная пересборка: все сегменты векторизуются заново."""
+        with METRICS.span("retriever.build"):
+            self._segments, self._vocab, self._shards = {}, {}, {}
+            self._refresh()
+
+    def refresh(self, hashes: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Приводит индекс к БД: пересобирает сегменты программ, чьи FAQ или курсы изменились
+        (или появились), и убирает пропавшие. Возвращает коды пересобранных сегментов.
+        """
+        with METRICS.span("retriever.refresh"):
+            return self._refresh(hashes)
+
+    def _refresh(self, hashes: Optional[Dict[str, str]] = None) -> List[str]:
+        hashes = hashes if hashes is not None else self.repo.index_hashes()
+        segments: Dict[str, Segment] = {}
+        rebuilt = []
+        for code in self._program_order(hashes):
+            seg = self._segments.get(code)
+            if seg is None or seg.hash != hashes[code]:
+                with METRICS.span("retriever.segment"):
+                    seg = self._build_segment(code, hashes[code])
+                rebuilt.append(code)
+            segments[code] = seg
+        self._set_segments(segments)
+        return rebuilt
+
+    def fork(self) -> "Retriever":
+        """
+        Копия для обновления рядом с живым индексом: сегменты и общий словарь общие,
+        refresh() копии пересоберёт только изменившееся, а живой индекс не изменится.
+        """
+        r = Retriever(self.repo)
+        r._vocab = self._vocab
+        r._shards = dict(self._shards)
+        r._set_segments(dict(self._segments))
+        return r
+
+    def _program_order(self, hashes: Dict[str, str]) -> List[str]:
+        codes = [p.code for p in self.repo.list_programs() if p.code in hashes]
+        return codes + [c for c in hashes if c not in codes]
+
+    def _build_segment(self, code: str, hash: str) -> Segment:
+        docs: List[str] = []
+        meta: List[Tuple[str, str]] = []
+        # FAQ: отдельный документ на каждую пару вопрос/ответ
+        for f in self.repo.list_faqs(code):
+            _append_doc(docs, meta, f"{f.question}\n{f.answer}", ("faq", f"{code}:{f.id}"))
         # Courses
-        for c in self.repo.list_courses():
+        for c in self.repo.list_courses(code):
             txt = f"{c.name}\nсеместр: {c.semester or ''}\nтип: {c.type}\nчасы: {c.hours or ''}\nкредиты: {c.credits or ''}\nтеги: {', '.join(c.tags)}\n{c.raw or ''}"
-            self._append_doc(docs, meta, txt, ("course", f"{c.program_code}:{c.name}"))
-        self._docs = docs
-        self._meta = meta
-        if self._docs:
-            self._X = self._vectorizer.fit_transform(self._docs)
-        else:
-            from scipy.sparse import csr_matrix
-            self._X = csr_matrix((0,0))
-
-    def _append_doc(self, docs, meta, text, idt):
-        if text and text.strip():
-            docs.append(text)
-            meta.append(idt)
-
-    def query(self, q: str, topk: int = 5) -> List[Tuple[float, Tuple[str,str], str]]:
-        if not self._docs:
+            _append_doc(docs, meta, txt, ("course", f"{c.program_code}:{c.name}"))
+        return _vectorize(code, hash, docs, meta)
+
+    def _set_segments(self, segments: Dict[str, Segment]) -> None:
+        df, tf = self._bind(segments)
+        if len(self._vocab) > 2 * np.count_nonzero(df):
+            # термы удалённых и пересобранных сегментов копятся в общем словаре (fork делит его
+            # с живым индексом). Сегменты привязываются к новому словарю копиями: оригиналы
+            # могут быть у живого индекса, их номера термов менять нельзя.
+            self._vocab, self._shards = {}, {}
+            segments = {code: seg.detached() for code, seg in segments.items()}
+            df, tf = self._bind(segments)
+        n = sum(len(seg.docs) for seg in segments.values())
+        self._segments = segments
+        # сглаженный IDF, как у TfidfVectorizer(smooth_idf=True); у термов вне словаря
+        # (нет в сегментах или не прошли max_features) IDF = 0: их нет ни в строках, ни в запросе
+        idf = np.log((1 + n) / (1 + df)) + 1
+        idf[~self._features(df, tf)] = 0.0
+        self._idf = idf
+        self._n_docs = n
+        groups = set(self._groups())
+        self._shards = {key: shard for key, shard in self._shards.items() if key in groups}
+        self._weights = {}
+        self.generation = next(_generations)
+
+    def _bind(self, segments: Dict[str, Segment]) -> Tuple[np.ndarray, np.ndarray]:
+        """Привязывает сегменты к общему словарю; возвращает документные и корпусные частоты его термов."""
+        with _vocab_lock:
+            for seg in segments.values():
+                seg.bind(self._vocab)
+            df = np.zeros(len(self._vocab), dtype=np.int64)
+        tf = np.zeros(len(df))
+        for seg in segments.values():
+            df[seg.gids] += seg.df  # номера внутри сегмента не повторяются
+            tf[seg.gids] += seg.tf
+        return df, tf
+
+    def _features(self, df: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        """
+        Маска термов словаря поиска: встречаются в корпусе и, как у max_features, входят
+        в INDEX_MAX_FEATURES самых частых по корпусу; при равной частоте — по алфавиту,
+        чтобы словарь не зависел от истории общего словаря (fork/refresh).
+        """
+        mask = df > 0
+        cand = np.flatnonzero(mask)
+        if not INDEX_MAX_FEATURES or len(cand) <= INDEX_MAX_FEATURES:
+            return mask
+        # порог — частота INDEX_MAX_FEATURES-го терма; всё, что чаще, входит целиком
+        kth = -np.partition(-tf[cand], INDEX_MAX_FEATURES - 1)[INDEX_MAX_FEATURES - 1]
+        keep = cand[tf[cand] > kth]
+        tied = set(cand[tf[cand] == kth].tolist())
+        names = sorted((t, g) for t, g in self._vocab.items() if g in tied)
+        mask = np.zeros(len(df), dtype=bool)
+        mask[keep] = True
+        mask[[g for _, g in names[:INDEX_MAX_FEATURES - len(keep)]]] = True
+        return mask
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Сохраняет сегменты: частоты термов (CSR в .npy), словарь и документы. Файлы сегмента
+        неизменяемы и помечены его хэшем; уже записанные не переписываются, так что после
+        изменения одной программы на диск пишется только её сегмент. manifest.json пишется
+        последним и атомарно: читатели видят либо старый, либо новый набор сегментов.
+        Каталог по умолчанию — index_dir(repo.path), как и у load().
+        """
+        if not self._segments:
+            return
+        path = path or index_dir(self.repo.path)
+        os.makedirs(path, exist_ok=True)
+        entries = {}
+        for seg in self._segments.values():
+            tag = _segment_tag(seg)
+            entries[seg.code] = {"hash": seg.hash, "tag": tag, "shape": list(seg.counts.shape)}
+            if not os.path.exists(os.path.join(path, f"{tag}.docs.json")):
+                _save_segment(path, tag, seg)
+        manifest_path = os.path.join(path, "manifest.json")
+        prev_tags, prev_mtime = _manifest_tags(manifest_path)
+        manifest = {"version": INDEX_FORMAT_VERSION, "segments": entries,
+                    "params": {k: list(v) if isinstance(v, tuple) else v for k, v in VECTORIZER_PARAMS.items()}}
+        _write_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+        # сборка мусора: файлы текущего и предыдущего манифеста остаются, остальные удаляются,
+        # только если они старше предыдущего манифеста. Более новые может сейчас писать другой
+        # процесс (--sync из CLI рядом с /sync бота), и его манифест на них ещё сошлётся.
+        # Открытые mmap у читателей на Linux остаются валидными.
+        if prev_mtime is None:
+            return
+        keep = {e["tag"] for e in entries.values()} | prev_tags
+        for old in glob.glob(os.path.join(path, "*.*")):
+            base = os.path.basename(old)
+            if base == "manifest.json" or ".".join(base.split(".")[:2]) in keep:
+                continue
+            try:
+                if os.path.getmtime(old) < prev_mtime:
+                    os.remove(old)
+            except OSError:
+                pass
+
+    def load(self, path: Optional[str] = None, hashes: Optional[Dict[str, str]] = None) -> bool:
+        """
+        Загружает сохранённые сегменты программ, которые не изменились (массивы — через mmap).
+        True — индекс полностью актуален; False — каких-то сегментов нет или они устарели,
+        их дособерёт refresh().
+        """
+        path = path or index_dir(self.repo.path)
+        try:
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        params = {k: tuple(v) if isinstance(v, list) else v for k, v in manifest.get("params", {}).items()}
+        if manifest.get("version") != INDEX_FORMAT_VERSION or params != VECTORIZER_PARAMS:
+            return False
+        hashes = hashes if hashes is not None else self.repo.index_hashes()
+        segments: Dict[str, Segment] = {}
+        for code in self._program_order(hashes):
+            e = manifest["segments"].get(code)
+            if not e or e["hash"] != hashes[code]:
+                continue
+            try:
+                segments[code] = _load_segment(path, code, e)
+            except (OSError, ValueError, KeyError):
+                continue
+        self._vocab, self._shards = {}, {}
+        self._set_segments(segments)
+        return len(segments) == len(hashes)
+
+    def load_or_build(self, path: Optional[str] = None) -> bool:
+        """True — индекс взят с диска, False — пришлось пересобрать изменившиеся сегменты (и они сохранены)."""
+        hashes = self.repo.index_hashes()
+        if self.load(path, hashes):
+            return True
+        self.refresh(hashes)
+        self.save(path)
+        return False
+
+    def _query_terms(self, q: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Вектор запроса как vectorizer.transform([q]) (tf * idf, L2), но разреженный:
+        номера термов в общем словаре (по возрастанию) и их веса.
+        """
+        vocab, idf = self._vocab, self._idf
+        tf: Counter = Counter()
+        for term in _analyze(q):
+            g = vocab.get(term)
+            # терм вне словаря поиска этого индекса (IDF = 0) не считается
+            if g is not None and g < len(idf) and idf[g]:
+                tf[g] += 1
+        gids = np.fromiter(tf, dtype=np.int64, count=len(tf))
+        w = np.fromiter(tf.values(), dtype=np.float64, count=len(tf)) * idf[gids]
+        if len(w):
+            w /= np.sqrt(w @ w)
+        order = np.argsort(gids)
+        return gids[order], w[order]
+
+    def _weighted(self, seg: Segment) -> csc_matrix:
+        W = self._weights.get(seg)
+        if W is None:
+            # гонка двух потоков безвредна: оба посчитают одинаковую матрицу
+            C = seg.counts
+            rows = np.repeat(np.arange(C.shape[0]), np.diff(C.indptr))
+            data = C.data * self._idf[seg.gids][C.indices]
+            norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=C.shape[0]))
+            norms[norms == 0] = 1.0
+            W = csr_matrix((data / norms[rows], C.indices, C.indptr), shape=C.shape).tocsc()
+            W.eliminate_zeros()  # термы вне словаря поиска
+            W.sort_indices()
+            self._weights[seg] = W
+        return W
+
+    def _score(self, seg: Segment, gids: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        Скоры документов сегмента по его инвертированному индексу (term-at-a-time):
+        проходим только postings терминов запроса. Документ без общих с запросом
+        терминов получает 0.
+        """
+        W = self._weighted(seg)
+        n = W.shape[0]
+        rows, vals = [], []
+        for j, w in zip(*seg.local(gids, weights)):
+            a, b = W.indptr[j], W.indptr[j + 1]
+            rows.append(W.indices[a:b])
+            vals.append(W.data[a:b] * w)
+        if not rows:
+            return np.zeros(n)
+        return np.bincount(np.concatenate(rows), weights=np.concatenate(vals), minlength=n)
+
+    def _weigh(self, seg: Segment, sims: np.ndarray, type_weights: Optional[Dict[str, float]],
+               rows: Optional[np.ndarray] = None) -> np.ndarray:
+        # множитель скора по типу документа ("faq"/"course"), например по темам вопроса из guard;
+        # rows — номера документов, если sims посчитаны не для всего сегмента
+        if not type_weights:
+            return sims
+        is_course = seg.is_course if rows is None else seg.is_course[rows]
+        return sims * np.where(is_course, type_weights.get("course", 1.0), type_weights.get("faq", 1.0))
+
+    def _groups(self) -> List[Tuple[Segment, ...]]:
+        segs = list(self._segments.values())
+        return [tuple(segs[i:i + SEARCH_SHARD_SIZE]) for i in range(0, len(segs), SEARCH_SHARD_SIZE)]
+
+    def _targets(self, program_code: Optional[str]) -> List[Segment]:
+        """Сегмент программы или, без неё, шарды всего каталога (по SEARCH_SHARD_SIZE программ)."""
+        if program_code:
+            seg = self._segments.get(program_code)
+            return [seg] if seg is not None else []
+        shards = []
+        for key in self._groups():
+            shard = key[0] if len(key) == 1 else self._shards.get(key)
+            if shard is None:
+                # гонка двух потоков безвредна: оба соберут одинаковый шард
+                shard = self._shards[key] = Segment.merged(key)
+            shards.append(shard)
+        return shards
+
+    def query(self, q: str, topk: int = 5, program_code: Optional[str] = None,
+              type_weights: Optional[Dict[str, float]] = None) -> List[Hit]:
+        """
+        Top-k по косинусной близости. Строки TF-IDF и вектор запроса L2-нормированы,
+        поэтому косинус — скалярное произведение; оно считается по postings терминов
+        запроса. program_code ограничивает поиск сегментом одной программы, без него
+        запрос расходится по шардам каталога (параллельно, если их несколько) и их top-k сливаются.
+        type_weights ({"faq"|"course": множитель}) смещает ранжирование к типу документов.
+        """
+        segs = self._targets(program_code)
+        if not segs:
+            return []
+        gids, weights = self._query_terms(q)
+        if not len(gids):
             return []
-        qv = self._vectorizer.transform([q])
-        sims = cosine_similarity(qv, self._X).ravel()
-        idx = sims.argsort()[::-1][:topk]
-        return [(float(sims[i]), self._meta[i], self._docs[i]) for i in idx]
\ No newline at end of file
+
+        def search(seg: Segment):
+            sims = self._weigh(seg, self._score(seg, gids, weights), type_weights)
+            return [(float(sims[i]), seg, i) for i in _top_k(sims, topk)]
+
+        return _merge(_fan_out(search, segs), topk)
+
+    def query_batch(self, questions: Sequence[str], topk: int = 5,
+                    program_codes: Optional[Sequence[Optional[str]]] = None,
+                    type_weights: Optional[Sequence[Optional[Dict[str, float]]]] = None,
+                    ) -> List[List[Hit]]:
+        """
+        Пакетный query: вопросы к одному сегменту собираются в одну разреженную матрицу
+        (локальные термы x N, CSC) и оцениваются одним умножением на матрицу сегмента;
+        одиночный вопрос к сегменту идёт обычным query.
+        Результат i-го вопроса совпадает с query(questions[i], topk, program_codes[i], type_weights[i]).
+        """
+        results: List[List[Hit]] = [[] for _ in questions]
+        if not self._segments or not questions:
+            return results
+        codes = list(program_codes) if program_codes is not None else [None] * len(questions)
+        weights = list(type_weights) if type_weights is not None else [None] * len(questions)
+        groups: Dict[Optional[str], List[int]] = {}
+        for i, code in enumerate(codes):
+            groups.setdefault(code or None, []).append(i)
+        for code, idxs in groups.items():
+            if len(idxs) == 1:
+                # одному вопросу матрица не нужна: обычный поиск по postings
+                i = idxs[0]
+                results[i] = self.query(questions[i], topk, code, weights[i])
+                continue
+            segs = self._targets(code)
+            if not segs:
+                continue
+            terms = [self._query_terms(questions[i]) for i in idxs]
+
+            def search(seg: Segment, idxs=idxs, terms=terms):
+                W = self._weighted(seg)
+                # Q разреженная: у вопроса единицы термов, а столбцов у шарда — весь его словарь
+                local = [seg.local(*t) for t in terms]
+                indptr = np.cumsum([0] + [len(js) for js, _ in local])
+                Q = csc_matrix((np.concatenate([ws for _, ws in local]),
+                                np.concatenate([js for js, _ in local]).astype(np.int64), indptr),
+                               shape=(W.shape[1], len(idxs)))
+                # документы x вопросы, тоже разреженная: в столбце только документы с общими термами
+                S = W @ Q
+                out = []
+                for col, i in enumerate(idxs):
+                    a, b = S.indptr[col], S.indptr[col + 1]
+                    rows = S.indices[a:b]
+                    sims = self._weigh(seg, S.data[a:b], weights[i], rows)
+                    out.append([(float(sims[j]), seg, int(rows[j])) for j in _top_k(sims, topk, rows)])
+                return out
+
+            per_segment = _fan_out(search, segs)
+            for col, i in enumerate(idxs):
+                results[i] = _merge([hits[col] for hits in per_segment], topk)
+        return results
+
+def index_dir(db_path: str) -> str:
+    """Каталог индекса для БД db_path: INDEX_DIR для основной БД, иначе каталог рядом с ней."""
+    return INDEX_DIR if db_path == DB_PATH else db_path + ".index"
+
+def _append_doc(docs, meta, text, idt):
+    if text and text.strip():
+        docs.append(text)
+        meta.append(idt)
+
+def _vectorize(code: str, hash: str, docs: List[str], meta: List[Tuple[str, str]]) -> Segment:
+    """Сырые частоты термов документов сегмента в его локальном словаре."""
+    vocab: Dict[str, int] = {}
+    indptr, indices, data = [0], [], []
+    for text in docs:
+        tf = Counter(vocab.setdefault(t, len(vocab)) for t in _analyze(text))
+        indices.extend(tf)
+        data.extend(tf.values())
+        indptr.append(len(indices))
+    counts = csr_matrix((np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32),
+                         np.asarray(indptr, dtype=np.int32)), shape=(len(docs), len(vocab)))
+    counts.sort_indices()
+    return Segment(code, hash, docs, meta, list(vocab), counts)
+
+def _segment_tag(seg: Segment) -> str:
+    # имя файла: код программы (только безопасные символы) и хэш её содержимого
+    return re.sub(r"[^\w-]", "_", seg.code) + "." + seg.hash[:16]
+
+def _write_atomic(final: str, payload: bytes) -> None:
+    # уникальное временное имя: два процесса, пишущие один файл, не портят друг другу запись
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(final), prefix=os.path.basename(final) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, final)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _manifest_tags(manifest_path: str) -> Tuple[set, Optional[float]]:
+    """Теги сегментов действующего манифеста и время его записи; (set(), None), если его нет."""
+    try:
+        mtime = os.path.getmtime(manifest_path)
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        return {e["tag"] for e in manifest.get("segments", {}).values()}, mtime
+    except (OSError, ValueError, KeyError, AttributeError):
+        return set(), None
+
+def _save_segment(path: str, tag: str, seg: Segment) -> None:
+    def npy(arr: np.ndarray) -> bytes:
+        buf = io.BytesIO()
+        np.save(buf, arr)
+        return buf.getvalue()
+
+    X = seg.counts
+    for name, arr in (("data", X.data), ("indices", X.indices), ("indptr", X.indptr)):
+        _write_atomic(os.path.join(path, f"{tag}.{name}.npy"), npy(arr))
+    # docs.json — последним: по нему save() считает сегмент записанным
+    _write_atomic(os.path.join(path, f"{tag}.docs.json"), json.dumps(
+        {"terms": seg.terms, "meta": seg.meta, "docs": seg.docs}, ensure_ascii=False).encode("utf-8"))
+
+def _load_segment(path: str, code: str, entry: dict) -> Segment:
+    prefix = os.path.join(path, entry["tag"] + ".")
+    data, indices, indptr = (np.load(f"{prefix}{n}.npy", mmap_mode="r") for n in ("data", "indices", "indptr"))
+    with open(f"{prefix}docs.json", encoding="utf-8") as f:
+        payload = json.load(f)
+    counts = csr_matrix((data, indices, indptr), shape=tuple(entry["shape"]), copy=False)
+    return Segment(code, entry["hash"], payload["docs"], [tuple(m) for m in payload["meta"]],
+                   payload["terms"], counts)
+
+def _fan_out(fn: Callable[[Segment], object], segs: List[Segment]) -> list:
+    """fn по сегментам/шардам, результаты — в их порядке; несколько шардов — в пуле потоков."""
+    global _pool
+    if len(segs) < 2 or SEARCH_WORKERS <= 1:
+        return [fn(seg) for seg in segs]
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+    return list(_pool.map(fn, segs))
+
+def _merge(per_segment: List[List[Tuple[float, Segment, int]]], topk: int) -> List[Hit]:
+    # сегменты идут в порядке программ, а sorted устойчив: при равных скорах порядок как в общем индексе
+    hits = sorted((h for hits in per_segment for h in hits), key=lambda h: -h[0])[:topk]
+    return [(score, seg.meta[i], seg.docs[i]) for score, seg, i in hits]
+
+def _analyze(text: str) -> List[str]:
+    """Термы как у TfidfVectorizer(ngram_range=(1, 2)) по умолчанию: lowercase, токены \\w\\w+, униграммы и биграммы."""
+    tokens = _TOKEN_RE.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+def _top_k(scores: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    # документы с нулевым скором не имеют общих с запросом терминов — это не ответ
+    idx = np.flatnonzero(scores > 0)
+    if k <= 0:
+        return idx[:0]
+    if rows is not None:
+        # скоры только части документов (rows — их номера, не по порядку): равные скоры — по номеру документа
+        if k < idx.shape[0]:
+            idx = idx[np.argpartition(-scores[idx], k - 1)[:k]]
+        return idx[np.lexsort((rows[idx], -scores[idx]))]
+    if k < idx.shape[0]:
+        # argpartition переставляет индексы; возвращаем порядок документов, чтобы равные скоры шли как в индексе
+        idx = np.sort(idx[np.argpartition(-scores[idx], k - 1)[:k]])
+    return idx[np.argsort(-scores[idx], kind="stable")]
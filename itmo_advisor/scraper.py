@@ -1,76 +1,195 @@
 # scraper.py
-import re, time, os
-from typing import Tuple, Optional
+import hashlib, json, logging, os, threading, time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
 import requests
-from bs4 import BeautifulSoup
-from config import REQUEST_TIMEOUT, USER_AGENT, DATA_DIR, PROGRAMS
+from requests.adapters import HTTPAdapter
+from config import (REQUEST_TIMEOUT, USER_AGENT, DATA_DIR, PROGRAMS, ProgramConfig,
+                    HTTP_CACHE_DIR, MAX_REQUESTS_PER_HOST, REQUESTS_PER_SECOND_PER_HOST, DOWNLOAD_CHUNK_SIZE)
 from domain import Program
+from html_doc import PageDoc, parse_page
+from metrics import METRICS
 from repository import Repository
 
 HEADERS = {"User-Agent": USER_AGENT}
+log = logging.getLogger(__name__)
+
+def faq_pairs_to_text(pairs: List[Tuple[str, str]]) -> str:
+    return "\n\n".join(f"{q}\n{a}" for q, a in pairs)
+
+@dataclass
+class Fetched:
+    url: str
+    path: str          # где лежит тело ответа на диске
+    changed: bool      # False, если сервер ответил 304 и взяли копию из кэша
+    encoding: Optional[str] = None
+
+    def text(self) -> str:
+        with open(self.path, "rb") as f:
+            return f.read().decode(self.encoding or "utf-8", errors="replace")
+
+class HttpCache:
+    """
+    Дисковый кэш для условных GET: index.json хранит ETag/Last-Modified и путь к телу.
+    Тело лежит либо в каталоге кэша, либо там, куда его скачали (планы в data/plans).
+    """
+    def __init__(self, root: str = HTTP_CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                self._index: Dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+
+    def default_path(self, url: str) -> str:
+        return os.path.join(self.root, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+    def lookup(self, url: str) -> Optional[dict]:
+        with self._lock:
+            e = self._index.get(url)
+        # запись без тела бесполезна — качаем заново
+        return e if e and os.path.exists(e["path"]) else None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        e = self.lookup(url)
+        if not e:
+            return {}
+        h = {}
+        if e.get("etag"):
+            h["If-None-Match"] = e["etag"]
+        if e.get("last_modified"):
+            h["If-Modified-Since"] = e["last_modified"]
+        return h
+
+    def store(self, url: str, path: str, headers, encoding: Optional[str]) -> None:
+        with self._lock:
+            self._index[url] = {
+                "path": path,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "encoding": encoding,
+            }
+            tmp = self._index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._index, f, ensure_ascii=False)
+            os.replace(tmp, self._index_path)
 
 class ItmoProgramScraper:
-    def __init__(self, repo: Repository):
+    def __init__(self, repo: Repository, cache: Optional[HttpCache] = None,
+                 max_per_host: int = MAX_REQUESTS_PER_HOST, rate_per_host: float = REQUESTS_PER_SECOND_PER_HOST):
         self.repo = repo
+        self.cache = cache or HttpCache()
+        self.max_per_host = max_per_host
+        self.rate_per_host = rate_per_host
+        # общий пул соединений: keep-alive между страницами и планами одного хоста
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, max_per_host * 2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = defaultdict(
+            lambda: threading.BoundedSemaphore(self.max_per_host)
+        )
+        self._slots_lock = threading.Lock()
+        # host -> момент, раньше которого следующий запрос к хосту не отправляем
+        self._next_request: Dict[str, float] = {}
+
+    def _slot(self, url: str) -> threading.BoundedSemaphore:
+        with self._slots_lock:
+            return self._host_slots[urlparse(url).netloc]
+
+    def _throttle(self, url: str) -> None:
+        """Не больше rate_per_host запросов в секунду к одному хосту: каталог программ — десятки страниц."""
+        if self.rate_per_host <= 0:
+            return
+        host = urlparse(url).netloc
+        with self._slots_lock:
+            now = time.monotonic()
+            at = max(now, self._next_request.get(host, 0.0))
+            self._next_request[host] = at + 1.0 / self.rate_per_host
+        if at > now:
+            time.sleep(at - now)
+
+    def _fetch(self, url: str, dest: Optional[str] = None, conditional: bool = True) -> Fetched:
+        """Условный GET с потоковой записью тела на диск кусками DOWNLOAD_CHUNK_SIZE."""
+        dest = dest or self.cache.default_path(url)
+        with self._slot(url):
+            self._throttle(url)
+            headers = self.cache.conditional_headers(url) if conditional else {}
+            with self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True) as r:
+                if r.status_code == 304:
+                    e = self.cache.lookup(url)
+                    if e:
+                        return Fetched(url, e["path"], False, e.get("encoding"))
+                    if not conditional:
+                        raise requests.HTTPError(f"304 без условного запроса: {url}", response=r)
+                else:
+                    r.raise_for_status()
+                    return self._store_body(url, dest, r)
+        # 304, а тела в кэше уже нет (удалили между запросом и ответом): пустой ответ
+        # не сохраняем, а скачиваем страницу заново без If-None-Match/If-Modified-Since
+        return self._fetch(url, dest, conditional=False)
 
-    def _get(self, url: str) -> str:
-        r = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-        r.raise_for_status()
-        return r.text
-
-    def _find_plan_link(self, html: str) -> Optional[str]:
-        soup = BeautifulSoup(html, "html.parser")
-        # Ищем ссылку по тексту или по расширению
-        for a in soup.find_all("a"):
-            text = (a.get_text() or "").strip().lower()
-            href = a.get("href") or ""
-            if "учебный план" in text or "план обучения" in text or re.search(r"\.(pdf|docx?)$", href):
-                if href.startswith("/"):
-                    return f"https://abit.itmo.ru{href}"
-                if href.startswith("http"):
-                    return href
-        return None
-
-    def _extract_faq_text(self, html: str) -> str:
-        soup = BeautifulSoup(html, "html.parser")
-        # Собираем вопросы/ответы FAQ с заголовками уровня h5/h6 и следующими блоками
-        faq_chunks = []
-        for h in soup.find_all(["h5", "h6"]):
-            txt = (h.get_text() or "").strip()
-            if not txt:
-                continue
-            if any(k in txt.lower() for k in ["вопрос", "экзамен", "как", "можно ли", "чем", "будет ли", "уровень", "сможу ли"]):
-                # захват следующего абзаца
-                nxt = h.find_next_sibling()
-                body = (nxt.get_text() if nxt else "") if hasattr(nxt, "get_text") else ""
-                faq_chunks.append(f"{txt}\n{body}")
-        return "\n\n".join(faq_chunks)
-
-    def sync_program(self, code: str, name: str, url: str) -> Program:
-        html = self._get(url)
-        plan_url = self._find_plan_link(html)
-        faq_text = self._extract_faq_text(html)
-        p = Program(code=code, name=name, url=url, plan_url=plan_url, about_html=html, faq_text=faq_text)
-        self.repo.upsert_program(p)
-        return p
+    def _store_body(self, url: str, dest: str, r: requests.Response) -> Fetched:
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = f"{dest}.{threading.get_ident()}.part"
+        with open(tmp, "wb") as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(tmp, dest)
+        # без charset в Content-Type requests подставляет latin-1; страницы ИТМО в utf-8
+        encoding = r.encoding if "charset" in r.headers.get("Content-Type", "") else None
+        self.cache.store(url, dest, r.headers, encoding)
+        return Fetched(url, dest, True, encoding)
+
+    def page_program(self, cfg: ProgramConfig, html: str) -> Tuple[Program, PageDoc]:
+        """Program из скачанной страницы: HTML разбирается один раз."""
+        doc = parse_page(html, cfg.url)
+        return Program(code=cfg.code, name=cfg.name, url=cfg.url, plan_url=doc.plan_url, about_html=html,
+                       faq_text=faq_pairs_to_text(doc.faq_pairs), page_text=doc.text), doc
 
     def download_plan(self, program: Program) -> Optional[str]:
         if not program.plan_url:
             return None
-        os.makedirs(os.path.join(DATA_DIR, "plans"), exist_ok=True)
         ext = os.path.splitext(program.plan_url.split("?")[0])[-1] or ".pdf"
         path = os.path.join(DATA_DIR, "plans", f"{program.code}{ext}")
         try:
-            r = requests.get(program.plan_url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-            r.raise_for_status()
-            with open(path, "wb") as f:
-                f.write(r.content)
-            return path
-        except Exception:
+            return self._fetch(program.plan_url, dest=path).path
+        except Exception as e:
+            # прежний файл плана (если был) остаётся на диске — разбор возьмёт его
+            METRICS.inc("scraper.failed", kind="plan")
+            log.warning("план %s не скачан: %s", program.code, e)
             return None
 
-    def full_sync(self) -> None:
-        for cfg in PROGRAMS:
-            p = self.sync_program(cfg.code, cfg.name, cfg.url)
-            time.sleep(0.5)
-            self.download_plan(p)
\ No newline at end of file
+    def _pool(self, n: int) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=max(1, min(n, self.max_per_host * 4)))
+
+    def fetch_pages(self, programs: Sequence[ProgramConfig] = PROGRAMS) -> Tuple[Dict[str, Fetched], Dict[str, Exception]]:
+        """
+        Страницы программ: (скачанные, ошибки) по кодам. Ошибка одной страницы не
+        прерывает остальные — для неё вызывающий оставляет прежние данные из БД.
+        """
+        pages: Dict[str, Fetched] = {}
+        failed: Dict[str, Exception] = {}
+        with self._pool(len(programs)) as pool:
+            futures = {pool.submit(self._fetch, cfg.url): cfg.code for cfg in programs}
+            for fut in as_completed(futures):
+                code = futures[fut]
+                try:
+                    pages[code] = fut.result()
+                except Exception as e:
+                    failed[code] = e
+                    METRICS.inc("scraper.failed", kind="page")
+                    log.warning("страница %s не скачана: %s", code, e)
+        return pages, failed
+
+    def download_plans(self, programs: Sequence[Program]) -> Dict[str, Optional[str]]:
+        with self._pool(len(programs)) as pool:
+            futures = {pool.submit(self.download_plan, p): p.code for p in programs}
+            return {futures[fut]: fut.result() for fut in as_completed(futures)}
@@ -0,0 +1,74 @@
+# startup.py
+import builtins, sys, time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+# отсчёт «готовности» — с импорта этого модуля, то есть почти с начала app.py
+_STARTED = time.perf_counter()
+
+class StartupProfiler:
+    """
+    Профиль запуска для app.py --profile-startup: время импорта модулей в стиле
+    python -X importtime (собственное и накопленное, мкс) и время шагов инициализации.
+    Импорты считаются через обёртку builtins.__import__, поэтому видны только модули,
+    загруженные после install(); относительные импорты входят во время родителя.
+    """
+    def __init__(self, enabled: bool = True, min_us: int = 5000):
+        self.enabled = enabled
+        self.min_us = min_us  # в отчёт попадают импорты не короче этого (накопленное время)
+        self.imports: List[Tuple[str, int, int, int]] = []  # (модуль, self, cumulative, глубина)
+        self.stages: List[Tuple[str, float]] = []
+        self._stack: List[float] = []
+        self._orig_import = None
+
+    def install(self) -> "StartupProfiler":
+        if self.enabled and self._orig_import is None:
+            self._orig_import = builtins.__import__
+            builtins.__import__ = self._import
+        return self
+
+    def uninstall(self) -> None:
+        if self._orig_import is not None:
+            builtins.__import__ = self._orig_import
+            self._orig_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        orig = self._orig_import
+        if level or name in sys.modules:
+            return orig(name, globals, locals, fromlist, level)
+        depth = len(self._stack)
+        self._stack.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            return orig(name, globals, locals, fromlist, level)
+        finally:
+            dt = time.perf_counter() - t0
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += dt
+            self.imports.append((name, int((dt - children) * 1e6), int(dt * 1e6), depth))
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - t0))
+
+    def report(self, file=None) -> Optional[str]:
+        if not self.enabled:
+            return None
+        self.uninstall()
+        lines = ["import time: self [us] | cumulative | imported package"]
+        for name, self_us, cum_us, depth in self.imports:
+            if cum_us >= self.min_us:
+                lines.append(f"import time: {self_us:>9} | {cum_us:>10} | {'  ' * depth}{name}")
+        lines.append("")
+        lines.append(f"{'шаг':<24} время")
+        for name, dt in self.stages:
+            lines.append(f"{name:<24} {dt * 1000:>8.1f} мс")
+        lines.append(f"{'готов к работе через':<24} {(time.perf_counter() - _STARTED) * 1000:>8.1f} мс")
+        text = "\n".join(lines)
+        print(text, file=file or sys.stderr)
+        return text
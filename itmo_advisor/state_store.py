@@ -0,0 +1,194 @@
+# state_store.py
+import sqlite3, threading, time
+from collections import OrderedDict
+from typing import Dict, Optional
+from config import (DB_PATH, STATE_BACKEND, STATE_DB_PATH, STATE_MAX_USERS, STATE_IDLE_TTL, STATE_FLUSH_INTERVAL)
+from dialog import UserState
+
+class StateStore:
+    """
+    Хранилище состояний пользователей. get() возвращает запись (или новую по умолчанию);
+    изменённую запись нужно сохранить явным put() — бэкенд в БД не видит мутаций на месте.
+    """
+    def get(self, user_id: int) -> UserState:
+        raise NotImplementedError
+
+    def put(self, user_id: int, st: UserState) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+class MemoryStateStore(StateStore):
+    """В памяти процесса: LRU по числу пользователей и вытеснение простаивающих дольше idle_ttl."""
+    def __init__(self, max_users: int = STATE_MAX_USERS, idle_ttl: Optional[float] = STATE_IDLE_TTL,
+                 clock=time.monotonic):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._data: "OrderedDict[int, tuple]" = OrderedDict()  # uid -> (last_seen, state)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _evict(self, now: float) -> None:
+        # порядок OrderedDict — по последнему обращению, поэтому простаивающие всегда в начале
+        if self.idle_ttl:
+            while self._data:
+                uid, (seen, _) = next(iter(self._data.items()))
+                if now - seen <= self.idle_ttl:
+                    break
+                del self._data[uid]
+                self.evictions += 1
+        while len(self._data) > self.max_users:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, user_id: int) -> UserState:
+        now = self._clock()
+        with self._lock:
+            self._evict(now)
+            item = self._data.get(user_id)
+            if item is None:
+                return UserState()
+            self._data[user_id] = (now, item[1])
+            self._data.move_to_end(user_id)
+            return item[1]
+
+    def put(self, user_id: int, st: UserState) -> None:
+        now = self._clock()
+        with self._lock:
+            self._data[user_id] = (now, st)
+            self._data.move_to_end(user_id)
+            self._evict(now)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SqliteStateStore(StateStore):
+    """
+    Состояния в таблице user_state отдельной SQLite-БД (WAL, несколько процессов).
+    Запись отложенная: put() кладёт состояние в буфер, фоновый поток раз в flush_interval
+    пишет весь буфер одной транзакцией. Чтение сначала смотрит в буфер, потом в БД,
+    так что процесс видит свои записи сразу, а чужие — с задержкой не больше flush_interval.
+    get() вызывается из цикла событий бота, поэтому он не ждёт записи: пока flush держит
+    транзакцию (или ждёт блокировку БД), его пачка видна из памяти, а чтение идёт через
+    отдельное соединение — в WAL читатели не блокируются писателем.
+    """
+    def __init__(self, path: str = STATE_DB_PATH, flush_interval: float = STATE_FLUSH_INTERVAL,
+                 max_pending: int = 1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS user_state(
+                 user_id INTEGER PRIMARY KEY,
+                 program_code TEXT,
+                 background_key TEXT,
+                 stage TEXT NOT NULL,
+                 updated_at REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+        # число записей в БД на момент последнего flush: __len__ (/stats) не ходит в БД
+        self._count = self._conn.execute("SELECT COUNT(*) FROM user_state").fetchone()[0]
+        self._reader = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()        # только буферы в памяти, без обращений к БД
+        self._write_lock = threading.Lock()  # один flush за раз
+        self._read_lock = threading.Lock()
+        self._pending: Dict[int, UserState] = {}
+        self._writing: Dict[int, UserState] = {}  # пачка, которую сейчас пишет flush
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="state-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # пачка вернулась в буфер — попробуем в следующий раз
+
+    def get(self, user_id: int) -> UserState:
+        with self._lock:
+            st = self._pending.get(user_id)
+            if st is None:
+                st = self._writing.get(user_id)
+        if st is not None:
+            return st
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT program_code,background_key,stage FROM user_state WHERE user_id=?", (user_id,)
+            ).fetchone()
+        return UserState(*row) if row else UserState()
+
+    def put(self, user_id: int, st: UserState) -> None:
+        with self._lock:
+            self._pending[user_id] = st
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._write_lock:
+            # буфер забираем под _lock, а пишем без него: get() и put() не ждут БД
+            with self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                self._writing = batch
+            count = None
+            try:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        """INSERT INTO user_state(user_id,program_code,background_key,stage,updated_at)
+                           VALUES(?,?,?,?,?)
+                           ON CONFLICT(user_id) DO UPDATE SET program_code=excluded.program_code,
+                             background_key=excluded.background_key, stage=excluded.stage,
+                             updated_at=excluded.updated_at""",
+                        [(uid, st.program_code, st.background_key, st.stage, now) for uid, st in batch.items()],
+                    )
+                count = self._conn.execute("SELECT COUNT(*) FROM user_state").fetchone()[0]
+            except sqlite3.Error:
+                # не записали — возвращаем в буфер, не затирая более свежие put()
+                with self._lock:
+                    self._pending = {**batch, **self._pending}
+                raise
+            finally:
+                # счётчик и пачку меняем вместе, чтобы __len__ не посчитал её дважды
+                with self._lock:
+                    self._writing = {}
+                    if count is not None:
+                        self._count = count
+
+    def close(self) -> None:
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
+        self._reader.close()
+
+    def __len__(self) -> int:
+        # без flush и запросов: /stats вызывает это из цикла событий. Оценка сверху —
+        # пользователи из буфера могли уже быть в БД; точное число после следующего flush
+        with self._lock:
+            return self._count + len(self._pending.keys() | self._writing.keys())
+
+def state_db_path(db_path: str) -> str:
+    """БД состояний для каталога db_path: STATE_DB_PATH для основной БД, иначе файл рядом с ней."""
+    return STATE_DB_PATH if db_path == DB_PATH else db_path + ".state"
+
+def build_state_store(backend: str = STATE_BACKEND, path: str = STATE_DB_PATH) -> StateStore:
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SqliteStateStore(path)
+    raise ValueError(f"Неизвестный STATE_BACKEND: {backend}")
@@ -0,0 +1,179 @@
+# sync.py
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+from analytics import CurriculumAnalytics
+from config import PROGRAMS, ProgramConfig
+from domain import Program
+from metrics import METRICS
+from repository import Repository
+from retriever import Retriever
+from utils import file_hash, text_hash
+
+ProgressFn = Callable[[str], None]
+
+# ключ в sync_hashes для хэшей уровня всего корпуса
+ALL_PROGRAMS = "*"
+
+@dataclass
+class StageRun:
+    stage: str
+    program: str
+    ran: bool
+    seconds: float = 0.0
+
+@dataclass
+class SyncResult:
+    # None — входы индекса не изменились, живой ретривер можно не трогать
+    retriever: Optional[Retriever] = None
+    runs: List[StageRun] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)  # программы, чьи страницы не скачались
+
+    @contextmanager
+    def stage(self, stage: str, program: str = ALL_PROGRAMS):
+        t0 = time.perf_counter()
+        yield
+        dt = time.perf_counter() - t0
+        self.runs.append(StageRun(stage, program, True, dt))
+        METRICS.observe("sync.stage", dt, stage=stage)
+
+    def skip(self, stage: str, program: str = ALL_PROGRAMS) -> None:
+        self.runs.append(StageRun(stage, program, False))
+        METRICS.inc("sync.skipped", stage=stage)
+
+    @property
+    def total(self) -> float:
+        return sum(r.seconds for r in self.runs)
+
+    def summary(self) -> str:
+        ran = sum(1 for r in self.runs if r.ran)
+        failed = f", не скачано: {', '.join(self.failed)}" if self.failed else ""
+        return f"{self.total:.1f} с (этапов выполнено: {ran}, пропущено: {len(self.runs) - ran}{failed})"
+
+    def format(self) -> str:
+        lines = [f"{'этап':<10} {'программа':<14} {'статус':<10} время"]
+        for r in self.runs:
+            status, t = ("выполнен", f"{r.seconds:.2f} с") if r.ran else ("пропущен", "—")
+            lines.append(f"{r.stage:<10} {r.program:<14} {status:<10} {t}")
+        lines.append(f"итого: {self.summary()}")
+        return "\n".join(lines)
+
+class SyncPipeline:
+    """
+    Инкрементальная синхронизация. Каждый этап пропускается, если хэш его входа
+    совпадает с сохранённым в sync_hashes:
+      faq     <- html страницы
+      разбор  <- файл плана (или html, если плана нет)
+      курсы   <- извлечённый текст плана
+      аналитика <- агрегаты программ, чьи курсы переписаны (replace_courses сбрасывает их)
+      индекс  <- хэши html и текстов всех программ; внутри индекса пересобираются
+                 только сегменты программ, чьи FAQ или курсы изменились
+    Живой ретривер не трогаем: свежий собирается рядом (base.fork()) и возвращается вызывающему.
+    """
+    def __init__(self, repo: Repository):
+        self.repo = repo
+
+    def run(self, progress: Optional[ProgressFn] = None,
+            programs: Sequence[ProgramConfig] = PROGRAMS, force: bool = False,
+            base: Optional[Retriever] = None) -> SyncResult:
+        from scraper import ItmoProgramScraper
+        from curriculum_parser import CurriculumParser
+        report = progress or (lambda msg: None)
+        res = SyncResult()
+        scraper = ItmoProgramScraper(self.repo)
+
+        report("Скачиваю страницы программ…")
+        with res.stage("страницы"):
+            pages, failed = scraper.fetch_pages(programs)
+        if failed:
+            # одна недоступная страница не срывает синхронизацию: у этих программ — прежние данные
+            report(f"Не удалось скачать страницы ({', '.join(sorted(failed))}): оставляю прежние данные.")
+            res.failed.extend(sorted(failed))
+
+        current: List[Program] = []
+        for cfg in programs:
+            if cfg.code in failed:
+                prev = self.repo.get_program(cfg.code)
+                res.skip("faq", cfg.code)
+                if prev:
+                    current.append(prev)
+                continue
+            html = pages[cfg.code].text()
+            h = text_hash(html)
+            prev = self.repo.get_program(cfg.code)
+            if not force and prev and self.repo.get_sync_hash(cfg.code, "html") == h:
+                res.skip("faq", cfg.code)
+                current.append(prev)
+                continue
+            with res.stage("faq", cfg.code):
+                p, doc = scraper.page_program(cfg, html)
+                self.repo.upsert_program(p)
+                self.repo.replace_faqs(cfg.code, doc.faq_pairs)
+                self.repo.set_sync_hash(cfg.code, "html", h)
+            current.append(p)
+
+        report("Скачиваю учебные планы…")
+        with res.stage("планы"):
+            scraper.download_plans(current)
+
+        report("Разбираю учебные планы…")
+        parser = CurriculumParser(self.repo)
+        todo, plan_hashes = [], {}
+        for p in current:
+            plan = parser.find_plan_file(p.code)
+            if plan:
+                # файл плана хэшируется один раз: тот же хэш — ключ кэша текста в парсере
+                plan_hashes[p.code] = file_hash(plan)
+            plan_key = (f"plan:{plan_hashes[p.code]}" if plan
+                        else f"html:{self.repo.get_sync_hash(p.code, 'html')}")
+            if not force and self.repo.get_sync_hash(p.code, "plan") == plan_key:
+                res.skip("разбор", p.code)
+                res.skip("курсы", p.code)
+            else:
+                todo.append((p.code, plan_key))
+        if todo:
+            # извлечение текста всех изменившихся планов — одним пулом процессов
+            with res.stage("разбор"):
+                parser.extract_plans((code for code, _ in todo), plan_hashes)
+        for code, plan_key in todo:
+            th = parser.text_fingerprint(code)
+            if not force and self.repo.get_sync_hash(code, "text") == th:
+                res.skip("курсы", code)
+            else:
+                with res.stage("курсы", code):
+                    self.repo.replace_courses(code, parser.parse_text(code, parser.iter_text(code)))
+                    self.repo.set_sync_hash(code, "text", th)
+            self.repo.set_sync_hash(code, "plan", plan_key)
+
+        analytics = CurriculumAnalytics(self.repo)
+        if force or analytics.stale():
+            report("Считаю сводки по учебным планам…")
+            with res.stage("аналитика"):
+                analytics.refresh(force=force)
+        else:
+            res.skip("аналитика")
+
+        index_key = text_hash("|".join(
+            f"{p.code}:{self.repo.get_sync_hash(p.code, 'html')}:{self.repo.get_sync_hash(p.code, 'text')}"
+            for p in current
+        ))
+        if not force and self.repo.get_sync_hash(ALL_PROGRAMS, "index") == index_key:
+            res.skip("индекс")
+            return res
+        report("Строю поисковый индекс…")
+        with res.stage("индекс"):
+            # base — живой индекс: его неизменившиеся сегменты переиспользуются как есть
+            ret = base.fork() if base is not None else Retriever(self.repo)
+            if force:
+                ret.build()
+            else:
+                hashes = self.repo.index_hashes()
+                if base is None:
+                    ret.load(hashes=hashes)
+                rebuilt = ret.refresh(hashes)
+                report(f"Пересобраны сегменты индекса: {len(rebuilt)} из {len(ret.codes)}.")
+            ret.save()
+            self.repo.set_sync_hash(ALL_PROGRAMS, "index", index_key)
+        res.retriever = ret
+        return res
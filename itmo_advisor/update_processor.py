@@ -0,0 +1,72 @@
+# update_processor.py
+import asyncio
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from metrics import METRICS
+
+BUSY_TEXT = "Сейчас много вопросов, я не успеваю отвечать. Попробуйте, пожалуйста, через минуту."
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка апдейтов для Application.concurrent_updates: разные чаты
+    обрабатываются одновременно (до concurrency), апдейты одного чата —
+    строго по порядку (FIFO-замок на чат берётся до семафора обработки, чтобы ожидающие
+    своей очереди апдейты не занимали слоты).
+    Контроль допуска: если в обработке и очереди уже max_pending апдейтов или у чата
+    скопилось max_pending_per_chat, апдейт не обрабатывается, а пользователю уходит
+    вежливый ответ «занят».
+    Всё это — в do_process_update (точка расширения PTB). Семафор базового класса
+    (process_update) ограничивает только число принятых задач: он на единицу больше
+    max_pending, так что лишний апдейт доходит до проверки допуска и сразу получает «занят».
+    """
+    def __init__(self, max_concurrent_updates: int, max_pending: int, max_pending_per_chat: int):
+        super().__init__(max_pending + 1)
+        self.concurrency = max_concurrent_updates
+        self.max_pending = max_pending
+        self.max_pending_per_chat = max_pending_per_chat
+        self.pending = 0
+        self.shed = 0
+        self.outbox = None  # Outbox бота; без него «занят» отправляется напрямую
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chats: Dict[Optional[int], list] = {}  # chat_id -> [asyncio.Lock, апдейтов в очереди]
+
+    async def do_process_update(self, update: object, coroutine: "Awaitable[Any]") -> None:
+        chat_id = update.effective_chat.id if isinstance(update, Update) and update.effective_chat else None
+        slot = self._chats.get(chat_id)
+        if self.pending >= self.max_pending or (slot and slot[1] >= self.max_pending_per_chat):
+            coroutine.close()  # обработчик не запускаем
+            await self._reject(update)
+            return
+        # счётчики меняются до первого await: порядок задач = порядок апдейтов
+        if slot is None:
+            slot = self._chats[chat_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        self.pending += 1
+        try:
+            async with slot[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            self.pending -= 1
+            slot[1] -= 1
+            if slot[1] == 0:
+                self._chats.pop(chat_id, None)
+
+    async def _reject(self, update: object) -> None:
+        self.shed += 1
+        METRICS.inc("bot.shed")
+        message = update.effective_message if isinstance(update, Update) else None
+        if message is not None and self.outbox is not None:
+            self.outbox.send(message.chat_id, BUSY_TEXT)
+        elif message is not None:
+            try:
+                await message.reply_text(BUSY_TEXT)
+            except Exception:
+                pass  # перегрузка — не повод ронять обработку остальных
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
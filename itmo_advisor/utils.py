@@ -1,5 +1,5 @@
 # utils.py
-import argparse, os
+import argparse, hashlib, os
 from dotenv import load_dotenv
 from repository import Repository
 
@@ -7,4 +7,14 @@ def build_repo() -> Repository:
     return Repository()
 
 def load_env():
-    load_dotenv()
\ No newline at end of file
+    load_dotenv()
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()